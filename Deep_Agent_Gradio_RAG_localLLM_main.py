@@ -5,6 +5,7 @@ Deep Agent RAG System - 主程序
 使用方式：
     python Deep_Agent_Gradio_RAG_localLLM_main.py
 """
+import logging
 import warnings
 import gradio as gr
 
@@ -14,6 +15,9 @@ warnings.filterwarnings("ignore", category=DeprecationWarning, module="httplib2"
 warnings.filterwarnings("ignore", category=DeprecationWarning, module="websockets")
 warnings.filterwarnings("ignore", category=DeprecationWarning, module="uvicorn.protocols.websockets")
 
+# 工具模組使用 logging 記錄錯誤；只輸出 WARNING 以上，未啟用的等級不會進行格式化
+logging.basicConfig(level=logging.WARNING)
+
 # 導入模組化組件
 from deep_agent_rag.rag import init_rag_system
 from deep_agent_rag.graph import build_agent_graph
@@ -3,7 +3,9 @@ Calendar Agent
 行事曆事件生成和管理代理
 """
 import re
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from typing import Callable, Optional
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
@@ -31,6 +33,19 @@ from .calendar_validation import (
 from ..tools.calendar_tool import validate_and_clean_emails
 
 
+# 反思記憶最多保留的已解決問題數量，以及每條的最大長度（避免提示無限增長）
+_REFLECTION_MEMORY_LIMIT = 5
+_REFLECTION_MEMORY_ITEM_CHARS = 300
+
+
+def _remember_resolved_issue(reflection_memory: list[str], improvement_suggestions: str) -> None:
+    """將已採納的改進建議加入反思記憶，只保留最近的 _REFLECTION_MEMORY_LIMIT 條"""
+    issue = " ".join(improvement_suggestions.split())[:_REFLECTION_MEMORY_ITEM_CHARS]
+    if issue and issue not in reflection_memory:
+        reflection_memory.append(issue)
+        del reflection_memory[:-_REFLECTION_MEMORY_LIMIT]
+
+
 def _get_create_calendar_event_tool():
     """優先使用 MCP 工具，失敗則用本地 calendar_tool。"""
     from ..tools.calendar_mcp_client import get_create_calendar_event_tool as get_mcp
@@ -52,8 +67,10 @@ def _get_delete_calendar_event_tool():
 
 def generate_calendar_draft(
     prompt: str,
-    enable_reflection: bool = True
-) -> tuple[dict, str, dict, str, bool]:
+    enable_reflection: bool = True,
+    on_progress: Optional[Callable[[dict, int], None]] = None,
+    reflection_memory: Optional[list[str]] = None
+) -> tuple[dict, str, dict, str, bool, int]:
     """
     根據用戶提示生成行事曆事件草稿（不創建），並進行迭代反思評估
     從單一 prompt 中提取所有資訊：事件、日期、時間、地點、參與者
@@ -61,13 +78,18 @@ def generate_calendar_draft(
     Args:
         prompt: 完整的用戶提示（例如："明天下午2點團隊會議，討論項目進度，地點在會議室A，參與者包括john@example.com和mary@example.com"）
         enable_reflection: 是否啟用反思功能（默認 True）
+        on_progress: 進度回呼（可選），啟用反思時在初稿生成後（輪數 0）及每輪產生改進版本後呼叫，
+            參數為 (事件字典副本, 輪數)，讓 UI 在反思完成前先顯示中間結果
+        reflection_memory: 同一個對話中已採納的改進建議（可選），反思時告知 LLM 不要重複提出；
+            本次採納的改進建議會就地加入此列表（最多保留 _REFLECTION_MEMORY_LIMIT 條）
     
     Returns:
-        (event_dict, status_message, missing_info, reflection_result, was_improved) 元組
+        (event_dict, status_message, missing_info, reflection_result, was_improved, reflection_count) 元組
         event_dict 包含: summary, start_datetime, end_datetime, description, location, attendees
         missing_info 包含缺失的資訊標記，用於 UI 顯示下拉選單
         reflection_result: 反思結果（如果啟用反思）
         was_improved: 是否經過改進（如果啟用反思）
+        reflection_count: reflection_result 中包含的反思輪數（UI 不必再掃描字串計算）
     """
     try:
         # 檢測用戶輸入的語言
@@ -89,6 +111,8 @@ def generate_calendar_draft(
         current_weekday_en = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'][current_datetime.weekday()]
         
         # 根據語言選擇對應的 prompt 模板
+        # 模板中不變的部分（角色說明、當天日期、指南）放在用戶提示之前：Groq 和 Ollama 會自動重用相同的提示前綴，
+        # 同一天內的請求只需處理用戶提示之後的部分；修改模板時請保持這個順序（反思和改進模板也是如此）
         if user_language == 'zh':
             # 中文 prompt 模板 - 整合指南並要求直接輸出 ISO 8601 格式
             calendar_prompt_template = (
@@ -214,6 +238,21 @@ def generate_calendar_draft(
                 "attendees": ""
             }
         
+        # 參與者驗證不依賴日期時間和地點，在另一個執行緒同時進行；
+        # 地點驗證（LLM 標準化 + Google Maps）需要開始時間計算交通時間，仍在日期時間之後執行
+        attendees_executor = ThreadPoolExecutor(max_workers=1)
+        # 【二輪修正機制】驗證並修正 LLM 輸出的參與者郵箱
+        # 優先使用 LLM 根據指南提取和驗證，而非直接使用 Python 正則
+        attendees_future = attendees_executor.submit(
+            validate_and_correct_attendees,
+            llm_output=event_data,
+            prompt=prompt,
+            user_language=user_language,
+            max_retries=2,
+            validate_and_clean_emails_fallback=validate_and_clean_emails
+        )
+        attendees_executor.shutdown(wait=False)
+        
         # 【二輪修正機制】驗證並修正 LLM 輸出的日期時間
         # 優先使用 LLM 直接輸出的 ISO 8601 格式，如果無效則請求 LLM 修正（而非直接 fallback 到 Python）
         start_datetime, end_datetime, date_str, time_str = validate_and_correct_datetime(
@@ -250,15 +289,7 @@ def generate_calendar_draft(
             event_datetime=event_dt
         )
         
-        # 【二輪修正機制】驗證並修正 LLM 輸出的參與者郵箱
-        # 優先使用 LLM 根據指南提取和驗證，而非直接使用 Python 正則
-        attendees = validate_and_correct_attendees(
-            llm_output=event_data,
-            prompt=prompt,
-            user_language=user_language,
-            max_retries=2,
-            validate_and_clean_emails_fallback=validate_and_clean_emails
-        )
+        attendees = attendees_future.result()
         
         # 構建事件字典
         event_dict = {
@@ -277,10 +308,14 @@ def generate_calendar_draft(
         
         # 【迭代反思功能】不斷反思直到滿意為止
         reflection_result = ""
+        reflection_count = 0
         was_improved = False
         all_reflections = []  # 記錄所有反思結果
         
         if enable_reflection:
+            if on_progress:
+                on_progress(event_dict.copy(), 0)
+            
             try:
                 current_event_dict = event_dict.copy()
                 current_iteration = 0
@@ -290,7 +325,7 @@ def generate_calendar_draft(
                     try:
                         print(f"   🔍 [CalendarReflection] 第 {current_iteration + 1} 輪反思評估...")
                         reflection_text, improvement_suggestions, needs_revision = reflect_on_calendar_event(
-                            prompt, current_event_dict
+                            prompt, current_event_dict, reflection_memory
                         )
                         
                         # 記錄本輪反思結果
@@ -314,12 +349,16 @@ def generate_calendar_draft(
                                 improved_event_dict = generate_improved_calendar_event(
                                     prompt, current_event_dict, improvement_suggestions
                                 )
+                                if on_progress:
+                                    on_progress(improved_event_dict.copy(), current_iteration + 1)
+                                if reflection_memory is not None:
+                                    _remember_resolved_issue(reflection_memory, improvement_suggestions)
                                 
                                 # 對改進後的版本再次進行反思評估
                                 if current_iteration < MAX_REFLECTION_ITERATION - 1:  # 如果不是最後一輪
                                     print(f"   🔍 [CalendarReflection] 評估改進後的版本...")
                                     next_reflection_text, next_suggestions, next_needs_revision = reflect_on_calendar_event(
-                                        prompt, improved_event_dict
+                                        prompt, improved_event_dict, reflection_memory
                                     )
                                     
                                     # 檢查改進後的版本是否滿意
@@ -387,6 +426,7 @@ def generate_calendar_draft(
                             reflection_parts.append(f"\n【改進建議】\n{r['suggestions']}")
                     
                     reflection_result = "\n\n".join(reflection_parts)
+                    reflection_count = len(all_reflections)
                 else:
                     reflection_result = "反思過程未產生結果"
                 
@@ -434,14 +474,14 @@ def generate_calendar_draft(
             else:
                 status_message = "✅ 行事曆事件草稿已生成，請檢查並修改後再創建"
         
-        return event_dict, status_message, missing_info, reflection_result, was_improved
+        return event_dict, status_message, missing_info, reflection_result, was_improved, reflection_count
         
     except Exception as e:
         error_msg = f"❌ 生成行事曆事件草稿時發生錯誤：{str(e)}"
         print(f"Calendar Agent 錯誤：{e}")
         import traceback
         traceback.print_exc()
-        return {}, error_msg, {}, "", False
+        return {}, error_msg, {}, "", False, 0
 
 
 def create_calendar_draft(event_dict: dict) -> str:
@@ -2,6 +2,8 @@
 Calendar Reflection Agent
 行事曆事件反思代理：評估生成的事件質量並提供改進建議
 """
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from ..utils.llm_utils import get_llm, handle_groq_error
@@ -23,7 +25,8 @@ from ..tools.googlemaps_tool import enrich_location_info
 
 def reflect_on_calendar_event(
     prompt: str,
-    event_dict: dict
+    event_dict: dict,
+    resolved_issues: Optional[list[str]] = None
 ) -> tuple[str, str, bool]:
     """
     反思行事曆事件質量，評估是否需要改進
@@ -31,6 +34,7 @@ def reflect_on_calendar_event(
     Args:
         prompt: 用戶的原始提示
         event_dict: 生成的事件字典，包含 summary, start_datetime, end_datetime, description, location, attendees
+        resolved_issues: 同一個對話中先前已採納並解決的改進建議（可選），會附在提示中避免重複提出相同問題
     
     Returns:
         (reflection_result, improvement_suggestions, needs_revision)
@@ -56,11 +60,21 @@ def reflect_on_calendar_event(
         location = event_dict.get("location", "")
         attendees = event_dict.get("attendees", "")
         
+        # 先前已解決的問題（放在指南之後、用戶提示之前，不影響不變的提示前綴）
+        resolved_issues_section = ""
+        if resolved_issues:
+            issues_text = "\n".join(f"- {issue}" for issue in resolved_issues)
+            if user_language == 'zh':
+                resolved_issues_section = f"【先前已處理的問題】（已在之前的草稿中解決，請勿重複提出）\n{issues_text}\n\n"
+            else:
+                resolved_issues_section = f"【Previously Resolved Issues】(already addressed in earlier drafts, do not raise them again)\n{issues_text}\n\n"
+        
         if user_language == 'zh':
             # 中文反思提示模板（整合指南）
             reflection_prompt_template = (
                 "你是一位專業的行事曆事件質量評估專家。請仔細評估以下生成的行事曆事件，並提供詳細的反思和改進建議。\n\n"
                 "【事件反思評估指南】\n{event_reflection_guideline}\n\n"
+                "{resolved_issues_section}"
                 "【用戶原始提示】\n{prompt}\n\n"
                 "【生成的事件資訊】\n"
                 "事件標題：{summary}\n"
@@ -83,6 +97,7 @@ def reflect_on_calendar_event(
             reflection_prompt_template = (
                 "You are a professional calendar event quality assessment expert. Please carefully evaluate the following generated calendar event and provide detailed reflection and improvement suggestions.\n\n"
                 "【Event Reflection Assessment Guidelines】\n{event_reflection_guideline}\n\n"
+                "{resolved_issues_section}"
                 "【User's Original Prompt】\n{prompt}\n\n"
                 "【Generated Event Information】\n"
                 "Event Title: {summary}\n"
@@ -114,7 +129,8 @@ def reflect_on_calendar_event(
                 "description": description,
                 "location": location,
                 "attendees": attendees,
-                "event_reflection_guideline": event_reflection_guideline
+                "event_reflection_guideline": event_reflection_guideline,
+                "resolved_issues_section": resolved_issues_section
             })
         except Exception as e:
             # 處理 Groq API 錯誤
@@ -130,7 +146,8 @@ def reflect_on_calendar_event(
                     "description": description,
                     "location": location,
                     "attendees": attendees,
-                    "event_reflection_guideline": event_reflection_guideline
+                    "event_reflection_guideline": event_reflection_guideline,
+                    "resolved_issues_section": resolved_issues_section
                 })
             else:
                 raise
@@ -320,6 +337,22 @@ def generate_improved_calendar_event(
             print("   ⚠️ [CalendarReflection] JSON 解析失敗，使用原始事件")
             return original_event_dict
         
+        # 【二輪修正機制】驗證並修正改進版本的參與者郵箱
+        # 參與者驗證不依賴日期時間和地點，在另一個執行緒與它們同時進行
+        merged_data_for_attendees = {
+            "attendees": improved_data.get("attendees", "").strip() or original_event_dict.get("attendees", "")
+        }
+        attendees_executor = ThreadPoolExecutor(max_workers=1)
+        attendees_future = attendees_executor.submit(
+            validate_and_correct_attendees,
+            llm_output=merged_data_for_attendees,
+            prompt=prompt,
+            user_language=user_language,
+            max_retries=2,
+            validate_and_clean_emails_fallback=validate_and_clean_emails
+        )
+        attendees_executor.shutdown(wait=False)
+        
         # 【二輪修正機制】驗證並修正改進版本的日期時間
         # 獲取當前日期時間作為上下文
         from datetime import datetime
@@ -343,18 +376,6 @@ def generate_improved_calendar_event(
             parse_datetime_fallback=parse_datetime
         )
         
-        # 【二輪修正機制】驗證並修正改進版本的參與者郵箱
-        merged_data_for_attendees = {
-            "attendees": improved_data.get("attendees", "").strip() or original_event_dict.get("attendees", "")
-        }
-        attendees = validate_and_correct_attendees(
-            llm_output=merged_data_for_attendees,
-            prompt=prompt,
-            user_language=user_language,
-            max_retries=2,
-            validate_and_clean_emails_fallback=validate_and_clean_emails
-        )
-        
         # 【二輪修正機制】驗證並修正改進版本的地點
         merged_data_for_location = {
             "location": improved_data.get("location", "").strip() or original_event_dict.get("location", "")
@@ -375,6 +396,8 @@ def generate_improved_calendar_event(
             event_datetime=event_dt
         )
         
+        attendees = attendees_future.result()
+        
         # 構建改進後的事件字典
         improved_event_dict = {
             "summary": improved_data.get("summary", original_summary),
@@ -3,6 +3,7 @@ Email Agent
 簡單的郵件生成和發送代理（包含反思功能）
 """
 import re
+from typing import Callable, Optional
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
@@ -34,8 +35,9 @@ def detect_language(text: str) -> str:
 def generate_email_draft(
     prompt: str, 
     recipient: str, 
-    enable_reflection: bool = True
-) -> tuple[str, str, str, str, bool]:
+    enable_reflection: bool = True,
+    on_progress: Optional[Callable[[str, str, int], None]] = None
+) -> tuple[str, str, str, str, bool, int]:
     """
     根據用戶提示生成郵件草稿（不發送），並進行反思評估
     
@@ -43,14 +45,17 @@ def generate_email_draft(
         prompt: 用戶的關鍵提示（例如："寫一封感謝信"）
         recipient: 收件人郵箱地址
         enable_reflection: 是否啟用反思功能（默認 True）
+        on_progress: 進度回呼（可選），啟用反思時在初稿生成後（輪數 0）及每輪產生改進版本後呼叫，
+            參數為 (主題, 正文, 輪數)，讓 UI 在反思完成前先顯示中間結果
     
     Returns:
-        (subject, body, status_message, reflection_result, needs_revision) 元組
+        (subject, body, status_message, reflection_result, needs_revision, reflection_count) 元組
         - subject: 郵件主題
         - body: 郵件正文
         - status_message: 狀態消息
         - reflection_result: 反思結果（如果啟用反思）
         - needs_revision: 是否需要改進（如果啟用反思）
+        - reflection_count: reflection_result 中包含的反思輪數（UI 不必再掃描字串計算）
     """
     try:
         # 檢測用戶輸入的語言
@@ -150,10 +155,14 @@ def generate_email_draft(
         
         # 【迭代反思功能】不斷反思直到滿意為止
         reflection_result = ""
+        reflection_count = 0
         was_improved = False
         all_reflections = []  # 記錄所有反思結果
         
         if enable_reflection:
+            if on_progress:
+                on_progress(email_subject, email_body, 0)
+            
             try:
                 current_subject = email_subject
                 current_body = email_body
@@ -188,6 +197,8 @@ def generate_email_draft(
                                 improved_subject, improved_body = generate_improved_email(
                                     prompt, recipient, current_subject, current_body, improvement_suggestions
                                 )
+                                if on_progress:
+                                    on_progress(improved_subject, improved_body, current_iteration + 1)
                                 
                                 # 對改進後的版本再次進行反思評估
                                 if current_iteration < MAX_REFLECTION_ITERATION - 1:  # 如果不是最後一輪
@@ -258,6 +269,7 @@ def generate_email_draft(
                             reflection_parts.append(f"\n【改進建議】\n{r['suggestions']}")
                     
                     reflection_result = "\n\n".join(reflection_parts)
+                    reflection_count = len(all_reflections)
                 else:
                     reflection_result = "反思過程未產生結果"
                 
@@ -275,22 +287,27 @@ def generate_email_draft(
         else:
             status_message = "✅ 郵件草稿已生成，請檢查並修改後再發送"
         
-        return email_subject, email_body, status_message, reflection_result, was_improved
+        return email_subject, email_body, status_message, reflection_result, was_improved, reflection_count
         
     except Exception as e:
         error_msg = f"❌ 生成郵件草稿時發生錯誤：{str(e)}"
         print(f"Email Agent 錯誤：{e}")
         import traceback
         traceback.print_exc()
-        return "", "", error_msg, "", False
+        return "", "", error_msg, "", False, 0
 
 
-def send_email_draft(recipient: str, subject: str, body: str, sender: str = None) -> str:
+def send_email_draft(recipient: str | list[str], subject: str, body: str, sender: str = None) -> str:
     """
     發送已編輯的郵件草稿（支援多個收件人，用逗號分隔）
     
+    所有收件人放在同一封郵件的 To 標頭中，只呼叫一次 Gmail API；
+    每個發件人的憑證由 tools._google_auth 依 token 文件快取，Gmail 服務對象則每個執行緒各自快取一份，
+    重複發送不會重新讀取 token，同一執行緒也不會重新 build 服務
+    
     Args:
-        recipient: 收件人郵箱地址（可以是單個或多個用逗號分隔的郵箱，例如："user1@example.com, user2@example.com"）
+        recipient: 收件人郵箱地址（可以是單個或多個用逗號分隔的郵箱，例如："user1@example.com, user2@example.com"），
+            也可以是已解析的收件人列表
         subject: 郵件主題
         body: 郵件正文內容
         sender: 發件人郵箱地址（可選，必須是 Gmail），如果不提供則使用預設發件人
@@ -299,6 +316,9 @@ def send_email_draft(recipient: str, subject: str, body: str, sender: str = None
         發送結果消息
     """
     try:
+        if isinstance(recipient, list):
+            recipient = ", ".join(recipient)
+        
         # 基本郵箱格式驗證（詳細驗證由 send_email 工具處理）
         if not recipient or not recipient.strip():
             return "❌ 錯誤：請輸入收件人郵箱地址"
@@ -55,12 +55,11 @@ def reflect_on_email(
         
         if user_language == 'zh':
             # 中文反思提示模板
+            # 固定的評估標準和輸出格式放在前面、每次不同的郵件內容放在後面，
+            # 所有郵件和每輪反思共用相同的提示前綴，Groq 和 Ollama 可重用已處理的前綴；
+            # 結尾再重申一次輸出格式（解析依賴這三個標題，本地小模型較容易遵守緊接在最後的格式指示）
             reflection_prompt_template = (
-                "你是一位專業的郵件質量評估專家。請仔細評估以下生成的郵件，並提供詳細的反思和改進建議。\n\n"
-                "【用戶原始提示】\n{prompt}\n\n"
-                "【收件人】\n{recipient}\n\n"
-                "【生成的郵件主題】\n{subject}\n\n"
-                "【生成的郵件正文】\n{body}\n\n"
+                "你是一位專業的郵件質量評估專家。請仔細評估文末提供的生成郵件，並提供詳細的反思和改進建議。\n\n"
                 "請從以下幾個方面進行評估：\n"
                 "1. **內容完整性**：郵件是否完整回應了用戶的提示？是否遺漏重要信息？\n"
                 "2. **專業性**：語氣是否專業、禮貌？是否符合商務郵件的標準？\n"
@@ -73,16 +72,18 @@ def reflect_on_email(
                 "【改進建議】\n"
                 "(如果有需要改進的地方，請提供具體的改進建議；如果郵件質量很好，請說明為什麼)\n\n"
                 "【是否需要重新生成】\n"
-                "(回答：是/否，並簡要說明原因。只有在郵件有嚴重問題（如遺漏關鍵信息、語氣不當、內容不符合要求）時才回答「是」)"
+                "(回答：是/否，並簡要說明原因。只有在郵件有嚴重問題（如遺漏關鍵信息、語氣不當、內容不符合要求）時才回答「是」)\n\n"
+                "【用戶原始提示】\n{prompt}\n\n"
+                "【收件人】\n{recipient}\n\n"
+                "【生成的郵件主題】\n{subject}\n\n"
+                "【生成的郵件正文】\n{body}\n\n"
+                "請依照上述格式輸出，依序使用【反思評估】、【改進建議】、【是否需要重新生成】三個標題，"
+                "並在【是否需要重新生成】中回答「是」或「否」。"
             )
         else:
             # 英文反思提示模板
             reflection_prompt_template = (
-                "You are a professional email quality assessment expert. Please carefully evaluate the following generated email and provide detailed reflection and improvement suggestions.\n\n"
-                "【User's Original Prompt】\n{prompt}\n\n"
-                "【Recipient】\n{recipient}\n\n"
-                "【Generated Email Subject】\n{subject}\n\n"
-                "【Generated Email Body】\n{body}\n\n"
+                "You are a professional email quality assessment expert. Please carefully evaluate the generated email provided at the end and provide detailed reflection and improvement suggestions.\n\n"
                 "Please evaluate from the following aspects:\n"
                 "1. **Content Completeness**: Does the email fully address the user's prompt? Are there any missing important information?\n"
                 "2. **Professionalism**: Is the tone professional and polite? Does it meet business email standards?\n"
@@ -95,7 +96,13 @@ def reflect_on_email(
                 "【Improvement Suggestions】\n"
                 "(If there are areas that need improvement, provide specific suggestions; if the email quality is good, explain why)\n\n"
                 "【Needs Revision】\n"
-                "(Answer: Yes/No, and briefly explain the reason. Only answer 'Yes' if the email has serious issues such as missing key information, inappropriate tone, or content that doesn't meet requirements)"
+                "(Answer: Yes/No, and briefly explain the reason. Only answer 'Yes' if the email has serious issues such as missing key information, inappropriate tone, or content that doesn't meet requirements)\n\n"
+                "【User's Original Prompt】\n{prompt}\n\n"
+                "【Recipient】\n{recipient}\n\n"
+                "【Generated Email Subject】\n{subject}\n\n"
+                "【Generated Email Body】\n{body}\n\n"
+                "Please respond in the format above, using the three headings 【Reflection Assessment】, "
+                "【Improvement Suggestions】 and 【Needs Revision】 in that order, and answer Yes or No under 【Needs Revision】."
             )
         
         # 創建反思提示
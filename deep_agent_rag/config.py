@@ -3,6 +3,8 @@
 包含系統配置、路徑設定和常量
 """
 import os
+import importlib.util
+from pathlib import Path
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -14,17 +16,33 @@ os.environ["TOKENIZERS_PARALLELISM"] = "false"
 EXTERNAL_SSD_PATH = "/Volumes/T7_SSD"
 HF_CACHE_DIR = os.path.join(EXTERNAL_SSD_PATH, "huggingface_cache")
 
-# 檢查外接 SSD 是否存在
-if os.path.exists(EXTERNAL_SSD_PATH):
+# 檢查外接 SSD 是否存在（mkdir 失敗即代表 SSD 未掛載，不另外檢查路徑是否存在）
+_hf_cache_path = Path(HF_CACHE_DIR)
+try:
     # 創建緩存目錄（如果不存在）
-    os.makedirs(HF_CACHE_DIR, exist_ok=True)
+    _hf_cache_path.mkdir(exist_ok=True)
+except OSError:
+    print(f"⚠️ 警告：找不到外接 SSD {EXTERNAL_SSD_PATH}，將使用預設緩存目錄")
+else:
     # 設置 HuggingFace 環境變數（必須在導入 HuggingFace 相關庫之前設置）
     os.environ["HF_HOME"] = HF_CACHE_DIR
-    os.environ["TRANSFORMERS_CACHE"] = os.path.join(HF_CACHE_DIR, "transformers")
-    os.environ["HF_HUB_CACHE"] = os.path.join(HF_CACHE_DIR, "hub")
+    os.environ["TRANSFORMERS_CACHE"] = str(_hf_cache_path / "transformers")
+    os.environ["HF_HUB_CACHE"] = str(_hf_cache_path / "hub")
     print(f"💾 模型緩存目錄：{HF_CACHE_DIR}")
-else:
-    print(f"⚠️ 警告：找不到外接 SSD {EXTERNAL_SSD_PATH}，將使用預設緩存目錄")
+
+# 本地快取目錄（草稿快取等，可能包含參與者郵箱和地點）：放在使用者目錄下且只有擁有者可讀寫，
+# 不隨啟動時的工作目錄改變，也不會落在 repo 中；可用環境變數 DEEP_AGENT_CACHE_DIR 覆寫
+CACHE_DIR = os.getenv("DEEP_AGENT_CACHE_DIR", os.path.join(Path.home(), ".cache", "deep_agent_rag"))
+try:
+    Path(CACHE_DIR).mkdir(mode=0o700, parents=True, exist_ok=True)
+except OSError as e:
+    print(f"⚠️ 警告：無法建立快取目錄 {CACHE_DIR}：{e}")
+CALENDAR_DRAFT_CACHE_PATH = os.path.join(CACHE_DIR, "calendar_draft_cache.db")
+
+# 若已安裝 hf_transfer，啟用 Rust 加速下載（需要重新下載模型時快 5-10 倍）
+# 未安裝時不可設置此變數，否則 huggingface_hub 下載時會報錯
+if importlib.util.find_spec("hf_transfer") is not None:
+    os.environ.setdefault("HF_HUB_ENABLE_HF_TRANSFER", "1")
 
 # MLX 模型配置
 MLX_MODEL_ID = "mlx-community/Qwen2.5-Coder-7B-Instruct-4bit"
@@ -70,13 +88,16 @@ USE_OLLAMA = os.getenv("USE_OLLAMA", "false").lower() == "true"  # 是否啟用
 EMAIL_SENDER = "matthuang46@gmail.com"  # 預設發件人（向後兼容）
 # Gmail API 配置
 GMAIL_CREDENTIALS_FILE = os.getenv("GMAIL_CREDENTIALS_FILE", "credentials_matthuang.json")  # OAuth2 憑證文件（預設）
-GMAIL_TOKEN_FILE = os.getenv("GMAIL_TOKEN_FILE", "token.json")  # 儲存存取令牌的文件（預設）
+GMAIL_TOKEN_FILE = os.getenv("GMAIL_TOKEN_FILE", "token_gmail.json")  # 儲存存取令牌的文件（預設，只包含 Gmail 權限）
 GMAIL_SCOPES = ['https://www.googleapis.com/auth/gmail.send']  # Gmail API 權限範圍
 
 # Calendar 配置 - 使用 Google Calendar API
 CALENDAR_CREDENTIALS_FILE = os.getenv("CALENDAR_CREDENTIALS_FILE", "credentials_matthuang.json")  # OAuth2 憑證文件（可與 Gmail 共用）
-CALENDAR_TOKEN_FILE = os.getenv("CALENDAR_TOKEN_FILE", "token.json")  # 儲存存取令牌的文件（可與 Gmail 共用）
+CALENDAR_TOKEN_FILE = os.getenv("CALENDAR_TOKEN_FILE", "token_calendar.json")  # 儲存存取令牌的文件（只包含 Calendar 權限）
 CALENDAR_SCOPES = ['https://www.googleapis.com/auth/calendar']  # Calendar API 權限範圍
+# 舊版 Gmail 和 Calendar 共用的 token 文件，首次使用時會自動遷移到各自的 token 文件
+# 若將 GMAIL_TOKEN_FILE 和 CALENDAR_TOKEN_FILE 設為同一個文件，則仍共用並請求合併的權限範圍
+GOOGLE_SHARED_TOKEN_FILE = os.getenv("GOOGLE_SHARED_TOKEN_FILE", "token.json")
 
 # Calendar MCP - Gradio 使用 MCP client 呼叫行事曆時，會先啟動此 server（HTTP）
 USE_CALENDAR_MCP = os.getenv("USE_CALENDAR_MCP", "true").lower() == "true"
@@ -2,6 +2,7 @@
 MLX 模型包裝器
 將 MLX 模型整合到 LangChain 生態系統中
 """
+import threading
 from typing import List, Optional, Any
 import mlx.core as mx
 from mlx_lm import load, generate as mlx_generate
@@ -13,6 +14,9 @@ from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, Base
 
 from ..config import MLX_MODEL_ID, MLX_MAX_TOKENS, MLX_TEMPERATURE
 
+# MLX 推論不是執行緒安全的，多個執行緒共用模型時依序生成
+_GENERATE_LOCK = threading.Lock()
+
 
 class MLXChatModel(BaseChatModel):
     """
@@ -75,46 +79,48 @@ class MLXChatModel(BaseChatModel):
             prompt_parts.append("<|im_start|>assistant\n")
             prompt = "\n".join(prompt_parts)
         
-        # 使用 MLX 的 generate 函數一次性生成（更快）
-        # 注意：MLX 的 generate 不支援 temperature 參數，但速度更快
-        try:
-            response_text = mlx_generate(
-                self.model,
-                self.tokenizer,
-                prompt=prompt,
-                max_tokens=self.max_tokens,
-                verbose=False
-            )# 【修復】清理輸出中的特殊標記
-            response_text = response_text.strip()
-            # 移除 <|im_end|> 和 <|im_start|> 標記
-            response_text = response_text.replace("<|im_end|>", "").replace("<|im_start|>", "")
-            # 移除多餘的空白行
-            response_text = "\n".join(line for line in response_text.split("\n") if line.strip())
-        except Exception as e:
-            # 如果 generate 失敗，回退到逐個 token 生成
-            print(f"   ⚠️ MLX generate 失敗，使用逐個 token 生成: {e}")
-            tokens = self.tokenizer.encode(prompt)
-            tokens = mx.array(tokens)
-            
-            generated_tokens = []
-            for _ in range(self.max_tokens):
-                # 前向傳播
-                logits = self.model(tokens[None, :])
-                logits = logits[0, -1, :]
-                
-                # 使用貪婪解碼（最快）
-                next_token = mx.argmax(logits)
-                next_token = int(next_token.item())
+        # 同一個模型不能同時推論（例如行事曆代理並行驗證參與者和地點時），以鎖依序執行
+        with _GENERATE_LOCK:
+            # 使用 MLX 的 generate 函數一次性生成（更快）
+            # 注意：MLX 的 generate 不支援 temperature 參數，但速度更快
+            try:
+                response_text = mlx_generate(
+                    self.model,
+                    self.tokenizer,
+                    prompt=prompt,
+                    max_tokens=self.max_tokens,
+                    verbose=False
+                )# 【修復】清理輸出中的特殊標記
+                response_text = response_text.strip()
+                # 移除 <|im_end|> 和 <|im_start|> 標記
+                response_text = response_text.replace("<|im_end|>", "").replace("<|im_start|>", "")
+                # 移除多餘的空白行
+                response_text = "\n".join(line for line in response_text.split("\n") if line.strip())
+            except Exception as e:
+                # 如果 generate 失敗，回退到逐個 token 生成
+                print(f"   ⚠️ MLX generate 失敗，使用逐個 token 生成: {e}")
+                tokens = self.tokenizer.encode(prompt)
+                tokens = mx.array(tokens)
                 
-                # 檢查結束符
-                if next_token == self.tokenizer.eos_token_id:
-                    break
+                generated_tokens = []
+                for _ in range(self.max_tokens):
+                    # 前向傳播
+                    logits = self.model(tokens[None, :])
+                    logits = logits[0, -1, :]
+                    
+                    # 使用貪婪解碼（最快）
+                    next_token = mx.argmax(logits)
+                    next_token = int(next_token.item())
+                    
+                    # 檢查結束符
+                    if next_token == self.tokenizer.eos_token_id:
+                        break
+                    
+                    generated_tokens.append(next_token)
+                    tokens = mx.concatenate([tokens, mx.array([next_token])])
                 
-                generated_tokens.append(next_token)
-                tokens = mx.concatenate([tokens, mx.array([next_token])])
-            
-            # 解碼回答
-            response_text = self.tokenizer.decode(generated_tokens, skip_special_tokens=True)
+                # 解碼回答
+                response_text = self.tokenizer.decode(generated_tokens, skip_special_tokens=True)
         # 【額外保險】再次清理輸出，確保沒有遺漏的特殊標記
         response_text = response_text.strip()
         response_text = response_text.replace("<|im_end|>", "").replace("<|im_start|>", "")
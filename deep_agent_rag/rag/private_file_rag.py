@@ -245,7 +245,7 @@ class PrivateFileRAG:
         
         try:
             from langchain_community.embeddings import HuggingFaceEmbeddings
-            from src.retrievers.vector_retriever import get_device
+            from src.retrievers.vector_retriever import get_device, quantize_embeddings_for_cpu
             
             # 獲取 Hugging Face 模型緩存目錄（如果設置了環境變數）
             # 這對於使用外接硬碟存儲模型很有用
@@ -267,6 +267,10 @@ class PrivateFileRAG:
                 model_kwargs=model_kwargs,
                 encode_kwargs={'normalize_embeddings': True}
             )
+            
+            # CPU 上使用 int8 動態量化加速 embedding 計算
+            if device == 'cpu':
+                quantize_embeddings_for_cpu(self.shared_embeddings)
             return self.shared_embeddings
         except Exception as e:
             # 如果初始化失敗，記錄錯誤並回退到字符分塊模式
@@ -275,12 +279,13 @@ class PrivateFileRAG:
             self.use_semantic_chunking = False
             return None
     
-    def process_files(self, file_paths: List[str]) -> Tuple[List[Dict], str]:
+    def process_files(self, file_paths: List[str], batch_size: int = 128) -> Tuple[List[Dict], str]:
         """
         處理上傳的文件
         
         Args:
             file_paths: 文件路徑列表（可以是字符串路徑或 Gradio 文件對象）
+            batch_size: 每批寫入向量資料庫的 chunks 數量
             
         Returns:
             (documents, status_message) 元組
@@ -341,7 +346,7 @@ class PrivateFileRAG:
             self.current_files = actual_paths
             
             # 初始化檢索系統
-            status_msg = self._init_retrievers(all_documents)
+            status_msg = self._init_retrievers(all_documents, batch_size=batch_size)
             
             return all_documents, status_msg
             
@@ -352,12 +357,13 @@ class PrivateFileRAG:
             traceback.print_exc()
             return [], error_msg
     
-    def _init_retrievers(self, documents: List[Dict]) -> str:
+    def _init_retrievers(self, documents: List[Dict], batch_size: int = 128) -> str:
         """
         初始化檢索器
         
         Args:
             documents: 文檔列表
+            batch_size: 每批寫入向量資料庫的 chunks 數量
             
         Returns:
             狀態訊息
@@ -373,7 +379,8 @@ class PrivateFileRAG:
                 documents,
                 embedding_model=self.embedding_model,
                 persist_directory=self.persist_directory,
-                embeddings=self.shared_embeddings
+                embeddings=self.shared_embeddings,
+                batch_size=batch_size
             )
             
             # 初始化混合搜尋
@@ -0,0 +1,326 @@
+"""
+Google API 共用認證模組
+集中管理 Gmail / Calendar 工具的 OAuth2 憑證讀取、刷新、快取，以及 API 服務對象的建立與快取
+
+Google API 客戶端相關模組很重（oauthlib、httplib2、discovery 等），只在實際呼叫 API 時才匯入，
+避免沒有用到郵件或行事曆功能的程式路徑也要付出匯入成本。
+"""
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Optional
+
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
+    from google_auth_httplib2 import AuthorizedHttp
+
+logger = logging.getLogger(__name__)
+
+# 服務快取（每個執行緒各自一份）：{(API 名稱, 版本, scopes, token 文件): (服務對象, 憑證)}
+# 避免每次工具呼叫都重新讀取 token 並呼叫 build()（解析 discovery 文件的成本很高）；
+# 服務對象持有的 httplib2.Http 不是執行緒安全的，同一個服務不能交給多個執行緒同時使用
+_SERVICE_CACHE = threading.local()
+
+# 每個 token 文件各自一把鎖：讀取、刷新和授權（可能要等使用者在瀏覽器中完成）只會擋住使用同一個 token 的呼叫
+_TOKEN_LOCKS: dict[str, threading.Lock] = {}
+_TOKEN_LOCKS_GUARD = threading.Lock()
+
+# 憑證快取：{token 文件: (憑證, 載入/刷新時間)}
+# 多個 API 使用同一個 token 文件時共用同一個憑證對象，一次刷新即可涵蓋所有服務
+# 存取令牌有效期為 60 分鐘，保留 5 分鐘緩衝，超過 55 分鐘就主動刷新
+_TOKEN_CACHE: dict[str, tuple['Credentials', float]] = {}
+_TOKEN_CACHE_TTL = 55 * 60
+
+# Google API 請求逾時（秒）
+_HTTP_TIMEOUT = 15
+
+
+def build_resource(
+    api_name: str,
+    api_version: str,
+    scopes: tuple[str, ...],
+    token_file: str,
+    resolve_credentials_file: Callable[[], tuple[str, Optional[bool]]],
+    *,
+    tag: str,
+    migrate_from: Optional[str] = None,
+    account_hint: Optional[str] = None,
+    missing_credentials_hint: str = "",
+):
+    """
+    獲取 Google API 服務實例
+    
+    服務對象和憑證都會被快取：憑證在 TTL 內仍有效時直接返回，不讀取 token 文件；
+    超過 TTL 或過期時就地刷新並沿用同一個服務對象，只有在沒有快取或刷新失敗時才重新讀取 token 並建立服務。
+    憑證由所有執行緒共用，服務對象（及其 HTTP 連線）則每個執行緒各自建立一份。
+    
+    Args:
+        api_name: API 名稱（例如 'gmail'、'calendar'）
+        api_version: API 版本（例如 'v1'、'v3'）
+        scopes: 權限範圍（已排序的 tuple）
+        token_file: token 文件路徑
+        resolve_credentials_file: 返回 (OAuth2 憑證文件路徑, 是否存在) 的函式，只有在需要重新讀取憑證時才呼叫；
+            是否存在可為 None，表示需要自行檢查
+        tag: 日誌和授權提示使用的標籤（例如 'Gmail'、'Calendar'）
+        migrate_from: token 文件不存在時，可從此舊版 token 文件遷移憑證（可選）
+        account_hint: 授權時提示使用者選擇的帳號（可選）
+        missing_credentials_hint: 找不到憑證文件時附加的說明（可選）
+    
+    Returns:
+        Google API 服務對象
+    """
+    cache_key = (api_name, api_version, scopes, token_file)
+    services = _thread_services()
+    
+    with _token_lock(token_file):
+        creds = _get_cached_credentials(token_file)
+        if creds is None:
+            credentials_file, credentials_exists = resolve_credentials_file()
+            creds = _load_credentials(
+                scopes,
+                token_file,
+                credentials_file,
+                credentials_exists,
+                tag=tag,
+                migrate_from=migrate_from,
+                account_hint=account_hint,
+                missing_credentials_hint=missing_credentials_hint,
+            )
+            _TOKEN_CACHE[token_file] = (creds, time.monotonic())
+    
+    # 服務快取只屬於目前執行緒，建立服務不需要持有鎖
+    cached = services.get(cache_key)
+    if cached is not None and cached[1] is creds:
+        return cached[0]
+    
+    from googleapiclient.discovery import build
+    
+    service = build(api_name, api_version, http=_authorized_http(creds), cache_discovery=False, static_discovery=True)
+    services[cache_key] = (service, creds)
+    return service
+
+
+def _token_lock(token_file: str) -> threading.Lock:
+    """
+    取得 token 文件對應的鎖（第一次使用時建立）
+    
+    Args:
+        token_file: token 文件路徑
+    
+    Returns:
+        該 token 文件專用的鎖
+    """
+    with _TOKEN_LOCKS_GUARD:
+        lock = _TOKEN_LOCKS.get(token_file)
+        if lock is None:
+            lock = _TOKEN_LOCKS[token_file] = threading.Lock()
+        return lock
+
+
+def _thread_services() -> dict:
+    """
+    取得目前執行緒的服務快取
+    
+    Returns:
+        {快取鍵: (服務對象, 憑證)}，只在目前執行緒中使用
+    """
+    services = getattr(_SERVICE_CACHE, 'services', None)
+    if services is None:
+        services = _SERVICE_CACHE.services = {}
+    return services
+
+
+def _authorized_http(creds: 'Credentials') -> 'AuthorizedHttp':
+    """
+    建立帶憑證的 HTTP 連線，供服務對象在多次呼叫之間重用 TCP/TLS 連線
+    
+    每個服務對象各自持有一個 httplib2.Http（httplib2 不是執行緒安全的，不能跨服務或跨執行緒共用）；
+    憑證刷新是就地更新，AuthorizedHttp 持有同一個憑證對象，不需要重新建立。
+    
+    Args:
+        creds: 有效的憑證
+    
+    Returns:
+        AuthorizedHttp 實例
+    """
+    import httplib2
+    from google_auth_httplib2 import AuthorizedHttp
+    
+    return AuthorizedHttp(creds, http=httplib2.Http(timeout=_HTTP_TIMEOUT))
+
+
+def _get_cached_credentials(token_file: str) -> Optional['Credentials']:
+    """
+    從憑證快取取得憑證，超過 TTL 或已過期時就地刷新
+    
+    Args:
+        token_file: token 文件路徑
+    
+    Returns:
+        有效的憑證；沒有快取或刷新失敗時返回 None
+    """
+    entry = _TOKEN_CACHE.get(token_file)
+    if entry is None:
+        return None
+    
+    creds, loaded_at = entry
+    if creds.valid and time.monotonic() - loaded_at < _TOKEN_CACHE_TTL:
+        return creds
+    if creds.refresh_token and _refresh_credentials(creds, token_file):
+        return creds
+    
+    del _TOKEN_CACHE[token_file]
+    return None
+
+
+def _refresh_credentials(creds: 'Credentials', token_file: str) -> bool:
+    """
+    刷新憑證並更新快取，只有在令牌實際變更時才（以原子方式）寫回 token 文件
+    
+    Args:
+        creds: 要刷新的憑證（google-auth 會就地更新，持有它的服務對象不需重新 build）
+        token_file: token 文件路徑
+    
+    Returns:
+        刷新是否成功
+    """
+    from google.auth.transport.requests import Request
+    
+    # 只比較令牌本身：to_json() 含有每次刷新都會變的 expiry，比較整份 JSON 等於每次都寫入
+    old_tokens = (creds.token, creds.refresh_token)
+    try:
+        creds.refresh(Request())
+    except Exception as e:
+        logger.warning("刷新令牌時發生錯誤：%s", e)
+        return False
+    
+    _TOKEN_CACHE[token_file] = (creds, time.monotonic())
+    if (creds.token, creds.refresh_token) != old_tokens:
+        try:
+            _write_token_file(token_file, creds.to_json())
+        except Exception as e:
+            logger.warning("儲存 %s 時發生錯誤：%s", token_file, e)
+    return True
+
+
+def _write_token_file(token_file: str, data: str) -> None:
+    """
+    以原子方式寫入 token 文件
+    
+    先寫入同目錄的臨時文件再用 os.replace 取代，寫入中途失敗也不會留下損壞的 token 文件
+    （損壞的文件會讓下次啟動時必須重新授權）。
+    
+    Args:
+        token_file: token 文件路徑
+        data: 要寫入的憑證 JSON
+    """
+    directory = os.path.dirname(os.path.abspath(token_file))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.token-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as token:
+            token.write(data)
+        os.replace(tmp_path, token_file)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _load_credentials(
+    scopes: tuple[str, ...],
+    token_file: str,
+    credentials_file: str,
+    credentials_exists: Optional[bool],
+    *,
+    tag: str,
+    migrate_from: Optional[str] = None,
+    account_hint: Optional[str] = None,
+    missing_credentials_hint: str = "",
+) -> 'Credentials':
+    """
+    從 token 文件讀取憑證，必要時刷新或重新授權
+    
+    如果 token 文件還不存在，但指定的舊版 token 文件（例如 Gmail 和 Calendar 以前共用的 token.json）存在，
+    會從中讀取憑證（refresh token 可換發較小範圍的權限），並保存到新的 token 文件。
+    
+    Args:
+        scopes: 權限範圍列表
+        token_file: token 文件路徑
+        credentials_file: OAuth2 憑證文件路徑
+        credentials_exists: 憑證文件是否存在（None 表示未知），避免重複檢查
+        tag: 日誌和授權提示使用的標籤
+        migrate_from: 可遷移的舊版 token 文件路徑（可選）
+        account_hint: 授權時提示使用者選擇的帳號（可選）
+        missing_credentials_hint: 找不到憑證文件時附加的說明（可選）
+    
+    Returns:
+        有效的憑證
+    """
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    
+    creds = None
+    needs_save = False
+    
+    # 檢查是否存在 token 文件（儲存使用者的存取令牌）
+    token_source = token_file
+    if (
+        migrate_from
+        and migrate_from != token_file
+        and not os.path.exists(token_file)
+        and os.path.exists(migrate_from)
+    ):
+        logger.info("[%s] 從共用的 %s 遷移憑證到 %s", tag, migrate_from, token_file)
+        token_source = migrate_from
+        needs_save = True
+    
+    if os.path.exists(token_source):
+        try:
+            creds = Credentials.from_authorized_user_file(token_source, scopes)
+        except Exception as e:
+            logger.warning("讀取 %s 時發生錯誤：%s", token_source, e)
+            creds = None
+    
+    # 如果沒有憑證或憑證過期，則進行登入
+    if not creds or not creds.valid:
+        needs_save = True
+        if creds and creds.expired and creds.refresh_token:
+            # 嘗試刷新令牌
+            try:
+                creds.refresh(Request())
+            except Exception as e:
+                logger.warning("刷新令牌時發生錯誤：%s", e)
+                creds = None
+        
+        # 如果仍然沒有有效憑證，需要重新授權
+        if not creds:
+            # 快取結果可能稍舊：只有在不確定或認為文件不存在時才再檢查一次
+            if not credentials_exists and not os.path.exists(credentials_file):
+                message = (
+                    f"❌ 找不到憑證文件 {credentials_file}。\n"
+                    "請從 Google Cloud Console 下載 OAuth2 憑證文件。"
+                )
+                if missing_credentials_hint:
+                    message += f"\n{missing_credentials_hint}"
+                raise FileNotFoundError(message)
+            
+            print(f"🔐 [{tag}] 正在請求授權，權限範圍：{scopes}")
+            if account_hint:
+                print(f"   👤 請選擇帳號：{account_hint}")
+            flow = InstalledAppFlow.from_client_secrets_file(credentials_file, scopes)
+            creds = flow.run_local_server(port=0)
+    
+    # 儲存憑證以供下次使用
+    if needs_save:
+        try:
+            _write_token_file(token_file, creds.to_json())
+            logger.info("[%s] 憑證已保存到 %s，包含的權限：%s", tag, token_file, getattr(creds, 'scopes', 'N/A'))
+        except Exception as e:
+            logger.warning("儲存 %s 時發生錯誤：%s", token_file, e)
+    
+    return creds
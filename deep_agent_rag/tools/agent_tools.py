@@ -2,11 +2,66 @@
 Agent 工具定義
 包含股票查詢、網路搜尋、PDF 知識庫查詢、arXiv 論文搜尋等工具
 """
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 import yfinance as yf
+from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_core.tools import tool
 from langchain_community.tools.tavily_search import TavilySearchResults
 from .image_analysis_tool import analyze_image as _local_analyze_image
 
+# 股票資訊快取：{大寫 ticker: (寫入時間, 格式化摘要)}，避免同一 ticker 重複呼叫 yfinance
+_COMPANY_INFO_CACHE_TTL = 300  # 秒
+_COMPANY_INFO_CACHE_MAXSIZE = 512
+_company_info_cache = {}
+# 工具可能在多個執行緒中同時執行，快取的讀取、清理和寫入都要持有此鎖（yfinance 查詢不持有）
+_company_info_cache_lock = threading.Lock()
+
+# 關鍵字解析用的正則：去除 ```json 程式碼塊標記、擷取引號中的內容
+_JSON_FENCE = re.compile(r'^```(?:json)?\s*|\s*```$', re.MULTILINE)
+_QUOTED = re.compile(r'"([^"]+)"')
+# 查詢擴展：出現這些版本號/技術規格關鍵詞時，先嘗試直接從查詢推斷產品名稱（已轉小寫）
+_VERSION_SPEC_KEYWORDS = (
+    "版本", "version", "v1", "v2", "v3", "v1.", "v2.", "v3.", "v4", "v5",
+    "時脈", "頻率", "clock", "ghz", "核心", "晶片", "chip", "core", "能源", "轉換率",
+)
+# 查詢擴展：以 embedding 相似度推斷產品名稱的門檻（最高分需超過門檻，且與次高分有足夠差距）
+_PRODUCT_SIMILARITY_THRESHOLD = 0.35
+_PRODUCT_SIMILARITY_MARGIN = 0.05
+# 產品名稱 embedding 快取：{(embedding 模型名稱, 產品名稱 tuple): L2 正規化後的矩陣}
+# 以模型名稱而非 id() 作為鍵：模型實例被回收後 id 可能被新物件重用，會取到其他模型的向量
+_PRODUCT_EMBEDDING_CACHE_MAXSIZE = 32
+_product_embedding_cache = {}
+_product_embedding_cache_lock = threading.Lock()
+# 關鍵字提取的固定指示（作為 SystemMessage，PDF 片段與查詢以獨立訊息傳入）
+_KEYWORD_EXTRACTION_INSTRUCTIONS = """從使用者提供的 PDF 內容中提取學術關鍵字，這些關鍵字將用於在 arXiv 上搜尋相關論文。
+
+請提取：
+1. 核心學術概念和術語（英文）
+2. 研究方法和技術名稱
+3. 相關領域關鍵詞
+
+返回格式：JSON 陣列，例如：["keyword1", "keyword2", "keyword3"]
+只返回 JSON 陣列，不要其他解釋。"""
+# arXiv ID 的版本號後綴（例如 2305.10601v2 中的 v2）
+_ARXIV_VERSION = re.compile(r'v\d+$')
+
+# 共用的 Tavily 搜尋客戶端（首次使用時建立）
+_tavily_search = None
+
+# 共用的 arXiv API 客戶端（首次使用時建立，重用同一個 HTTP session）
+# 客戶端的 session 和速率限制狀態不是執行緒安全的，建立和每次查詢（含遍歷結果）都要持有 _arxiv_lock
+_arxiv_client = None
+_arxiv_lock = threading.Lock()
+# 並行下載論文 PDF 的最大執行緒數
+_ARXIV_DOWNLOAD_WORKERS = 4
+
 
 def _get_analyze_image_tool():
     """優先使用 Image Analysis MCP 工具，失敗則用本地 analyze_image。"""
@@ -15,31 +70,54 @@ def _get_analyze_image_tool():
     return t if t is not None else _local_analyze_image
 
 
+def _format_company_info(ticker: str, info: dict) -> str:
+    """將 yfinance 的 info 字典格式化為摘要字串。"""
+    business_summary = info.get('longBusinessSummary') or ""
+    return (
+        f"股票: {info.get('longName')} ({ticker})\n"
+        f"現價: {info.get('currentPrice')} {info.get('currency')}\n"
+        f"市值: {info.get('marketCap')}\n"
+        f"本益比 (PE): {info.get('trailingPE')}\n"
+        f"營收增長: {info.get('revenueGrowth')}\n"
+        f"業務摘要: {business_summary[:500]}..."
+    )
+
+
 @tool
 def get_company_deep_info(ticker: str) -> str:
     """查詢股票的詳細營運狀況，包括現價、市值、本益比、營收增長等深度數據。"""
+    cache_key = ticker.strip().upper()
+    now = time.monotonic()
+    with _company_info_cache_lock:
+        cached = _company_info_cache.get(cache_key)
+    if cached and now - cached[0] < _COMPANY_INFO_CACHE_TTL:
+        return cached[1]
+    
     try:
         stock = yf.Ticker(ticker)
-        info = stock.info
-        summary = (
-            f"股票: {info.get('longName')} ({ticker})\n"
-            f"現價: {info.get('currentPrice')} {info.get('currency')}\n"
-            f"市值: {info.get('marketCap')}\n"
-            f"本益比 (PE): {info.get('trailingPE')}\n"
-            f"營收增長: {info.get('revenueGrowth')}\n"
-            f"業務摘要: {info.get('longBusinessSummary')[:500]}..."
-        )
-        return summary
+        summary = _format_company_info(ticker, stock.info)
     except Exception as e:
         return f"數據查詢失敗: {e}"
+    
+    # 超過上限時先清掉過期項目，仍然太多則移除最舊的一筆
+    with _company_info_cache_lock:
+        if len(_company_info_cache) >= _COMPANY_INFO_CACHE_MAXSIZE:
+            for key in [k for k, (ts, _) in _company_info_cache.items() if now - ts >= _COMPANY_INFO_CACHE_TTL]:
+                del _company_info_cache[key]
+            if len(_company_info_cache) >= _COMPANY_INFO_CACHE_MAXSIZE:
+                del _company_info_cache[next(iter(_company_info_cache))]
+        _company_info_cache[cache_key] = (now, summary)
+    return summary
 
 
 @tool
 def search_web(query: str) -> str:
     """搜尋網際網路以獲取最新新聞或一般知識。"""
+    global _tavily_search
     try:
-        tool = TavilySearchResults(k=5)  # 增加搜尋量以獲取深度資訊
-        return str(tool.invoke(query))
+        if _tavily_search is None:
+            _tavily_search = TavilySearchResults(k=5)  # 增加搜尋量以獲取深度資訊
+        return str(_tavily_search.invoke(query))
     except Exception as e:
         return f"搜尋錯誤: {e}"
 
@@ -54,8 +132,6 @@ def get_product_names_from_files(data_dir: str = "data") -> list:
     Returns:
         產品名稱列表（包含帶破折號和空格的版本）
     """
-    import os
-    
     product_names = []
     
     try:
@@ -97,6 +173,92 @@ def get_product_names_from_files(data_dir: str = "data") -> list:
     return product_names
 
 
+def _infer_product_by_embedding(query: str, product_names: list, rag_retriever) -> Optional[str]:
+    """
+    以 embedding 相似度從已知產品列表中推斷查詢對應的產品名稱。
+    
+    產品名稱的 embedding 只計算一次並快取，每次查詢只需計算一次查詢 embedding，
+    比呼叫 LLM 便宜得多。無法確定時返回 None，交由 LLM 推斷。
+    
+    Args:
+        query: 查詢問題
+        product_names: 已知產品名稱列表
+        rag_retriever: PrivateFileRAG 實例（使用其向量檢索器的 embedding 模型）
+    
+    Returns:
+        推斷出的產品名稱，無法確定時返回 None
+    """
+    vector_retriever = getattr(rag_retriever, "vector_retriever", None)
+    embeddings = getattr(vector_retriever, "embeddings", None)
+    if embeddings is None:
+        return None
+    
+    import numpy as np
+    
+    # 帶破折號與空格的版本視為同一產品，只保留第一個出現的名稱
+    candidates = {}
+    for name in product_names:
+        candidates.setdefault(name.replace('-', ' ').lower(), name)
+    names = tuple(candidates.values())
+    if len(names) < 2:
+        return None
+    
+    try:
+        # 沒有模型名稱時無法安全地辨識模型，每次重新計算而不快取
+        model_name = getattr(embeddings, "model_name", None)
+        cache_key = (model_name, names) if model_name else None
+        with _product_embedding_cache_lock:
+            product_matrix = _product_embedding_cache.get(cache_key) if cache_key else None
+        if product_matrix is None:
+            product_matrix = np.asarray(
+                embeddings.embed_documents([f"Product: {name}" for name in names]), dtype=np.float32
+            )
+            product_matrix /= np.maximum(np.linalg.norm(product_matrix, axis=1, keepdims=True), 1e-12)
+            if cache_key:
+                with _product_embedding_cache_lock:
+                    # 超過上限時移除最早加入的一筆
+                    if len(_product_embedding_cache) >= _PRODUCT_EMBEDDING_CACHE_MAXSIZE:
+                        del _product_embedding_cache[next(iter(_product_embedding_cache))]
+                    _product_embedding_cache[cache_key] = product_matrix
+        
+        query_vector = np.asarray(embeddings.embed_query(query), dtype=np.float32)
+        query_vector /= max(float(np.linalg.norm(query_vector)), 1e-12)
+        
+        similarities = product_matrix @ query_vector
+        ranked = np.argsort(similarities)[::-1]
+        best, second = similarities[ranked[0]], similarities[ranked[1]]
+        if best > _PRODUCT_SIMILARITY_THRESHOLD and best - second >= _PRODUCT_SIMILARITY_MARGIN:
+            return names[ranked[0]]
+    except Exception as e:
+        print(f"   ⚠️ [查詢擴展] embedding 推斷產品名稱失敗: {e}")
+    
+    return None
+
+
+def _query_langchain_retriever(query: str, retriever) -> str:
+    """
+    使用一般的 LangChain retriever 檢索並由 LLM 生成回答（query_pdf_knowledge 的備援路徑）。
+    
+    Args:
+        query: 查詢問題
+        retriever: 具有 invoke(query) -> List[Document] 介面的 LangChain retriever
+    
+    Returns:
+        基於檢索內容的回答
+    """
+    from ..utils.llm_utils import get_llm
+    
+    docs = retriever.invoke(query)
+    if not docs:
+        return "在 PDF 知識庫中未找到相關資訊。"
+    
+    messages = [SystemMessage(content="根據使用者提供的 PDF 內容片段回答問題。如果內容中沒有相關資訊，請直接說明。")]
+    messages.extend(HumanMessage(content=f"PDF 內容：\n{doc.page_content}") for doc in docs)
+    messages.append(HumanMessage(content=f"問題：{query}"))
+    response = get_llm().invoke(messages)
+    return response.content if hasattr(response, 'content') else str(response)
+
+
 def query_pdf_knowledge(query: str, rag_retriever=None) -> str:
     """
     查詢 PDF 知識庫中的相關資訊。
@@ -105,22 +267,24 @@ def query_pdf_knowledge(query: str, rag_retriever=None) -> str:
     現在使用 Private File RAG 系統，支持多文件、進階 RAG 方法。
     
     這個函數會智能擴展查詢：
-    1. 如果查詢中沒有明確的產品名稱，會先進行初步檢索
-    2. 從初步檢索結果和查詢本身推斷可能的產品名稱
-    3. 使用擴展後的查詢進行完整檢索
+    1. 如果查詢中沒有明確的產品名稱，先以 embedding 相似度比對已知產品名稱
+    2. 無法確定時，若查詢包含版本號/規格關鍵詞，使用 LLM 直接從查詢推斷產品名稱
+    3. 若仍無法推斷，進行初步檢索，從檢索結果推斷可能的產品名稱
+    4. 使用擴展後的查詢進行完整檢索
     """
     if not rag_retriever:
         return "PDF 知識庫未載入，無法查詢。"
     
     try:
-        print(f"   🔍 [RAG] 正在查詢 PDF 知識庫: {query}")
-        
-        # 檢查是否是 Private File RAG 實例
         from ..rag.private_file_rag import PrivateFileRAG
         from ..utils.llm_utils import get_llm
-        from langchain_core.messages import HumanMessage
+        
+        print(f"   🔍 [RAG] 正在查詢 PDF 知識庫: {query}")
         
         if not isinstance(rag_retriever, PrivateFileRAG):
+            # 非 Private File RAG 時，支援一般的 LangChain retriever 作為備援
+            if hasattr(rag_retriever, "invoke"):
+                return _query_langchain_retriever(query, rag_retriever)
             return "PDF 知識庫格式不正確，請重新初始化。"
         
         # 已知的產品名稱列表 - 從 data 文件夾動態載入
@@ -145,46 +309,30 @@ def query_pdf_knowledge(query: str, rag_retriever=None) -> str:
         if not has_product_in_query:
             print(f"   🔍 [查詢擴展] 查詢中沒有明確的產品名稱，嘗試智能擴展...")
             
-            # 策略 1: 先進行一次初步檢索，查看 PDF 內容
-            # 使用較大的 top_k 來獲取更多候選結果
-            preliminary_result = rag_retriever.query(
-                query=query,
-                top_k=10,  # 獲取更多結果以便分析
-                use_llm=False  # 只檢索，不生成回答
-            )
+            # 策略 1: 以 embedding 相似度比對已知產品名稱（不需要 LLM 呼叫）
+            matched_product = _infer_product_by_embedding(query, product_names, rag_retriever)
+            if matched_product:
+                expanded_query = f"{matched_product} {query}"
+                print(f"   ✅ [查詢擴展] 以 embedding 相似度推斷產品名稱 '{matched_product}'，擴展查詢為：{expanded_query}")
             
-            if preliminary_result.get("success") and preliminary_result.get("results"):
-                # 從初步檢索結果中提取文本
-                contexts = []
-                for res in preliminary_result.get("results", [])[:5]:  # 只取前5個結果
-                    contexts.append(res.get("content", ""))
-                
-                combined_context = "\n\n".join(contexts)
-                # 限制長度避免過長
-                context_snippet = combined_context[:2000]
-                
-                # 使用 LLM 從查詢和檢索結果中推斷產品名稱
+            # 策略 2: 查詢中包含版本號、技術規格等關鍵詞時，直接從查詢推斷
+            # 只需一次 LLM 呼叫，不需要檢索；推斷成功時可跳過策略 3 的初步檢索
+            if expanded_query == query and any(keyword in query_lower for keyword in _VERSION_SPEC_KEYWORDS):
                 try:
                     llm = get_llm()
-                    infer_prompt = f"""根據以下查詢和 PDF 內容片段，推斷用戶可能想查詢哪個產品的信息。
+                    infer_prompt = f"""根據以下查詢，推斷用戶可能想查詢哪個產品的信息。
 
 查詢：{query}
 
-PDF 內容片段：
-{context_snippet}
-
 已知產品列表：{', '.join(product_names)}
 
-請根據查詢內容和 PDF 片段推斷最可能的產品名稱。
-如果能夠確定產品名稱，請只返回產品名稱（例如："Lumina-Grid"）。
-如果無法確定，請返回 "無"。
+請根據查詢內容推斷最可能的產品名稱。如果查詢中沒有明確的產品信息，請返回 "無"。
 只返回產品名稱或"無"，不要其他解釋。"""
                     
                     messages = [HumanMessage(content=infer_prompt)]
                     response = llm.invoke(messages)
                     inferred_product = response.content.strip() if hasattr(response, 'content') else str(response).strip()
                     
-                    # 檢查推斷的產品是否在已知列表中
                     if inferred_product and inferred_product.lower() not in ["無", "无", "none", "no", ""]:
                         # 找到匹配的產品名稱
                         matched_product = None
@@ -195,44 +343,51 @@ PDF 內容片段：
                         
                         if matched_product:
                             expanded_query = f"{matched_product} {query}"
-                            print(f"   ✅ [查詢擴展] 從 PDF 內容推斷產品名稱 '{matched_product}'，擴展查詢為：{expanded_query}")
-                        else:
-                            # 如果推斷的產品不在列表中，但看起來像產品名稱，也可以嘗試
-                            # 檢查是否包含常見的產品名稱模式
-                            for name in product_names:
-                                if any(word.lower() in inferred_product.lower() for word in name.split() if len(word) > 2):
-                                    expanded_query = f"{name} {query}"
-                                    print(f"   ✅ [查詢擴展] 從推斷結果 '{inferred_product}' 匹配到產品 '{name}'，擴展查詢為：{expanded_query}")
-                                    break
+                            print(f"   ✅ [查詢擴展] 從查詢推斷產品名稱 '{matched_product}'，擴展查詢為：{expanded_query}")
                 except Exception as e:
-                    print(f"   ⚠️ [查詢擴展] LLM 推斷產品名稱失敗: {e}，使用原始查詢")
+                    print(f"   ⚠️ [查詢擴展] 從查詢推斷產品名稱失敗: {e}，使用原始查詢")
             
-            # 策略 2: 如果初步檢索沒有幫助，嘗試直接從查詢推斷
+            # 策略 3: 如果無法直接從查詢推斷，先進行一次初步檢索，查看 PDF 內容
             if expanded_query == query:
-                try:
-                    llm = get_llm()
-                    # 檢查查詢中是否包含版本號、技術規格等關鍵詞
-                    version_keywords = ["版本", "version", "v1", "v2", "v3", "v1.", "v2.", "v3.", "v4", "v5"]
-                    spec_keywords = ["時脈", "頻率", "clock", "GHz", "核心", "晶片", "chip", "core", "能源", "轉換率"]
+                # 使用較大的 top_k 來獲取更多候選結果
+                preliminary_result = rag_retriever.query(
+                    query=query,
+                    top_k=10,  # 獲取更多結果以便分析
+                    use_llm=False  # 只檢索，不生成回答
+                )
+                
+                if preliminary_result.get("success") and preliminary_result.get("results"):
+                    # 從初步檢索結果中提取文本
+                    contexts = []
+                    for res in preliminary_result.get("results", [])[:5]:  # 只取前5個結果
+                        contexts.append(res.get("content", ""))
                     
-                    has_version_or_spec = any(
-                        keyword in query_lower for keyword in version_keywords + spec_keywords
-                    )
+                    combined_context = "\n\n".join(contexts)
+                    # 限制長度避免過長
+                    context_snippet = combined_context[:2000]
                     
-                    if has_version_or_spec:
-                        infer_prompt = f"""根據以下查詢，推斷用戶可能想查詢哪個產品的信息。
+                    # 使用 LLM 從查詢和檢索結果中推斷產品名稱
+                    try:
+                        llm = get_llm()
+                        infer_prompt = f"""根據以下查詢和 PDF 內容片段，推斷用戶可能想查詢哪個產品的信息。
 
 查詢：{query}
 
+PDF 內容片段：
+{context_snippet}
+
 已知產品列表：{', '.join(product_names)}
 
-請根據查詢內容推斷最可能的產品名稱。如果查詢中沒有明確的產品信息，請返回 "無"。
+請根據查詢內容和 PDF 片段推斷最可能的產品名稱。
+如果能夠確定產品名稱，請只返回產品名稱（例如："Lumina-Grid"）。
+如果無法確定，請返回 "無"。
 只返回產品名稱或"無"，不要其他解釋。"""
                         
                         messages = [HumanMessage(content=infer_prompt)]
                         response = llm.invoke(messages)
                         inferred_product = response.content.strip() if hasattr(response, 'content') else str(response).strip()
                         
+                        # 檢查推斷的產品是否在已知列表中
                         if inferred_product and inferred_product.lower() not in ["無", "无", "none", "no", ""]:
                             # 找到匹配的產品名稱
                             matched_product = None
@@ -243,9 +398,17 @@ PDF 內容片段：
                             
                             if matched_product:
                                 expanded_query = f"{matched_product} {query}"
-                                print(f"   ✅ [查詢擴展] 從查詢推斷產品名稱 '{matched_product}'，擴展查詢為：{expanded_query}")
-                except Exception as e:
-                    print(f"   ⚠️ [查詢擴展] 從查詢推斷產品名稱失敗: {e}，使用原始查詢")
+                                print(f"   ✅ [查詢擴展] 從 PDF 內容推斷產品名稱 '{matched_product}'，擴展查詢為：{expanded_query}")
+                            else:
+                                # 如果推斷的產品不在列表中，但看起來像產品名稱，也可以嘗試
+                                # 檢查是否包含常見的產品名稱模式
+                                for name in product_names:
+                                    if any(word.lower() in inferred_product.lower() for word in name.split() if len(word) > 2):
+                                        expanded_query = f"{name} {query}"
+                                        print(f"   ✅ [查詢擴展] 從推斷結果 '{inferred_product}' 匹配到產品 '{name}'，擴展查詢為：{expanded_query}")
+                                        break
+                    except Exception as e:
+                        print(f"   ⚠️ [查詢擴展] LLM 推斷產品名稱失敗: {e}，使用原始查詢")
         
         # 使用擴展後的查詢進行完整檢索
         result = rag_retriever.query(
@@ -290,8 +453,6 @@ def extract_keywords_from_pdf(query: str, rag_retriever=None) -> str:
     try:
         from ..rag.private_file_rag import PrivateFileRAG
         from ..utils.llm_utils import get_llm
-        from langchain_core.messages import HumanMessage
-        import json
         
         if not isinstance(rag_retriever, PrivateFileRAG):
             return "PDF 知識庫格式不正確。"
@@ -306,45 +467,23 @@ def extract_keywords_from_pdf(query: str, rag_retriever=None) -> str:
         if not result.get("success") or not result.get("results"):
             return "在 PDF 中未找到相關內容，無法提取關鍵字。"
         
-        # 從檢索結果中提取文本
-        contexts = []
-        for res in result.get("results", [])[:3]:
-            contexts.append(res.get("content", ""))
-        
-        combined_context = "\n\n".join(contexts)
-        
         # 使用 LLM 提取關鍵字
+        # 固定的指示放在 SystemMessage（不同查詢間前綴相同，可被推論端快取），
+        # 每個檢索片段各自作為一則訊息，不再先拼接成一個大字串
         llm = get_llm()
-        prompt = f"""從以下 PDF 內容中提取學術關鍵字，這些關鍵字將用於在 arXiv 上搜尋相關論文。
-
-PDF 內容：
-{combined_context}
-
-原始查詢：{query}
-
-請提取：
-1. 核心學術概念和術語（英文）
-2. 研究方法和技術名稱
-3. 相關領域關鍵詞
-
-返回格式：JSON 陣列，例如：["keyword1", "keyword2", "keyword3"]
-只返回 JSON 陣列，不要其他解釋。"""
+        messages = [SystemMessage(content=_KEYWORD_EXTRACTION_INSTRUCTIONS)]
+        messages.extend(
+            HumanMessage(content=f"PDF 內容：\n{res.get('content', '')}")
+            for res in result.get("results", [])[:3]
+        )
+        messages.append(HumanMessage(content=f"原始查詢：{query}"))
         
-        messages = [HumanMessage(content=prompt)]
         response = llm.invoke(messages)
         keywords_text = response.content if hasattr(response, 'content') else str(response)
         
-        # 嘗試解析 JSON
+        # 嘗試解析 JSON（先移除程式碼塊標記）
+        keywords_text = _JSON_FENCE.sub('', keywords_text.strip()).strip()
         try:
-            # 清理響應，提取 JSON 部分
-            keywords_text = keywords_text.strip()
-            if keywords_text.startswith("```"):
-                # 移除程式碼塊標記
-                keywords_text = keywords_text.split("```")[1]
-                if keywords_text.startswith("json"):
-                    keywords_text = keywords_text[4:]
-            keywords_text = keywords_text.strip()
-            
             keywords = json.loads(keywords_text)
             if isinstance(keywords, list) and keywords:
                 return json.dumps(keywords, ensure_ascii=False)
@@ -352,8 +491,7 @@ PDF 內容：
                 return "未能提取有效關鍵字。"
         except json.JSONDecodeError:
             # 如果 JSON 解析失敗，嘗試提取引號中的內容
-            import re
-            keywords = re.findall(r'"([^"]+)"', keywords_text)
+            keywords = _QUOTED.findall(keywords_text)
             if keywords:
                 return json.dumps(keywords, ensure_ascii=False)
             return f"關鍵字提取失敗，LLM 返回：{keywords_text}"
@@ -362,6 +500,48 @@ PDF 內容：
         return f"提取關鍵字失敗: {e}"
 
 
+def _get_arxiv_client():
+    """獲取共用的 arXiv 客戶端，避免每次搜尋都重新建立 HTTP 連線（呼叫方需持有 _arxiv_lock）。"""
+    global _arxiv_client
+    if _arxiv_client is None:
+        import arxiv
+        
+        _arxiv_client = arxiv.Client()
+    return _arxiv_client
+
+
+def _arxiv_results(search) -> list:
+    """
+    以共用客戶端執行 arXiv 查詢並取回所有結果。
+    
+    查詢依序執行，客戶端的速率限制（兩次請求間隔）在多個執行緒之間仍然有效。
+    
+    Args:
+        search: arxiv.Search 查詢
+    
+    Returns:
+        論文結果列表
+    """
+    with _arxiv_lock:
+        return list(_get_arxiv_client().results(search))
+
+
+def _format_arxiv_paper(index: int, paper) -> str:
+    """將單篇 arXiv 論文格式化為列表項目字串。"""
+    authors = paper.authors
+    author_text = ', '.join(author.name for author in authors[:3])
+    if len(authors) > 3:
+        author_text += f" 等 {len(authors)} 位作者"
+    return (
+        f"{index}. {paper.title}\n"
+        f"   arXiv ID: {paper.entry_id.split('/')[-1]}\n"
+        f"   作者: {author_text}\n"
+        f"   摘要: {paper.summary[:500]}...\n"
+        f"   連結: {paper.pdf_url}\n"
+        f"   分類: {', '.join(str(cat) for cat in paper.categories[:3])}\n\n"
+    )
+
+
 def search_arxiv_papers(keywords_json: str, max_results: int = 5) -> str:
     """
     使用 arXiv API 搜尋相關論文。
@@ -374,9 +554,7 @@ def search_arxiv_papers(keywords_json: str, max_results: int = 5) -> str:
         論文列表的格式化字串
     """
     try:
-        import json
         import arxiv
-        from src.document_processor import DocumentProcessor
         
         # 解析關鍵字
         keywords = json.loads(keywords_json)
@@ -396,36 +574,18 @@ def search_arxiv_papers(keywords_json: str, max_results: int = 5) -> str:
             sort_by=arxiv.SortCriterion.Relevance
         )
         
-        papers = []
-        for paper in search.results():
-            papers.append({
-                "title": paper.title,
-                "authors": [author.name for author in paper.authors],
-                "summary": paper.summary[:500],  # 限制摘要長度
-                "published": str(paper.published),
-                "arxiv_id": paper.entry_id.split('/')[-1],
-                "arxiv_url": paper.entry_id,
-                "pdf_url": paper.pdf_url,
-                "categories": [str(cat) for cat in paper.categories],
-            })
-        
-        if not papers:
+        # 單次遍歷搜尋結果並直接格式化，不建立中間的論文字典
+        entries = [
+            _format_arxiv_paper(i, paper) for i, paper in enumerate(_arxiv_results(search), 1)
+        ]
+        
+        if not entries:
             return "未找到相關論文。"
         
         # 返回格式化的論文列表
-        result_text = f"找到 {len(papers)} 篇相關論文：\n\n"
-        for i, paper in enumerate(papers, 1):
-            result_text += f"{i}. {paper['title']}\n"
-            result_text += f"   arXiv ID: {paper['arxiv_id']}\n"
-            result_text += f"   作者: {', '.join(paper['authors'][:3])}"
-            if len(paper['authors']) > 3:
-                result_text += f" 等 {len(paper['authors'])} 位作者"
-            result_text += "\n"
-            result_text += f"   摘要: {paper['summary']}...\n"
-            result_text += f"   連結: {paper['pdf_url']}\n"
-            result_text += f"   分類: {', '.join(paper['categories'][:3])}\n\n"
-        
-        print(f"   ✅ [arXiv] 成功找到 {len(papers)} 篇論文")
+        result_text = f"找到 {len(entries)} 篇相關論文：\n\n" + "".join(entries)
+        
+        print(f"   ✅ [arXiv] 成功找到 {len(entries)} 篇論文")
         return result_text
         
     except Exception as e:
@@ -447,10 +607,7 @@ def add_arxiv_papers_to_rag(arxiv_ids_json: str, rag_retriever=None) -> str:
         return "RAG 系統未初始化。"
     
     try:
-        import json
         import arxiv
-        import tempfile
-        import os
         from ..rag.private_file_rag import PrivateFileRAG
         
         if not isinstance(rag_retriever, PrivateFileRAG):
@@ -461,29 +618,41 @@ def add_arxiv_papers_to_rag(arxiv_ids_json: str, rag_retriever=None) -> str:
         if not isinstance(arxiv_ids, list) or not arxiv_ids:
             return "無效的 arXiv ID 格式。"
         
+        arxiv_ids = arxiv_ids[:5]  # 限制最多 5 篇
         print(f"   📥 [arXiv] 正在下載 {len(arxiv_ids)} 篇論文...")
         
-        # 下載論文 PDF
-        downloaded_files = []
-        for arxiv_id in arxiv_ids[:5]:  # 限制最多 5 篇
+        # 一次搜尋所有 ID，取得論文資訊（以不含版本號的 ID 為鍵）
+        papers_by_id = {}
+        try:
+            for paper in _arxiv_results(arxiv.Search(id_list=arxiv_ids)):
+                papers_by_id[_ARXIV_VERSION.sub('', paper.get_short_id())] = paper
+        except Exception as e:
+            print(f"   ⚠️ 批次搜尋論文失敗: {e}，改為逐篇搜尋")
+        
+        def _download_one(arxiv_id):
+            """下載單篇論文 PDF 到臨時檔案，成功時返回檔案路徑，否則返回 None。"""
             try:
-                # 搜尋論文
-                search = arxiv.Search(id_list=[arxiv_id])
-                paper = next(search.results(), None)
+                paper = papers_by_id.get(_ARXIV_VERSION.sub('', arxiv_id))
+                if paper is None:
+                    paper = next(iter(_arxiv_results(arxiv.Search(id_list=[arxiv_id]))), None)
                 
                 if not paper:
                     print(f"   ⚠️ 找不到論文 {arxiv_id}")
-                    continue
+                    return None
                 
                 # 下載 PDF 到臨時檔案
                 with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
                     paper.download_pdf(dirpath=os.path.dirname(tmp_file.name), filename=os.path.basename(tmp_file.name))
-                    downloaded_files.append(tmp_file.name)
-                    print(f"   ✓ 已下載論文 {arxiv_id}: {paper.title[:50]}...")
+                print(f"   ✓ 已下載論文 {arxiv_id}: {paper.title[:50]}...")
+                return tmp_file.name
                     
             except Exception as e:
                 print(f"   ⚠️ 下載論文 {arxiv_id} 失敗: {e}")
-                continue
+                return None
+        
+        # 並行下載論文 PDF（網路 I/O 為主，使用執行緒池；逐篇補查的 API 查詢仍依序執行）
+        with ThreadPoolExecutor(max_workers=min(len(arxiv_ids), _ARXIV_DOWNLOAD_WORKERS)) as executor:
+            downloaded_files = [path for path in executor.map(_download_one, arxiv_ids) if path]
         
         if not downloaded_files:
             return "未能下載任何論文。"
@@ -514,73 +683,12 @@ def get_tools_list(rag_retriever=None):
     獲取工具列表
     注意：部分工具需要 rag_retriever，所以需要動態創建
     """
-    # 創建帶有 rag_retriever 的工具包裝器
-    if rag_retriever:
-        def query_pdf_wrapper(query: str) -> str:
-            """
-            查詢 PDF 知識庫中的相關資訊。
-            當問題涉及論文內容、研究概念、方法論或學術理論時使用此工具。
-            支持多文件檢索和進階 RAG 方法。
-            
-            Args:
-                query: 查詢問題
-            
-            Returns:
-                基於 PDF 知識庫的回答
-            """
-            return query_pdf_knowledge(query, rag_retriever=rag_retriever)
-        
-        def extract_keywords_wrapper(query: str) -> str:
-            """
-            從 PDF 知識庫中提取學術關鍵字，用於 arXiv 搜尋。
-            當需要查找相關學術論文時使用此工具。
-            
-            Args:
-                query: 查詢問題
-            
-            Returns:
-                關鍵字 JSON 陣列字串
-            """
-            return extract_keywords_from_pdf(query, rag_retriever=rag_retriever)
-        
-        def add_arxiv_papers_wrapper(arxiv_ids_json: str) -> str:
-            """
-            下載 arXiv 論文並添加到 RAG 系統中。
-            
-            Args:
-                arxiv_ids_json: arXiv ID 的 JSON 陣列字串
-            
-            Returns:
-                添加結果的狀態資訊
-            """
-            return add_arxiv_papers_to_rag(arxiv_ids_json, rag_retriever=rag_retriever)
-        
-        # 創建工具
-        pdf_tool = tool(query_pdf_wrapper)
-        pdf_tool.name = "query_pdf_knowledge"
-        
-        keywords_tool = tool(extract_keywords_wrapper)
-        keywords_tool.name = "extract_keywords_from_pdf"
-        
-        arxiv_search_tool = tool(search_arxiv_papers)
-        arxiv_search_tool.name = "search_arxiv_papers"
-        
-        add_papers_tool = tool(add_arxiv_papers_wrapper)
-        add_papers_tool.name = "add_arxiv_papers_to_rag"
-        
-        analyze_tool = _get_analyze_image_tool()
-        return [
-            get_company_deep_info,
-            search_web,
-            pdf_tool,
-            keywords_tool,
-            arxiv_search_tool,
-            add_papers_tool,
-            analyze_tool,
-        ]
-    else:
-        analyze_tool = _get_analyze_image_tool()
-        return [get_company_deep_info, search_web, analyze_tool]
+    return [
+        get_company_deep_info,
+        search_web,
+        *_make_pdf_arxiv_tools(rag_retriever),
+        _get_analyze_image_tool(),
+    ]
 
 
 def _make_pdf_arxiv_tools(rag_retriever):
@@ -2,23 +2,44 @@
 Calendar 工具
 提供行事曆事件管理功能（使用 Google Calendar API）
 """
-import os
+import logging
 import re
 from datetime import datetime, timedelta
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
-from googleapiclient.errors import HttpError
 from langchain_core.tools import tool
 
+from ._google_auth import build_resource
 from ..config import (
     CALENDAR_CREDENTIALS_FILE,
     CALENDAR_TOKEN_FILE,
     CALENDAR_SCOPES,
-    GMAIL_SCOPES
+    GMAIL_SCOPES,
+    GMAIL_TOKEN_FILE,
+    GOOGLE_SHARED_TOKEN_FILE,
 )
 
+logger = logging.getLogger(__name__)
+
+# Calendar 只請求自己的 scopes（token 文件更小、刷新時只換發需要的權限）；
+# 只有在設定成與 Gmail 共用同一個 token 文件時，才需要請求合併後的 scopes
+# 在匯入時計算一次並排序，確保每次傳給 google-auth 的順序一致，也讓快取鍵保持穩定
+_CALENDAR_TOKEN_SCOPES: tuple[str, ...] = tuple(sorted(
+    set(CALENDAR_SCOPES) | set(GMAIL_SCOPES) if CALENDAR_TOKEN_FILE == GMAIL_TOKEN_FILE else set(CALENDAR_SCOPES)
+))
+
+# Calendar API 單次批次請求最多可包含的子請求數
+_CALENDAR_BATCH_LIMIT = 50
+
+# 郵箱正則表達式（基本驗證）
+_EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+# Gmail 用戶名模式（只包含字母、數字、點、下劃線、加號、減號，且沒有 @ 符號）
+_GMAIL_USER_RE = re.compile(r'^[a-zA-Z0-9._+-]+$')
+# 郵箱分隔符（支援逗號、分號、空格分隔）
+_SPLIT_RE = re.compile(r'[,;\s]+')
+# 從 "John <john@example.com>" 這類字串中提取郵箱
+_EXTRACT_RE = re.compile(r'[\w\.-]+@[\w\.-]+\.\w+')
+# 需要移除的引號和空白
+_STRIP_CHARS = '"\' '
+
 
 def validate_and_clean_emails(attendees_str: str) -> list[str]:
     """
@@ -34,42 +55,31 @@ def validate_and_clean_emails(attendees_str: str) -> list[str]:
     if not attendees_str or not attendees_str.strip():
         return []
     
-    # 郵箱正則表達式（基本驗證）
-    email_pattern = re.compile(
-        r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    )
-    
-    # Gmail 用戶名模式（只包含字母、數字、點、下劃線、加號、減號，且沒有 @ 符號）
-    gmail_username_pattern = re.compile(
-        r'^[a-zA-Z0-9._+-]+$'
-    )
-    
     valid_emails = []
-    # 分割郵箱（支援逗號、分號、空格分隔）
-    emails = re.split(r'[,;\s]+', attendees_str.strip())
+    # 大量參與者時迴圈是熱點：把方法綁定為區域變數，避免每次迭代的屬性查找
+    append = valid_emails.append
+    is_email = _EMAIL_RE.match
     
-    for email in emails:
-        email = email.strip()
+    # 分割郵箱（支援逗號、分號、空格分隔），分割後的片段不含空白，只需移除可能的引號
+    for email in _SPLIT_RE.split(attendees_str.strip()):
+        email = email.strip(_STRIP_CHARS)
         if not email:
             continue
         
-        # 移除可能的引號
-        email = email.strip('"').strip("'").strip()
-        
-        # 驗證郵箱格式
-        if email_pattern.match(email):
-            valid_emails.append(email)
+        # 驗證郵箱格式（絕大多數輸入走這條快速路徑）
+        if is_email(email):
+            append(email)
         else:
             # 如果格式不正確，嘗試提取郵箱（例如從 "John <john@example.com>" 中提取）
-            email_match = re.search(r'[\w\.-]+@[\w\.-]+\.\w+', email)
+            email_match = _EXTRACT_RE.search(email)
             if email_match:
-                valid_emails.append(email_match.group())
+                append(email_match.group())
             # 如果看起來像 Gmail 用戶名（沒有 @ 符號，且符合用戶名格式），自動補全 @gmail.com
-            elif '@' not in email and gmail_username_pattern.match(email):
+            elif '@' not in email and _GMAIL_USER_RE.match(email):
                 # 自動補全為 Gmail 郵箱
                 gmail_email = f"{email}@gmail.com"
-                valid_emails.append(gmail_email)
-                print(f"ℹ️ 自動將用戶名 '{email}' 補全為 '{gmail_email}'")
+                append(gmail_email)
+                logger.info("自動將用戶名 '%s' 補全為 '%s'", email, gmail_email)
     
     return valid_emails
 
@@ -78,55 +88,65 @@ def get_calendar_service():
     """
     獲取 Google Calendar API 服務實例
     
+    憑證和服務對象由 _google_auth 統一快取和刷新；與 Gmail 共用同一個 token 文件時也共用同一個憑證。
+    
     Returns:
         Calendar API 服務對象
     """
-    creds = None
+    return build_resource(
+        'calendar',
+        'v3',
+        _CALENDAR_TOKEN_SCOPES,
+        CALENDAR_TOKEN_FILE,
+        lambda: (CALENDAR_CREDENTIALS_FILE, None),
+        tag='Calendar',
+        migrate_from=GOOGLE_SHARED_TOKEN_FILE,
+        missing_credentials_hint=f"請將憑證文件命名為 {CALENDAR_CREDENTIALS_FILE}。",
+    )
+
+
+def create_calendar_events_bulk(events: list[dict], service=None) -> list:
+    """
+    批次創建多個行事曆事件
     
-    # 合併 Gmail 和 Calendar 的 scopes（因為共用同一個 token.json）
-    # 使用 set 去重，確保 scopes 唯一
-    combined_scopes = list(set(CALENDAR_SCOPES + GMAIL_SCOPES))
+    多個事件會透過 BatchHttpRequest 合併成一次 HTTP 請求（每批最多 50 個，這是 Calendar API 的上限）；
+    只有一個事件時直接呼叫 insert，省去 multipart 批次請求的額外開銷。
     
-    # 檢查是否存在 token.json（儲存使用者的存取令牌）
-    if os.path.exists(CALENDAR_TOKEN_FILE):
-        try:
-            creds = Credentials.from_authorized_user_file(CALENDAR_TOKEN_FILE, combined_scopes)
-        except Exception as e:
-            print(f"⚠️ 讀取 token.json 時發生錯誤：{e}")
-            creds = None
+    Args:
+        events: Calendar API 的事件對象列表
+        service: Calendar API 服務對象（可選，預設使用 get_calendar_service()）
     
-    # 如果沒有憑證或憑證過期，則進行登入
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            # 嘗試刷新令牌
-            try:
-                creds.refresh(Request())
-            except Exception as e:
-                print(f"⚠️ 刷新令牌時發生錯誤：{e}")
-                creds = None
-        
-        # 如果仍然沒有有效憑證，需要重新授權
-        if not creds:
-            if not os.path.exists(CALENDAR_CREDENTIALS_FILE):
-                raise FileNotFoundError(
-                    f"❌ 找不到憑證文件 {CALENDAR_CREDENTIALS_FILE}。\n"
-                    "請從 Google Cloud Console 下載 OAuth2 憑證文件並命名為 credentials.json。"
-                )
-            
-            # 使用合併的 scopes 進行授權，這樣 token.json 會包含兩個權限
-            print(f"🔐 [Calendar] 正在請求授權，權限範圍：{combined_scopes}")
-            flow = InstalledAppFlow.from_client_secrets_file(CALENDAR_CREDENTIALS_FILE, combined_scopes)
-            creds = flow.run_local_server(port=0)
-        
-        # 儲存憑證以供下次使用
+    Returns:
+        與 events 順序對應的結果列表：成功時為 API 返回的事件對象，失敗時為對應的 HttpError
+    """
+    from googleapiclient.errors import HttpError
+    
+    if not events:
+        return []
+    if service is None:
+        service = get_calendar_service()
+    
+    if len(events) == 1:
         try:
-            with open(CALENDAR_TOKEN_FILE, 'w') as token:
-                token.write(creds.to_json())
-            print(f"✅ [Calendar] 憑證已保存，包含的權限：{creds.scopes if hasattr(creds, 'scopes') else 'N/A'}")
-        except Exception as e:
-            print(f"⚠️ 儲存 token.json 時發生錯誤：{e}")
+            return [service.events().insert(calendarId='primary', body=events[0], sendUpdates='all').execute()]
+        except HttpError as error:
+            return [error]
+    
+    results = [None] * len(events)
+    
+    def _callback(request_id, response, exception):
+        results[int(request_id)] = exception if exception is not None else response
+    
+    for start in range(0, len(events), _CALENDAR_BATCH_LIMIT):
+        batch = service.new_batch_http_request(callback=_callback)
+        for index in range(start, min(start + _CALENDAR_BATCH_LIMIT, len(events))):
+            batch.add(
+                service.events().insert(calendarId='primary', body=events[index], sendUpdates='all'),
+                request_id=str(index)
+            )
+        batch.execute()
     
-    return build('calendar', 'v3', credentials=creds)
+    return results
 
 
 @tool
@@ -154,6 +174,8 @@ def create_calendar_event(
     Returns:
         創建結果消息，包含事件連結
     """
+    from googleapiclient.errors import HttpError
+    
     try:
         service = get_calendar_service()
         
@@ -183,7 +205,7 @@ def create_calendar_event(
                 event['attendees'] = [{'email': email} for email in attendee_list]
             else:
                 # 如果所有郵箱都無效，記錄警告但不添加 attendees
-                print(f"⚠️ 警告：未找到有效的參與者郵箱，已跳過參與者設定。原始輸入：{attendees}")
+                logger.warning("未找到有效的參與者郵箱，已跳過參與者設定。原始輸入：%s", attendees)
         
         # 設置提醒
         event['reminders'] = {
@@ -195,7 +217,9 @@ def create_calendar_event(
         }
         
         # 創建事件
-        event_result = service.events().insert(calendarId='primary', body=event, sendUpdates='all').execute()
+        event_result = create_calendar_events_bulk([event], service=service)[0]
+        if isinstance(event_result, HttpError):
+            raise event_result
         
         event_link = event_result.get('htmlLink', '')
         event_id = event_result.get('id', '')
@@ -222,13 +246,11 @@ def create_calendar_event(
         return str(e)
     except HttpError as error:
         error_msg = f"❌ 創建行事曆事件時發生錯誤：{error}"
-        print(f"Calendar Tool 錯誤：{error}")
+        logger.error("Calendar Tool 錯誤：%s", error)
         return error_msg
     except Exception as e:
         error_msg = f"❌ 創建行事曆事件時發生錯誤：{str(e)}"
-        print(f"Calendar Tool 錯誤：{e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Calendar Tool 錯誤：%s", e)
         return error_msg
 
 
@@ -259,6 +281,8 @@ def update_calendar_event(
     Returns:
         更新結果消息
     """
+    from googleapiclient.errors import HttpError
+    
     try:
         service = get_calendar_service()
         
@@ -290,7 +314,7 @@ def update_calendar_event(
                     event['attendees'] = [{'email': email} for email in attendee_list]
                 else:
                     # 如果所有郵箱都無效，記錄警告但不添加 attendees
-                    print(f"⚠️ 警告：未找到有效的參與者郵箱，已跳過參與者設定。原始輸入：{attendees}")
+                    logger.warning("未找到有效的參與者郵箱，已跳過參與者設定。原始輸入：%s", attendees)
                     event['attendees'] = []
             else:
                 event['attendees'] = []
@@ -316,13 +340,11 @@ def update_calendar_event(
         if error.resp.status == 404:
             return f"❌ 找不到事件 ID：{event_id}，請確認事件是否存在"
         error_msg = f"❌ 更新行事曆事件時發生錯誤：{error}"
-        print(f"Calendar Tool 錯誤：{error}")
+        logger.error("Calendar Tool 錯誤：%s", error)
         return error_msg
     except Exception as e:
         error_msg = f"❌ 更新行事曆事件時發生錯誤：{str(e)}"
-        print(f"Calendar Tool 錯誤：{e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Calendar Tool 錯誤：%s", e)
         return error_msg
 
 
@@ -337,6 +359,8 @@ def delete_calendar_event(event_id: str) -> str:
     Returns:
         刪除結果消息
     """
+    from googleapiclient.errors import HttpError
+    
     try:
         service = get_calendar_service()
         
@@ -349,16 +373,24 @@ def delete_calendar_event(event_id: str) -> str:
         if error.resp.status == 404:
             return f"❌ 找不到事件 ID：{event_id}，請確認事件是否存在"
         error_msg = f"❌ 刪除行事曆事件時發生錯誤：{error}"
-        print(f"Calendar Tool 錯誤：{error}")
+        logger.error("Calendar Tool 錯誤：%s", error)
         return error_msg
     except Exception as e:
         error_msg = f"❌ 刪除行事曆事件時發生錯誤：{str(e)}"
-        print(f"Calendar Tool 錯誤：{e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Calendar Tool 錯誤：%s", e)
         return error_msg
 
 
+def _format_event_item(event: dict) -> str:
+    """將單一事件格式化為列表項目（標題、時間、ID）"""
+    start = event['start']
+    return (
+        f"- **{event.get('summary', '無標題')}**\n"
+        f"  時間：{start.get('dateTime') or start.get('date')}\n"
+        f"  ID：{event.get('id', 'N/A')}\n"
+    )
+
+
 @tool
 def list_calendar_events(
     max_results: int = 10,
@@ -397,23 +429,11 @@ def list_calendar_events(
         if not events:
             return "📅 目前沒有找到任何行事曆事件"
         
-        result_lines = [f"📅 找到 {len(events)} 個事件：\n"]
-        for event in events:
-            start = event['start'].get('dateTime', event['start'].get('date'))
-            summary = event.get('summary', '無標題')
-            event_id = event.get('id', 'N/A')
-            result_lines.append(
-                f"- **{summary}**\n"
-                f"  時間：{start}\n"
-                f"  ID：{event_id}\n"
-            )
-        
-        return "\n".join(result_lines)
+        body = "\n".join(_format_event_item(event) for event in events)
+        return f"📅 找到 {len(events)} 個事件：\n\n{body}"
         
     except Exception as e:
         error_msg = f"❌ 列出行事曆事件時發生錯誤：{str(e)}"
-        print(f"Calendar Tool 錯誤：{e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Calendar Tool 錯誤：%s", e)
         return error_msg
 
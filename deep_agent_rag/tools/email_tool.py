@@ -2,23 +2,45 @@
 Email 工具
 提供郵件發送功能（使用 Gmail API）
 """
+import logging
 import os
+import re
 import base64
+import functools
+import time
+from email.generator import BytesGenerator
 from email.message import EmailMessage
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
+from io import BytesIO
 from langchain_core.tools import tool
 
+from ._google_auth import build_resource
 from ..config import (
     EMAIL_SENDER,
     GMAIL_CREDENTIALS_FILE,
     GMAIL_TOKEN_FILE,
     GMAIL_SCOPES,
     CALENDAR_SCOPES,
+    CALENDAR_TOKEN_FILE,
+    GOOGLE_SHARED_TOKEN_FILE,
 )
 
+logger = logging.getLogger(__name__)
+
+# Gmail 只請求自己的 scopes（token 文件更小、刷新時只換發需要的權限）；
+# 只有在 token 文件與 Calendar 共用時，才需要請求合併後的 scopes
+# 在匯入時計算一次並排序，確保每次傳給 google-auth 的順序一致，也讓快取鍵保持穩定
+_GMAIL_ONLY_SCOPES: tuple[str, ...] = tuple(sorted(set(GMAIL_SCOPES)))
+_COMBINED_SCOPES: tuple[str, ...] = tuple(sorted(set(GMAIL_SCOPES) | set(CALENDAR_SCOPES)))
+
+# RFC 5322 規定每行（不含 CRLF）最多 998 個字元
+_MAX_LINE_LENGTH = 998
+
+# 收件人郵箱格式：恰好一個 @，@ 前後都有內容，且域名包含點
+_ADDR_RE = re.compile(r'[^@\s]+@[^@\s]+\.[^@\s]+')
+
+# 憑證文件是否存在的檢查結果只快取 5 分鐘，讓執行中新增的憑證文件也能被使用
+_CREDENTIALS_LOOKUP_TTL = 300
+
 
 def is_gmail_address(email: str) -> bool:
     """
@@ -30,14 +52,12 @@ def is_gmail_address(email: str) -> bool:
     Returns:
         如果是 Gmail 郵箱則返回 True，否則返回 False
     """
-    if not email or not email.strip():
+    if not email:
         return False
     
-    email = email.strip().lower()
-    
     # 檢查是否為 Gmail 郵箱（@gmail.com 或 @googlemail.com）
-    gmail_domains = ['@gmail.com', '@googlemail.com']
-    return any(email.endswith(domain) for domain in gmail_domains)
+    email = email.strip().lower()
+    return email.endswith('@gmail.com') or email.endswith('@googlemail.com')
 
 
 def is_valid_email(email: str) -> bool:
@@ -50,51 +70,46 @@ def is_valid_email(email: str) -> bool:
     Returns:
         如果郵箱格式有效則返回 True，否則返回 False
     """
-    if not email or not email.strip():
+    if not email:
         return False
     
     email = email.strip()
     
-    # 簡單的郵箱格式驗證：必須包含 @ 符號，且 @ 前後都有內容
-    if '@' not in email:
-        return False
-    
-    parts = email.split('@')
-    if len(parts) != 2:
+    # 簡單的郵箱格式驗證：必須恰好包含一個 @ 符號，且 @ 前有內容
+    at = email.find('@')
+    if at <= 0 or email.find('@', at + 1) != -1:
         return False
     
-    local_part, domain = parts
-    if not local_part or not domain:
-        return False
-    
-    # 檢查域名部分是否包含點（基本驗證）
-    if '.' not in domain:
-        return False
-    
-    return True
+    # 檢查域名部分是否包含點（基本驗證，同時保證 @ 後有內容）
+    return '.' in email[at + 1:]
 
 
 def parse_recipients(recipient_string: str) -> list[str]:
     """
-    解析收件人字符串，支援逗號分隔的多個郵箱
+    解析收件人字符串，支援逗號分隔的多個郵箱，並去除重複的收件人
     
     Args:
         recipient_string: 收件人字符串，可以是單個郵箱或多個用逗號分隔的郵箱
     
     Returns:
-        收件人郵箱列表
+        收件人郵箱列表（已去重）
     """
     if not recipient_string or not recipient_string.strip():
         return []
     
-    # 按逗號分割，並清理每個郵箱地址
-    recipients = [email.strip() for email in recipient_string.split(',')]
-    # 過濾掉空字符串
-    recipients = [email for email in recipients if email]
+    # 按逗號分割，清理每個郵箱地址並過濾掉空字符串
+    # 同時去除重複的收件人（不區分大小寫），保留第一次出現的寫法和順序
+    seen = set()
+    recipients = []
+    for email in (part.strip() for part in recipient_string.split(',')):
+        key = email.lower()
+        if email and key not in seen:
+            seen.add(key)
+            recipients.append(email)
     return recipients
 
 
-def get_credentials_for_email(email: str) -> str:
+def get_credentials_for_email(email: str) -> tuple[str, bool]:
     """
     根據郵箱地址獲取對應的憑證文件路徑
     
@@ -102,26 +117,39 @@ def get_credentials_for_email(email: str) -> str:
         email: 郵箱地址
     
     Returns:
-        憑證文件路徑
+        (憑證文件路徑, 文件是否存在)，讓呼叫方不需要再次檢查文件
     """
-    if not email:
-        return GMAIL_CREDENTIALS_FILE
-    
-    # 從郵箱地址提取用戶名部分（例如：user@gmail.com -> user）
-    email_username = email.split("@")[0].lower()
+    time_bucket = int(time.monotonic() // _CREDENTIALS_LOOKUP_TTL)
+    
+    if email:
+        # 從郵箱地址提取用戶名部分（例如：user@gmail.com -> user）
+        # 構建憑證文件路徑：credentials_{username}.json
+        credentials_file = f"credentials_{email.partition('@')[0].lower()}.json"
+        # 如果對應的憑證文件存在，使用它
+        if _file_exists(credentials_file, time_bucket):
+            return credentials_file, True
+    
+    # 否則使用預設憑證文件
+    # 這允許使用者共用同一個 OAuth2 應用程式但使用不同的 token
+    return GMAIL_CREDENTIALS_FILE, _file_exists(GMAIL_CREDENTIALS_FILE, time_bucket)
+
+
+@functools.lru_cache(maxsize=128)
+def _file_exists(path: str, time_bucket: int) -> bool:
+    """
+    檢查文件是否存在（依時間區間快取）
     
-    # 構建憑證文件路徑：credentials_{username}.json
-    credentials_file = f"credentials_{email_username}.json"
+    Args:
+        path: 文件路徑
+        time_bucket: 時間區間編號，只用作快取鍵，區間改變時重新檢查文件
     
-    # 如果對應的憑證文件存在，使用它；否則使用預設憑證文件
-    if os.path.exists(credentials_file):
-        return credentials_file
-    else:
-        # 如果找不到對應的憑證文件，返回預設憑證文件
-        # 這允許使用者共用同一個 OAuth2 應用程式但使用不同的 token
-        return GMAIL_CREDENTIALS_FILE
+    Returns:
+        文件是否存在
+    """
+    return os.path.exists(path)
 
 
+@functools.lru_cache(maxsize=128)
 def get_token_for_email(email: str) -> str:
     """
     根據郵箱地址獲取對應的 token 文件路徑
@@ -136,12 +164,10 @@ def get_token_for_email(email: str) -> str:
         return GMAIL_TOKEN_FILE
     
     # 從郵箱地址提取用戶名部分
-    email_username = email.split("@")[0].lower()
+    email_username = email.partition("@")[0].lower()
     
     # 構建 token 文件路徑：token_{username}.json
-    token_file = f"token_{email_username}.json"
-    
-    return token_file
+    return f"token_{email_username}.json"
 
 
 def validate_recipients(recipients: list[str]) -> tuple[bool, str]:
@@ -157,10 +183,8 @@ def validate_recipients(recipients: list[str]) -> tuple[bool, str]:
     if not recipients:
         return False, "❌ 請至少輸入一個收件人郵箱地址"
     
-    invalid_emails = []
-    for email in recipients:
-        if not is_valid_email(email):
-            invalid_emails.append(email)
+    # parse_recipients 已去除空白，直接用正則整串匹配
+    invalid_emails = [email for email in recipients if not _ADDR_RE.fullmatch(email)]
     
     if invalid_emails:
         return False, (
@@ -176,73 +200,108 @@ def get_gmail_service(sender_email: str = None):
     """
     獲取 Gmail API 服務實例
     
+    憑證和服務對象由 _google_auth 統一快取和刷新；與 Calendar 共用同一個 token 文件時也共用同一個憑證。
+    
     Args:
         sender_email: 發件人郵箱地址（可選），用於選擇對應的憑證和 token 文件
     
     Returns:
         Gmail API 服務對象
     """
-    creds = None
+    # 根據發件人郵箱選擇對應的 token 文件（未指定發件人時使用預設配置，向後兼容）
+    token_file = get_token_for_email(sender_email) if sender_email else GMAIL_TOKEN_FILE
+    scopes = _COMBINED_SCOPES if token_file == CALENDAR_TOKEN_FILE else _GMAIL_ONLY_SCOPES
+    
+    def resolve_credentials_file() -> tuple[str, bool]:
+        # 只有在需要重新讀取憑證時才查找對應的憑證文件
+        credentials_file, credentials_exists = get_credentials_for_email(sender_email)
+        if sender_email:
+            logger.info(
+                "[Gmail] 使用發件人：%s（憑證文件：%s，Token 文件：%s）",
+                sender_email, credentials_file, token_file
+            )
+        return credentials_file, credentials_exists
     
-    # 根據發件人郵箱選擇對應的憑證和 token 文件
+    missing_credentials_hint = f"請將憑證文件命名為 {GMAIL_CREDENTIALS_FILE}。"
     if sender_email:
-        credentials_file = get_credentials_for_email(sender_email)
-        token_file = get_token_for_email(sender_email)
-        print(f"🔐 [Gmail] 使用發件人：{sender_email}")
-        print(f"   📁 憑證文件：{credentials_file}")
-        print(f"   📁 Token 文件：{token_file}")
-    else:
-        # 使用預設配置（向後兼容）
-        credentials_file = GMAIL_CREDENTIALS_FILE
-        token_file = GMAIL_TOKEN_FILE
-    
-    # 合併 Gmail 和 Calendar 的 scopes（因為共用同一個 token.json）
-    # 使用 set 去重，確保 scopes 唯一
-    combined_scopes = list(set(GMAIL_SCOPES + CALENDAR_SCOPES))
-    
-    # 檢查是否存在 token 文件（儲存使用者的存取令牌）
-    if os.path.exists(token_file):
-        try:
-            creds = Credentials.from_authorized_user_file(token_file, combined_scopes)
-        except Exception as e:
-            print(f"⚠️ 讀取 {token_file} 時發生錯誤：{e}")
-            creds = None
-    
-    # 如果沒有憑證或憑證過期，則進行登入
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            # 嘗試刷新令牌
-            try:
-                creds.refresh(Request())
-            except Exception as e:
-                print(f"⚠️ 刷新令牌時發生錯誤：{e}")
-                creds = None
-        
-        # 如果仍然沒有有效憑證，需要重新授權
-        if not creds:
-            if not os.path.exists(credentials_file):
-                raise FileNotFoundError(
-                    f"❌ 找不到憑證文件 {credentials_file}。\n"
-                    f"請從 Google Cloud Console 下載 OAuth2 憑證文件。\n"
-                    f"如果這是新使用者，請將憑證文件命名為 {credentials_file} 或使用預設的 {GMAIL_CREDENTIALS_FILE}。"
-                )
-            
-            # 使用合併的 scopes 進行授權，這樣 token 文件會包含兩個權限
-            print(f"🔐 [Gmail] 正在請求授權，權限範圍：{combined_scopes}")
-            if sender_email:
-                print(f"   👤 請選擇帳號：{sender_email}")
-            flow = InstalledAppFlow.from_client_secrets_file(credentials_file, combined_scopes)
-            creds = flow.run_local_server(port=0)
-        
-        # 儲存憑證以供下次使用
-        try:
-            with open(token_file, 'w') as token:
-                token.write(creds.to_json())
-            print(f"✅ [Gmail] 憑證已保存到 {token_file}，包含的權限：{creds.scopes if hasattr(creds, 'scopes') else 'N/A'}")
-        except Exception as e:
-            print(f"⚠️ 儲存 {token_file} 時發生錯誤：{e}")
+        missing_credentials_hint = (
+            f"如果這是新使用者，請將憑證文件命名為 credentials_{sender_email.partition('@')[0].lower()}.json "
+            f"或使用預設的 {GMAIL_CREDENTIALS_FILE}。"
+        )
     
-    return build('gmail', 'v1', credentials=creds)
+    return build_resource(
+        'gmail',
+        'v1',
+        scopes,
+        token_file,
+        resolve_credentials_file,
+        tag='Gmail',
+        # 只有預設 token 文件會從共用文件遷移；各發件人專屬的 token 屬於不同帳號，不能沿用
+        migrate_from=GOOGLE_SHARED_TOKEN_FILE if token_file == GMAIL_TOKEN_FILE else None,
+        account_hint=sender_email,
+        missing_credentials_hint=missing_credentials_hint,
+    )
+
+
+def _encode_message(message: EmailMessage) -> str:
+    """
+    將郵件序列化並編碼為 Gmail API 需要的 base64url 字串
+    
+    直接把郵件寫進 BytesIO，再從其緩衝區（零複製的 memoryview）編碼，
+    避免 as_bytes() 額外產生一份完整的 bytes 副本。
+    
+    Args:
+        message: 郵件消息
+    
+    Returns:
+        base64url 編碼後的郵件內容
+    """
+    buf = BytesIO()
+    BytesGenerator(buf, mangle_from_=False, policy=message.policy).flatten(message)
+    return base64.urlsafe_b64encode(buf.getbuffer()).decode('ascii')
+
+
+def _build_raw(recipient: str, sender: str, subject: str, body: str) -> str:
+    """
+    構建純文字郵件並編碼為 Gmail API 需要的 base64url 字串
+    
+    全部內容都是 ASCII 且不需要折行時，直接組出 RFC 5322 格式的郵件，
+    跳過 EmailMessage 的 policy 處理與標頭折行；其餘情況（中文主旨、超長行等）交給 EmailMessage 正確編碼。
+    
+    Args:
+        recipient: 收件人（多個用逗號分隔）
+        sender: 發件人郵箱地址
+        subject: 郵件主題
+        body: 郵件正文內容
+    
+    Returns:
+        base64url 編碼後的郵件內容
+    """
+    headers = (('To', recipient), ('From', sender), ('Subject', subject))
+    body_lines = body.splitlines()
+    if (
+        all(value.isascii() and '\r' not in value and '\n' not in value
+            and len(name) + 2 + len(value) <= _MAX_LINE_LENGTH
+            for name, value in headers)
+        and body.isascii()
+        and all(len(line) <= _MAX_LINE_LENGTH for line in body_lines)
+    ):
+        raw = ''.join(f"{name}: {value}\r\n" for name, value in headers)
+        raw += (
+            "MIME-Version: 1.0\r\n"
+            "Content-Type: text/plain; charset=\"us-ascii\"\r\n"
+            "Content-Transfer-Encoding: 7bit\r\n"
+            "\r\n"
+        )
+        raw += '\r\n'.join(body_lines) + '\r\n'
+        return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+    
+    message = EmailMessage()
+    message.set_content(body)
+    message['To'] = recipient
+    message['From'] = sender
+    message['Subject'] = subject
+    return _encode_message(message)
 
 
 @tool
@@ -283,16 +342,8 @@ def send_email(recipient: str, subject: str, body: str, sender: str = None) -> s
         # 獲取 Gmail API 服務（使用對應的發件人憑證）
         service = get_gmail_service(actual_sender)
         
-        # 創建郵件消息
-        message = EmailMessage()
-        message.set_content(body)
-        # 使用逗號分隔的多個收件人
-        message['To'] = ', '.join(recipients)
-        message['From'] = actual_sender
-        message['Subject'] = subject
-        
-        # 必須將郵件編碼為 base64url 格式
-        encoded_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
+        # 創建郵件消息並編碼為 base64url 格式（使用逗號分隔的多個收件人）
+        encoded_message = _build_raw(', '.join(recipients), actual_sender, subject, body)
         
         create_message = {
             'raw': encoded_message
@@ -321,12 +372,12 @@ def send_email(recipient: str, subject: str, body: str, sender: str = None) -> s
             if 'insufficient authentication scopes' in error_msg.lower():
                 return (
                     "❌ 錯誤：認證權限不足。\n"
-                    "請刪除 token.json 文件並重新授權，確保授予 Gmail 發送郵件的權限。"
+                    f"請刪除 {get_token_for_email(actual_sender)} 文件並重新授權，確保授予 Gmail 發送郵件的權限。"
                 )
             elif 'invalid_grant' in error_msg.lower():
                 return (
                     "❌ 錯誤：令牌已過期或無效。\n"
-                    "請刪除 token.json 文件並重新授權。"
+                    f"請刪除 {get_token_for_email(actual_sender)} 文件並重新授權。"
                 )
             else:
                 return f"❌ 發送郵件時發生錯誤：{error_msg}"
@@ -335,8 +386,6 @@ def send_email(recipient: str, subject: str, body: str, sender: str = None) -> s
         return str(e)
     except Exception as e:
         error_msg = str(e)
-        print(f"Email Tool 錯誤：{e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Email Tool 錯誤：%s", e)
         return f"❌ 創建或發送郵件時發生錯誤：{error_msg}"
 
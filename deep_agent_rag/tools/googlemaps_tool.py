@@ -2,25 +2,203 @@
 Google Maps 工具
 提供地點驗證、標準化、交通時間計算等功能
 """
+import re
+import threading
+import time
 import googlemaps
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Tuple
+from typing import Optional, Dict, List, Tuple
 
 from ..config import NORMAL_GOOGLE_MAPS_API_KEY, USER_HOME_ADDRESS, USER_OFFICE_ADDRESS
 
 
 # 初始化 Google Maps 客戶端
 _gmaps_client = None
+_gmaps_client_lock = threading.Lock()
+
+# HTTP 連線池設定：連續的請求重用同一個 TCP/TLS 連線，並行請求（prefetch_geocodes）也不必各自建立連線
+_GMAPS_POOL_CONNECTIONS = 16
+_GMAPS_POOL_MAXSIZE = 32
+# Google Maps API 請求逾時（秒）
+_GMAPS_TIMEOUT = 5
+
+# 地理編碼 / 地點搜索結果快取：{正規化查詢: (時間戳, 精簡後的結果)}
+# 同一個地址（例如辦公室、常去的地點）會在每個事件中重複查詢，快取可省去 100-500ms 的網路往返
+_GEOCODE_CACHE_TTL = 7 * 24 * 3600  # 秒，地址對應的座標很少變動
+_PLACES_CACHE_TTL = 24 * 3600  # 秒，地點搜索結果（營業狀態、評分）變動較快
+_MAPS_CACHE_MAXSIZE = 4096
+_geocode_cache = {}
+_places_cache = {}
+# 附近地點搜索失敗（沒有建議地點或 API 錯誤）的結果短暫快取，避免 agent 重試同一個查詢時反覆呼叫 API
+_NEARBY_FAILURE_CACHE_TTL = 60  # 秒
+_nearby_failure_cache = {}
+_maps_cache_lock = threading.Lock()
+
+# 全形字元轉半形的對照表（全形空白和 ！～ 範圍），讓 "台北　１０１" 與 "台北 101" 使用同一個快取鍵
+_FULLWIDTH_TO_HALFWIDTH = {0x3000: 0x20, **{code: code - 0xFEE0 for code in range(0xFF01, 0xFF5F)}}
+
+# 有效地址至少要包含兩個連續的文字或數字，否則不發送地理編碼請求（例如單一字元或只有標點符號）
+_MIN_ADDRESS_RE = re.compile(r"\w{2,}")
+
+# 用戶預設位置在程序生命週期內不會改變，匯入時計算一次（優先使用辦公室地址，其次為家庭地址）
+_DEFAULT_USER_LOCATION = (
+    (USER_OFFICE_ADDRESS or "").strip()
+    or (USER_HOME_ADDRESS or "").strip()
+    or None
+)
+# 預設位置的座標，第一次地理編碼成功後記住，之後不再查詢
+_DEFAULT_USER_COORDS = None
+
+# 模糊地址關鍵字（"附近"、"周圍"、"附近的"等），編譯成一個正規表達式，一次掃描即可判斷和移除
+# 較長的關鍵字排在前面，確保 "附近的" 整個被移除而不是只移除 "附近"
+_AMBIGUOUS_KEYWORDS = ("附近", "周圍", "附近的", "周邊", "around", "nearby", "near")
+_AMBIGUOUS_KEYWORDS_RE = re.compile(
+    "|".join(re.escape(keyword) for keyword in sorted(_AMBIGUOUS_KEYWORDS, key=len, reverse=True))
+)
+
+# 映射中文地點類型到 Google Places API 的類型
+_PLACE_TYPE_MAPPING = {
+    "餐廳": "restaurant",
+    "咖啡廳": "cafe",
+    "咖啡": "cafe",
+    "咖啡店": "cafe",
+    "會議室": "establishment",
+    "會議": "establishment",
+    "酒店": "lodging",
+    "飯店": "lodging",
+    "購物": "shopping_mall",
+    "商場": "shopping_mall",
+    "超市": "supermarket",
+    "銀行": "bank",
+    "醫院": "hospital",
+    "學校": "school",
+    "公園": "park"
+}
+_PLACE_TYPE_RE = re.compile(
+    "|".join(re.escape(key) for key in sorted(_PLACE_TYPE_MAPPING, key=len, reverse=True))
+)
+
+# 批量豐富地點資訊時同時進行的請求數上限（配合 Google Maps API 的 QPS 配額）
+_ENRICH_CONCURRENCY = 8
 
 
 def get_gmaps_client():
-    """獲取 Google Maps 客戶端實例（單例模式）"""
+    """
+    獲取 Google Maps 客戶端實例（單例模式）
+    
+    客戶端會在執行緒池中被同時使用（prefetch_geocodes），以雙重檢查鎖定確保只建立一次：
+    已建立時只讀取一次全域變數，不需要取得鎖
+    """
     global _gmaps_client
-    if _gmaps_client is None:
-        if not NORMAL_GOOGLE_MAPS_API_KEY:
-            raise ValueError("❌ Google Maps API Key 未設置，請在 .env 文件中設置 NORMAL_GOOGLE_MAPS_API_KEY")
-        _gmaps_client = googlemaps.Client(key=NORMAL_GOOGLE_MAPS_API_KEY)
-    return _gmaps_client
+    client = _gmaps_client
+    if client is not None:
+        return client
+    
+    with _gmaps_client_lock:
+        if _gmaps_client is None:
+            if not NORMAL_GOOGLE_MAPS_API_KEY:
+                raise ValueError("❌ Google Maps API Key 未設置，請在 .env 文件中設置 NORMAL_GOOGLE_MAPS_API_KEY")
+            client = googlemaps.Client(
+                key=NORMAL_GOOGLE_MAPS_API_KEY,
+                timeout=_GMAPS_TIMEOUT,
+                retry_over_query_limit=True,
+            )
+            # 客戶端內部的 requests.Session 預設每個主機只保留 10 個連線，換成較大的連線池
+            adapter = HTTPAdapter(pool_connections=_GMAPS_POOL_CONNECTIONS, pool_maxsize=_GMAPS_POOL_MAXSIZE)
+            client.session.mount("https://", adapter)
+            _gmaps_client = client
+        return _gmaps_client
+
+
+def _normalize_query(query: str) -> str:
+    """正規化查詢字串作為快取鍵：全形轉半形、合併空白並轉為小寫"""
+    return " ".join(query.translate(_FULLWIDTH_TO_HALFWIDTH).split()).lower()
+
+
+def _cache_get(cache: dict, key: str, ttl: int):
+    """從快取取得未過期的值，沒有時返回 None"""
+    with _maps_cache_lock:
+        cached = cache.get(key)
+    if cached and time.time() - cached[0] < ttl:
+        return cached[1]
+    return None
+
+
+def _cache_put(cache: dict, key: str, value, ttl: int) -> None:
+    """寫入快取；超過容量時先清除過期項目，仍然太多則移除最舊的項目"""
+    now = time.time()
+    with _maps_cache_lock:
+        if len(cache) >= _MAPS_CACHE_MAXSIZE:
+            for stale_key in [k for k, (ts, _) in cache.items() if now - ts >= ttl]:
+                del cache[stale_key]
+            if len(cache) >= _MAPS_CACHE_MAXSIZE:
+                del cache[next(iter(cache))]
+        cache[key] = (now, value)
+
+
+def _geocode_cached(address: str) -> list:
+    """
+    地理編碼（帶快取）
+    
+    只保留呼叫方用到的欄位（formatted_address、geometry.location、place_id），結構與 gmaps.geocode() 相同；
+    找不到結果時不寫入快取，之後的查詢仍會重新請求（避免暫時性的空結果被快取一整週）
+    
+    Args:
+        address: 地址字符串
+    
+    Returns:
+        地理編碼結果列表（找不到時為空列表）
+    """
+    key = _normalize_query(address)
+    cached = _cache_get(_geocode_cache, key, _GEOCODE_CACHE_TTL)
+    if cached is not None:
+        return cached
+    
+    geocode_result = [
+        {
+            "formatted_address": item["formatted_address"],
+            "geometry": {"location": item["geometry"]["location"]},
+            "place_id": item.get("place_id", ""),
+        }
+        for item in get_gmaps_client().geocode(address) or []
+    ]
+    if geocode_result:
+        _cache_put(_geocode_cache, key, geocode_result, _GEOCODE_CACHE_TTL)
+    return geocode_result
+
+
+def _places_cached(query: str) -> dict:
+    """
+    Places API 文本搜索（帶快取）
+    
+    只保留呼叫方用到的欄位（name、formatted_address、place_id、rating），結構與 gmaps.places() 相同
+    
+    Args:
+        query: 搜索查詢
+    
+    Returns:
+        包含 'results' 列表的字典
+    """
+    key = _normalize_query(query)
+    cached = _cache_get(_places_cache, key, _PLACES_CACHE_TTL)
+    if cached is not None:
+        return cached
+    
+    places_result = get_gmaps_client().places(query=query, language='zh-TW')
+    trimmed = {
+        "results": [
+            {
+                field: place[field]
+                for field in ("name", "formatted_address", "place_id", "rating")
+                if field in place
+            }
+            for place in places_result.get('results', [])
+        ]
+    }
+    _cache_put(_places_cache, key, trimmed, _PLACES_CACHE_TTL)
+    return trimmed
 
 
 def validate_and_standardize_address(address: str, search_nearby: bool = True) -> Dict[str, any]:
@@ -47,15 +225,19 @@ def validate_and_standardize_address(address: str, search_nearby: bool = True) -
             "error": "地址為空"
         }
     
+    # 明顯無效的地址直接返回，不浪費網路請求和 API 配額
+    if not _MIN_ADDRESS_RE.search(address):
+        return {
+            "success": False,
+            "error": f"地址「{address.strip()}」過短或無效，請提供具體地址、地標名稱或餐廳名稱。"
+        }
+    
     try:
-        gmaps = get_gmaps_client()
-        
         # 檢測是否為模糊地址（包含"附近"、"周圍"、"附近的"等關鍵字）
-        ambiguous_keywords = ["附近", "周圍", "附近的", "周邊", "around", "nearby", "near"]
-        is_ambiguous_query = any(keyword in address for keyword in ambiguous_keywords)
+        is_ambiguous_query = _AMBIGUOUS_KEYWORDS_RE.search(address) is not None
         
-        # 進行地理編碼
-        geocode_result = gmaps.geocode(address)
+        # 進行地理編碼（重複的地址直接使用快取結果）
+        geocode_result = _geocode_cached(address)
         
         if not geocode_result:
             # 如果地址模糊且允許搜索附近，嘗試使用 Places API
@@ -110,19 +292,64 @@ def validate_and_standardize_address(address: str, search_nearby: bool = True) -
         }
 
 
+def _pack_suggestions(places: List[Dict[str, any]], max_results: int) -> List[Dict[str, any]]:
+    """
+    將 Places API 搜索結果轉換為建議地點列表
+    
+    Args:
+        places: Places API 返回的 'results' 列表
+        max_results: 最大返回結果數
+    
+    Returns:
+        建議地點列表，每項包含 name、address、place_id、rating
+    """
+    return [
+        {
+            "name": place.get('name', ''),
+            "address": place.get('formatted_address', ''),
+            "place_id": place.get('place_id', ''),
+            "rating": place.get('rating', 'N/A')
+        }
+        for place in places[:max_results]
+    ]
+
+
 def _search_nearby_places(query: str, max_results: int = 5) -> Dict[str, any]:
     """
     使用 Places API 搜索附近的地點（當地址模糊時）
     
+    沒有找到建議地點的結果會快取 _NEARBY_FAILURE_CACHE_TTL 秒，短時間內重試同一個查詢時直接返回
+    
     Args:
         query: 搜索查詢（例如："附近的餐廳"）
         max_results: 最大返回結果數
     
+    Returns:
+        包含建議地點的字典
+    """
+    cache_key = f"{_normalize_query(query)}|{get_user_default_location()}|{max_results}"
+    cached = _cache_get(_nearby_failure_cache, cache_key, _NEARBY_FAILURE_CACHE_TTL)
+    if cached is not None:
+        return dict(cached)
+    
+    result = _search_nearby_places_uncached(query, max_results)
+    if not result.get("suggestions"):
+        _cache_put(_nearby_failure_cache, cache_key, dict(result), _NEARBY_FAILURE_CACHE_TTL)
+    return result
+
+
+def _search_nearby_places_uncached(query: str, max_results: int) -> Dict[str, any]:
+    """
+    使用 Places API 搜索附近的地點（不經過失敗結果快取）
+    
+    Args:
+        query: 搜索查詢
+        max_results: 最大返回結果數
+    
     Returns:
         包含建議地點的字典
     """
     try:
-        gmaps = get_gmaps_client()
         user_location = get_user_default_location()
         
         if not user_location:
@@ -134,46 +361,20 @@ def _search_nearby_places(query: str, max_results: int = 5) -> Dict[str, any]:
             }
         
         # 先獲取用戶位置的座標
-        user_geocode = gmaps.geocode(user_location)
-        if not user_geocode:
+        user_coords = _get_default_user_coords()
+        if not user_coords:
             return {
                 "success": False,
                 "error": f"無法獲取您的預設位置座標，請檢查 USER_HOME_ADDRESS 或 USER_OFFICE_ADDRESS 設置。",
                 "is_ambiguous": True
             }
         
-        user_coords = user_geocode[0]['geometry']['location']
-        
         # 提取地點類型（例如："附近的餐廳" -> "餐廳"）
-        place_type = query
-        for keyword in ["附近", "周圍", "附近的", "周邊", "around", "nearby", "near"]:
-            place_type = place_type.replace(keyword, "").strip()
-        
-        # 映射中文地點類型到 Google Places API 的類型
-        place_type_mapping = {
-            "餐廳": "restaurant",
-            "咖啡廳": "cafe",
-            "咖啡": "cafe",
-            "咖啡店": "cafe",
-            "會議室": "establishment",
-            "會議": "establishment",
-            "酒店": "lodging",
-            "飯店": "lodging",
-            "購物": "shopping_mall",
-            "商場": "shopping_mall",
-            "超市": "supermarket",
-            "銀行": "bank",
-            "醫院": "hospital",
-            "學校": "school",
-            "公園": "park"
-        }
+        place_type = _AMBIGUOUS_KEYWORDS_RE.sub("", query).strip()
         
-        # 嘗試找到對應的類型
-        api_place_type = None
-        for key, value in place_type_mapping.items():
-            if key in place_type:
-                api_place_type = value
-                break
+        # 嘗試找到對應的 Google Places API 類型
+        match = _PLACE_TYPE_RE.search(place_type)
+        api_place_type = _PLACE_TYPE_MAPPING[match.group()] if match else None
         
         # 使用 Places API 的 text_search 方法搜索附近地點
         # 構建搜索查詢
@@ -181,26 +382,14 @@ def _search_nearby_places(query: str, max_results: int = 5) -> Dict[str, any]:
         
         try:
             # 使用 places 方法進行文本搜索
-            places_result = gmaps.places(
-                query=search_query,
-                language='zh-TW'
-            )
+            places_result = _places_cached(search_query)
             
             if places_result.get('results'):
-                suggestions = []
-                for place in places_result['results'][:max_results]:
-                    suggestions.append({
-                        "name": place.get('name', ''),
-                        "address": place.get('formatted_address', ''),
-                        "place_id": place.get('place_id', ''),
-                        "rating": place.get('rating', 'N/A')
-                    })
-                
                 return {
                     "success": False,  # 標記為失敗，因為需要用戶選擇
                     "error": f"地址「{query}」太模糊，無法確定確切位置。",
                     "is_ambiguous": True,
-                    "suggestions": suggestions,
+                    "suggestions": _pack_suggestions(places_result['results'], max_results),
                     "user_location": user_location
                 }
             else:
@@ -208,26 +397,14 @@ def _search_nearby_places(query: str, max_results: int = 5) -> Dict[str, any]:
                 # 直接使用地點類型名稱搜索
                 simple_query = f"{place_type} {user_location}"
                 try:
-                    simple_result = gmaps.places(
-                        query=simple_query,
-                        language='zh-TW'
-                    )
+                    simple_result = _places_cached(simple_query)
                     
                     if simple_result.get('results'):
-                        suggestions = []
-                        for place in simple_result['results'][:max_results]:
-                            suggestions.append({
-                                "name": place.get('name', ''),
-                                "address": place.get('formatted_address', ''),
-                                "place_id": place.get('place_id', ''),
-                                "rating": place.get('rating', 'N/A')
-                            })
-                        
                         return {
                             "success": False,
                             "error": f"地址「{query}」太模糊，無法確定確切位置。",
                             "is_ambiguous": True,
-                            "suggestions": suggestions,
+                            "suggestions": _pack_suggestions(simple_result['results'], max_results),
                             "user_location": user_location
                         }
                 except Exception:
@@ -338,12 +515,22 @@ def get_user_default_location() -> Optional[str]:
     Returns:
         預設位置地址字符串，如果都沒有設置則返回 None
     """
-    if USER_OFFICE_ADDRESS and USER_OFFICE_ADDRESS.strip():
-        return USER_OFFICE_ADDRESS.strip()
-    elif USER_HOME_ADDRESS and USER_HOME_ADDRESS.strip():
-        return USER_HOME_ADDRESS.strip()
-    else:
-        return None
+    return _DEFAULT_USER_LOCATION
+
+
+def _get_default_user_coords() -> Optional[Dict[str, float]]:
+    """
+    獲取用戶預設位置的座標，第一次地理編碼成功後記住結果
+    
+    Returns:
+        包含 'lat' 和 'lng' 的字典，沒有預設位置或地理編碼失敗時返回 None
+    """
+    global _DEFAULT_USER_COORDS
+    if _DEFAULT_USER_COORDS is None and _DEFAULT_USER_LOCATION:
+        user_geocode = _geocode_cached(_DEFAULT_USER_LOCATION)
+        if user_geocode:
+            _DEFAULT_USER_COORDS = user_geocode[0]['geometry']['location']
+    return _DEFAULT_USER_COORDS
 
 
 def enrich_location_info(location: str, event_datetime: Optional[datetime] = None) -> Dict[str, any]:
@@ -375,33 +562,32 @@ def enrich_location_info(location: str, event_datetime: Optional[datetime] = Non
         error_msg = validation_result.get('error', '地址驗證失敗')
         
         # 如果有建議地點，顯示建議
-        if validation_result.get("suggestions"):
-            suggestions = validation_result["suggestions"]
+        suggestions = validation_result.get("suggestions")
+        if suggestions:
             user_location = validation_result.get("user_location", "您的預設位置")
             
-            suggestion_text = f"⚠️ {error_msg}\n\n💡 **基於「{user_location}」附近的建議地點：**\n"
+            parts = [f"⚠️ {error_msg}\n\n💡 **基於「{user_location}」附近的建議地點：**\n"]
             for i, place in enumerate(suggestions, 1):
                 rating = place.get('rating', 'N/A')
-                suggestion_text += f"{i}. **{place['name']}** - {place['address']}"
-                if rating != 'N/A':
-                    suggestion_text += f" (評分: {rating}⭐)"
-                suggestion_text += "\n"
-            suggestion_text += "\n💡 請在事件地點欄位中輸入具體的地點名稱或地址。"
+                rating_text = f" (評分: {rating}⭐)" if rating != 'N/A' else ""
+                parts.append(f"{i}. **{place['name']}** - {place['address']}{rating_text}\n")
+            parts.append("\n💡 請在事件地點欄位中輸入具體的地點名稱或地址。")
             
-            result["suggestion"] = suggestion_text
+            result["suggestion"] = "".join(parts)
         else:
             result["suggestion"] = f"⚠️ {error_msg}\n\n💡 **建議：**請提供更具體的地點資訊，例如：\n- 具體地址（如：台北市信義區信義路五段7號）\n- 地標名稱（如：台北101、台北車站）\n- 餐廳/商店名稱（如：星巴克信義店）"
         
         return result
     
+    standardized_address = validation_result["standardized_address"]
     result["validated"] = True
-    result["standardized_address"] = validation_result["standardized_address"]
+    result["standardized_address"] = standardized_address
     
     # 檢查是否為模糊地址（需要用戶確認）
     if validation_result.get("is_ambiguous", False):
         result["validated"] = False  # 標記為未完全驗證
         result["suggestion"] = (
-            f"⚠️ 地址「{location}」較為模糊，已找到可能的位置：{validation_result['standardized_address']}\n"
+            f"⚠️ 地址「{location}」較為模糊，已找到可能的位置：{standardized_address}\n"
             f"💡 建議：請確認這是否為正確地點，或提供更具體的地點資訊。"
         )
         return result
@@ -414,7 +600,7 @@ def enrich_location_info(location: str, event_datetime: Optional[datetime] = Non
         
         travel_result = calculate_travel_time(
             origin=user_location,
-            destination=result["standardized_address"],
+            destination=standardized_address,
             departure_time=departure_time
         )
         
@@ -431,25 +617,50 @@ def enrich_location_info(location: str, event_datetime: Optional[datetime] = Non
                     seconds=travel_result["duration_seconds"] + 600  # 交通時間 + 10分鐘緩衝
                 )
                 result["suggestion"] = (
-                    f"✅ 地址已驗證：{result['standardized_address']}\n"
+                    f"✅ 地址已驗證：{standardized_address}\n"
                     f"📍 從您的預設位置出發，預計需要 {duration}（{distance}）\n"
                     f"⏰ 建議出發時間：{suggested_departure.strftime('%Y-%m-%d %H:%M')}"
                 )
             else:
                 result["suggestion"] = (
-                    f"✅ 地址已驗證：{result['standardized_address']}\n"
+                    f"✅ 地址已驗證：{standardized_address}\n"
                     f"📍 從您的預設位置出發，預計需要 {duration}（{distance}）"
                 )
         else:
             result["suggestion"] = (
-                f"✅ 地址已驗證：{result['standardized_address']}\n"
+                f"✅ 地址已驗證：{standardized_address}\n"
                 f"⚠️ 無法計算交通時間：{travel_result.get('error', '未知錯誤')}"
             )
     else:
         result["suggestion"] = (
-            f"✅ 地址已驗證：{result['standardized_address']}\n"
+            f"✅ 地址已驗證：{standardized_address}\n"
             f"💡 提示：在 .env 文件中設置 USER_HOME_ADDRESS 或 USER_OFFICE_ADDRESS 可啟用交通時間計算功能"
         )
     
     return result
 
+
+def prefetch_geocodes(addresses: List[str]) -> None:
+    """
+    預先對常用地址進行地理編碼並寫入快取（例如快速選擇模板中的地點），之後的驗證不需要再等待網路往返
+    
+    未設置 API Key 時不做任何事；個別地址失敗只記錄警告，不影響其他地址
+    
+    Args:
+        addresses: 地址列表
+    """
+    if not NORMAL_GOOGLE_MAPS_API_KEY:
+        return
+    
+    unique_addresses = [address for address in dict.fromkeys(addresses) if address and _MIN_ADDRESS_RE.search(address)]
+    if not unique_addresses:
+        return
+    
+    def _prefetch(address: str) -> None:
+        try:
+            _geocode_cached(address)
+        except Exception as e:
+            print(f"⚠️ 預先地理編碼「{address}」失敗：{e}")
+    
+    with ThreadPoolExecutor(max_workers=min(len(unique_addresses), _ENRICH_CONCURRENCY)) as executor:
+        list(executor.map(_prefetch, unique_addresses))
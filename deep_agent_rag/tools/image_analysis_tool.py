@@ -3,10 +3,14 @@
 使用多模態 LLM 分析圖片並返回描述
 支持多個 API 提供商，自動切換優先級
 """
-import os
+import io
+import re
+import asyncio
+import time
 import base64
+import hashlib
+import threading
 from typing import Optional, Tuple
-from pathlib import Path
 from langchain_core.tools import tool
 from langchain_core.messages import HumanMessage
 from PIL import Image
@@ -22,6 +26,62 @@ from ..config import (
 )
 
 
+# 圖片分析結果快取：{(圖片內容雜湊, 提示詞雜湊, 提供商, 模型): (時間戳, 分析結果)}
+# 同一張圖片和問題在短時間內重複分析時，直接返回結果，不再呼叫多模態 LLM（每次需數秒）
+_ANALYSIS_CACHE_TTL = 3600  # 秒
+_ANALYSIS_CACHE_MAXSIZE = 256
+_analysis_cache = {}
+_analysis_cache_lock = threading.Lock()
+
+
+# 副檔名到 MIME 類型的映射
+_MIME_TYPE_MAP = {
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+    'gif': 'image/gif',
+    'webp': 'image/webp',
+    'bmp': 'image/bmp'
+}
+
+# 魔術數字判斷需要讀取的文件開頭長度（BMP 需要讀到第 18 個位元組的 DIB 標頭大小欄位）
+_IMAGE_HEADER_SIZE = 18
+# BMP 合法的 DIB 標頭大小（BITMAPCOREHEADER、BITMAPINFOHEADER、V2/V3、OS/2 v2、V4、V5）
+_BMP_DIB_HEADER_SIZES = frozenset({12, 40, 52, 56, 64, 108, 124})
+
+
+# LLM 呼叫錯誤的分類關鍵字，編譯成一個正規表達式，一次掃描錯誤訊息即可得到所有符合的分類
+_LLM_ERROR_RE = re.compile(
+    r"(?P<connection>connection refused|errno 61|errno 111)"
+    r"|(?P<auth>api key|authentication)"
+    r"|(?P<quota>quota|rate limit|429)"
+    r"|(?P<not_found>not found)"
+    r"|(?P<timeout>timeout)"
+    r"|(?P<model>model)",
+    re.IGNORECASE,
+)
+
+
+# 沒有指定問題時使用的通用分析提示詞
+_DEFAULT_ANALYSIS_PROMPT = (
+    "請詳細分析這張圖片，包括：\n"
+    "1. 圖片的主要內容和場景\n"
+    "2. 圖片中的物體、人物、文字等元素\n"
+    "3. 圖片的風格、色彩、構圖等視覺特徵\n"
+    "4. 圖片可能表達的意義或情感\n"
+    "請用中文回答。"
+)
+
+# 多模態 LLM 實例（建立成功後重用，避免每次分析都重新建立客戶端和 HTTP 連線）
+_gemini_llm = None
+_ollama_llm = None
+
+# Ollama 服務可用性檢查結果：(檢查時間, 是否可用)，使用共用的 Session 以重用連線
+_OLLAMA_PROBE_TTL = 30  # 秒
+_ollama_probe = None
+_ollama_session = requests.Session()
+
+
 def _ensure_str(value, default: str = "") -> str:
     """若為 list（如 Gradio 多選），取第一個元素並轉字串；否則轉字串。"""
     if value is None:
@@ -45,10 +105,17 @@ def validate_image_file(image_path: str) -> bool:
     if not path:
         return False
 
-    # 檢查文件是否存在
-    if not os.path.exists(path):
+    # 檢查文件是否存在，並讀取開頭的魔術數字
+    try:
+        with open(path, "rb") as image_file:
+            header = image_file.read(_IMAGE_HEADER_SIZE)
+    except OSError:
         return False
 
+    # 常見格式直接以魔術數字判斷，不需要 PIL 解析整個文件
+    if _detect_image_mime_type(header) is not None:
+        return True
+
     # 檢查是否為圖片文件
     try:
         with Image.open(path) as img:
@@ -68,35 +135,79 @@ def get_image_mime_type(image_path: str) -> str:
     Returns:
         MIME 類型字符串
     """
-    image_ext = Path(image_path).suffix[1:].lower()
-    mime_type_map = {
-        'jpg': 'image/jpeg',
-        'jpeg': 'image/jpeg',
-        'png': 'image/png',
-        'gif': 'image/gif',
-        'webp': 'image/webp',
-        'bmp': 'image/bmp'
-    }
-    return mime_type_map.get(image_ext, 'image/jpeg')
+    return _MIME_TYPE_MAP.get(image_path.rpartition('.')[2].lower(), 'image/jpeg')
 
 
-def prepare_image_message(image_path: str, prompt: str) -> HumanMessage:
+def _detect_image_mime_type(header: bytes) -> Optional[str]:
     """
-    準備包含圖片的消息
+    根據文件開頭的魔術數字判斷常見圖片格式
+    
+    Args:
+        header: 文件開頭的位元組（至少 _IMAGE_HEADER_SIZE 個）
+    
+    Returns:
+        MIME 類型字符串，無法識別時返回 None
+    """
+    if header.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if header.startswith((b'GIF87a', b'GIF89a')):
+        return 'image/gif'
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'image/webp'
+    # 只有 "BM" 兩個位元組太容易誤判，同時檢查 DIB 標頭大小欄位；不符合時交給 PIL 驗證
+    if header.startswith(b'BM') and int.from_bytes(header[14:18], 'little') in _BMP_DIB_HEADER_SIZES:
+        return 'image/bmp'
+    return None
+
+
+def _load_image_file(image_path: str) -> Optional[Tuple[bytes, str]]:
+    """
+    讀取並驗證圖片文件，只打開文件一次
+    
+    常見格式（jpg、png、gif、webp、bmp）直接以魔術數字識別，不需要 PIL 解碼；
+    無法識別時才用 PIL 驗證，並依副檔名判斷 MIME 類型。
     
     Args:
         image_path: 圖片文件路徑
+    
+    Returns:
+        (圖片內容, MIME 類型)，文件不存在或不是有效圖片時返回 None
+    """
+    try:
+        with open(image_path, "rb") as image_file:
+            image_data = image_file.read()
+    except OSError:
+        return None
+    
+    mime_type = _detect_image_mime_type(image_data[:_IMAGE_HEADER_SIZE])
+    if mime_type is None:
+        try:
+            with Image.open(io.BytesIO(image_data)) as img:
+                img.verify()
+        except Exception:
+            return None
+        mime_type = get_image_mime_type(image_path)
+    
+    return image_data, mime_type
+
+
+def _build_image_message(image_data: bytes, mime_type: str, prompt: str) -> HumanMessage:
+    """
+    以已讀取的圖片內容建立包含圖片的消息
+    
+    Args:
+        image_data: 圖片內容
+        mime_type: MIME 類型
         prompt: 文字提示
     
     Returns:
         HumanMessage 對象
     """
-    # 讀取圖片並編碼為 base64
-    with open(image_path, "rb") as image_file:
-        image_data = image_file.read()
-        image_base64 = base64.b64encode(image_data).decode('utf-8')
-    
-    mime_type = get_image_mime_type(image_path)
+    # base64 bytes 不綁定到變數，解碼後即釋放，避免 base64 bytes、字串和 data URL 同時存在
+    # 消息內容每次都建立新的 dict：HumanMessage 會被保留在對話狀態中，共用可變的模板會讓舊消息被覆寫
+    image_url = f"data:{mime_type};base64," + base64.b64encode(image_data).decode('ascii')
     
     return HumanMessage(
         content=[
@@ -107,26 +218,48 @@ def prepare_image_message(image_path: str, prompt: str) -> HumanMessage:
             {
                 "type": "image_url",
                 "image_url": {
-                    "url": f"data:{mime_type};base64,{image_base64}"
+                    "url": image_url
                 }
             }
         ]
     )
 
+
+def prepare_image_message(image_path: str, prompt: str) -> HumanMessage:
+    """
+    準備包含圖片的消息
+    
+    Args:
+        image_path: 圖片文件路徑
+        prompt: 文字提示
+    
+    Returns:
+        HumanMessage 對象
+    """
+    with open(image_path, "rb") as image_file:
+        image_data = image_file.read()
+    
+    return _build_image_message(image_data, get_image_mime_type(image_path), prompt)
+
 def get_gemini_llm():
-    """獲取 Google Gemini LLM 實例"""
+    """獲取 Google Gemini LLM 實例（建立成功後重用同一個實例）"""
+    global _gemini_llm
+    if _gemini_llm is not None:
+        return _gemini_llm
+    
     try:
         from langchain_google_genai import ChatGoogleGenerativeAI
         
         if not GOOGLE_GEMINI_API_KEY:
             return None
         
-        return ChatGoogleGenerativeAI(
+        _gemini_llm = ChatGoogleGenerativeAI(
             model=GOOGLE_GEMINI_MODEL,
             google_api_key=GOOGLE_GEMINI_API_KEY,
             temperature=0.7,
             max_tokens=2048,
         )
+        return _gemini_llm
     except ImportError:
         return None
     except Exception as e:
@@ -136,36 +269,58 @@ def get_gemini_llm():
 
 
 
+def _is_ollama_available() -> bool:
+    """
+    檢查 Ollama 服務是否可用，結果快取 _OLLAMA_PROBE_TTL 秒，避免連續分析時重複探測
+    
+    Returns:
+        服務是否可用（檢查本身發生非連線錯誤時視為可用）
+    """
+    global _ollama_probe
+    now = time.monotonic()
+    if _ollama_probe is not None and now - _ollama_probe[0] < _OLLAMA_PROBE_TTL:
+        return _ollama_probe[1]
+    
+    available = True
+    try:
+        response = _ollama_session.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=2)
+        if response.status_code != 200:
+            print(f"⚠️ Ollama 服務不可用（狀態碼：{response.status_code}）")
+            available = False
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+        print(f"⚠️ 無法連接到 Ollama 服務 ({OLLAMA_BASE_URL})：{e}")
+        print(f"   提示：請確保 Ollama 服務正在運行（執行 'ollama serve'）")
+        available = False
+    except Exception as e:
+        print(f"⚠️ 檢查 Ollama 服務時發生錯誤：{e}")
+        # 繼續嘗試創建 LLM，可能只是檢查失敗
+    
+    _ollama_probe = (now, available)
+    return available
+
+
 def get_ollama_vision_llm():
-    """獲取 Ollama LLaVA LLM 實例（本地多模態模型）"""
+    """獲取 Ollama LLaVA LLM 實例（本地多模態模型，建立成功後重用同一個實例）"""
+    global _ollama_llm
     try:
         from langchain_ollama import ChatOllama
-        import requests
         
         if not USE_OLLAMA_VISION:
             return None
         
         # 先檢查 Ollama 服務是否可用
-        try:
-            response = requests.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=2)
-            if response.status_code != 200:
-                print(f"⚠️ Ollama 服務不可用（狀態碼：{response.status_code}）")
-                return None
-        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
-            print(f"⚠️ 無法連接到 Ollama 服務 ({OLLAMA_BASE_URL})：{e}")
-            print(f"   提示：請確保 Ollama 服務正在運行（執行 'ollama serve'）")
+        if not _is_ollama_available():
             return None
-        except Exception as e:
-            print(f"⚠️ 檢查 Ollama 服務時發生錯誤：{e}")
-            # 繼續嘗試創建 LLM，可能只是檢查失敗
         
-        return ChatOllama(
-            base_url=OLLAMA_BASE_URL,
-            model=OLLAMA_VISION_MODEL,
-            num_predict=2048,
-            temperature=0.7,
-            timeout=30,  # 設置超時時間
-        )
+        if _ollama_llm is None:
+            _ollama_llm = ChatOllama(
+                base_url=OLLAMA_BASE_URL,
+                model=OLLAMA_VISION_MODEL,
+                num_predict=2048,
+                temperature=0.7,
+                timeout=30,  # 設置超時時間
+            )
+        return _ollama_llm
     except ImportError:
         return None
     except Exception as e:
@@ -224,6 +379,73 @@ def get_multimodal_llm() -> Tuple[Optional[object], str]:
     return None, error_msg
 
 
+def _classify_llm_error(error_str: str) -> Optional[str]:
+    """
+    分類 LLM 呼叫錯誤
+    
+    錯誤訊息可能同時符合多個分類，依優先順序返回：連接錯誤 > 認證失敗 > 額度限制 > 模型未找到 > 逾時
+    
+    Args:
+        error_str: 錯誤訊息
+    
+    Returns:
+        'connection'、'auth'、'quota'、'model_not_found'、'timeout' 之一，都不符合時返回 None
+    """
+    matched = {match.lastgroup for match in _LLM_ERROR_RE.finditer(error_str)}
+    if not matched:
+        return None
+    for category in ("connection", "auth", "quota"):
+        if category in matched:
+            return category
+    if "model" in matched and "not_found" in matched:
+        return "model_not_found"
+    if "timeout" in matched:
+        return "timeout"
+    return None
+
+
+def _analysis_cache_key(image_data: bytes, prompt: str, provider: str) -> tuple:
+    """
+    建立圖片分析結果的快取鍵（以內容雜湊識別圖片，與文件路徑無關）
+    
+    Args:
+        image_data: 圖片內容
+        prompt: 文字提示
+        provider: 提供商名稱
+    
+    Returns:
+        快取鍵
+    """
+    model_name = OLLAMA_VISION_MODEL if provider == "ollama" else GOOGLE_GEMINI_MODEL
+    return (
+        hashlib.blake2b(image_data, digest_size=16).hexdigest(),
+        hashlib.blake2b(prompt.encode("utf-8"), digest_size=16).hexdigest(),
+        provider,
+        model_name,
+    )
+
+
+def _get_cached_analysis(cache_key: tuple) -> Optional[str]:
+    """從快取取得未過期的分析結果，沒有時返回 None"""
+    with _analysis_cache_lock:
+        cached = _analysis_cache.get(cache_key)
+    if cached and time.time() - cached[0] < _ANALYSIS_CACHE_TTL:
+        return cached[1]
+    return None
+
+
+def _set_cached_analysis(cache_key: tuple, answer: str) -> None:
+    """寫入分析結果快取；超過容量時先清除過期項目，仍然太多則移除最舊的項目"""
+    now = time.time()
+    with _analysis_cache_lock:
+        if len(_analysis_cache) >= _ANALYSIS_CACHE_MAXSIZE:
+            for stale_key in [k for k, (ts, _) in _analysis_cache.items() if now - ts >= _ANALYSIS_CACHE_TTL]:
+                del _analysis_cache[stale_key]
+            if len(_analysis_cache) >= _ANALYSIS_CACHE_MAXSIZE:
+                del _analysis_cache[next(iter(_analysis_cache))]
+        _analysis_cache[cache_key] = (now, answer)
+
+
 def _analyze_image_internal(image_path: str, question: Optional[str] = None) -> str:
     """
     內部函數：使用多模態 LLM 分析圖片並返回描述
@@ -244,8 +466,9 @@ def _analyze_image_internal(image_path: str, question: Optional[str] = None) ->
         elif question is not None:
             question = (question.strip() or None) if isinstance(question, str) else None
 
-        # 驗證圖片文件
-        if not validate_image_file(image_path):
+        # 驗證並讀取圖片文件（只打開一次，後續直接使用讀取的內容）
+        loaded_image = _load_image_file(image_path) if image_path else None
+        if loaded_image is None:
             return (
                 f"❌ 錯誤：無法讀取圖片文件。\n"
                 f"請確保：\n"
@@ -260,20 +483,17 @@ def _analyze_image_internal(image_path: str, question: Optional[str] = None) ->
             return provider  # 返回錯誤訊息
         
         # 構建提示詞
-        if question:
-            prompt = f"{question}\n\n請詳細分析這張圖片。"
-        else:
-            prompt = (
-                "請詳細分析這張圖片，包括：\n"
-                "1. 圖片的主要內容和場景\n"
-                "2. 圖片中的物體、人物、文字等元素\n"
-                "3. 圖片的風格、色彩、構圖等視覺特徵\n"
-                "4. 圖片可能表達的意義或情感\n"
-                "請用中文回答。"
-            )
+        prompt = f"{question}\n\n請詳細分析這張圖片。" if question else _DEFAULT_ANALYSIS_PROMPT
+        
+        # 相同圖片、提示詞和模型已分析過時直接返回結果
+        image_data, mime_type = loaded_image
+        cache_key = _analysis_cache_key(image_data, prompt, provider)
+        cached_answer = _get_cached_analysis(cache_key)
+        if cached_answer is not None:
+            return cached_answer
         
         # 準備消息
-        message = prepare_image_message(image_path, prompt)
+        message = _build_image_message(image_data, mime_type, prompt)
         
         # 調用 LLM 分析圖片
         try:
@@ -306,14 +526,16 @@ def _analyze_image_internal(image_path: str, question: Optional[str] = None) ->
                 # 保底：將 dict 轉字串
                 answer = answer.get("text") if isinstance(answer.get("text"), str) else str(answer)
 
-            return str(answer).strip()
+            answer = str(answer).strip()
+            _set_cached_analysis(cache_key, answer)
+            return answer
             
         except Exception as e:
-            error_msg = str(e).lower()
             error_str = str(e)
+            error_category = _classify_llm_error(error_str)
             
             # 處理連接錯誤（特別是 Ollama）
-            if "connection refused" in error_msg or "errno 61" in error_msg or "errno 111" in error_msg:
+            if error_category == "connection":
                 if provider == "ollama":
                     return (
                         f"❌ 錯誤：無法連接到 Ollama 服務。\n\n"
@@ -333,12 +555,12 @@ def _analyze_image_internal(image_path: str, question: Optional[str] = None) ->
                     )
             
             # 處理 API 錯誤
-            elif "api key" in error_msg or "authentication" in error_msg:
+            elif error_category == "auth":
                 return (
                     f"❌ 錯誤：{provider.upper()} API 認證失敗。\n"
                     f"請檢查 API Key 是否正確設置。"
                 )
-            elif "quota" in error_msg or "rate limit" in error_msg or "429" in error_msg:
+            elif error_category == "quota":
                 # 如果額度用完，嘗試下一個提供商
                 print(f"⚠️ {provider} API 額度已用完，嘗試下一個提供商...")
                 # 這裡可以實現自動切換邏輯，但為了簡化，先返回錯誤
@@ -346,7 +568,7 @@ def _analyze_image_internal(image_path: str, question: Optional[str] = None) ->
                     f"❌ 錯誤：{provider.upper()} API 額度已用完或達到速率限制。\n"
                     f"請稍後再試，或配置其他 API 提供商（如 Ollama LLaVA，完全免費）。"
                 )
-            elif "model" in error_msg and "not found" in error_msg:
+            elif error_category == "model_not_found":
                 if provider == "ollama":
                     return (
                         f"❌ 錯誤：Ollama 模型 '{OLLAMA_VISION_MODEL}' 未找到。\n"
@@ -354,7 +576,7 @@ def _analyze_image_internal(image_path: str, question: Optional[str] = None) ->
                     )
                 else:
                     return f"❌ 錯誤：{provider.upper()} 模型未找到或不可用。"
-            elif "timeout" in error_msg:
+            elif error_category == "timeout":
                 return (
                     f"❌ 錯誤：連接 {provider.upper()} API 超時。\n"
                     f"請檢查網絡連接或稍後再試。"
@@ -374,6 +596,23 @@ def _analyze_image_internal(image_path: str, question: Optional[str] = None) ->
         return f"❌ 圖片分析工具發生錯誤：{error_msg}"
 
 
+async def _analyze_image_async(image_path: str, question: Optional[str] = None) -> str:
+    """
+    _analyze_image_internal 的非同步版本，供在事件循環中執行的呼叫方（例如非同步伺服器）使用
+    
+    讀取文件、base64 編碼和 LLM 呼叫都是阻塞操作，整個流程在執行緒中執行以免阻塞事件循環；
+    圖片只讀取和編碼一次，建立的消息直接交給選定的提供商。
+    
+    Args:
+        image_path: 圖片文件路徑
+        question: 可選的特定問題
+    
+    Returns:
+        圖片分析的結果描述
+    """
+    return await asyncio.to_thread(_analyze_image_internal, image_path, question)
+
+
 @tool
 def analyze_image(image_path: str, question: Optional[str] = None) -> str:
     """
@@ -389,3 +628,7 @@ def analyze_image(image_path: str, question: Optional[str] = None) -> str:
         圖片分析的結果描述
     """
     return _analyze_image_internal(image_path, question)
+
+
+# 非同步呼叫（ainvoke，例如 LangGraph 的非同步執行）使用在執行緒中執行的版本，不阻塞事件循環
+analyze_image.coroutine = _analyze_image_async
@@ -1,20 +1,252 @@
 # deep_agent_rag/ui/calendar_interface.py
 
 import gradio as gr
-from datetime import datetime, timedelta
+from datetime import date, datetime
+from contextlib import closing
+from functools import lru_cache, partial
 import re
 import json
+import logging
 import time
+import copy
+import queue
+import sqlite3
+import threading
 
-from ..agents.calendar_agent import generate_calendar_draft, create_calendar_draft
-# Assuming is_using_local_llm might be used for warnings/status, similar to email_interface
-# from ..utils.llm_utils import is_using_local_llm 
+from ..agents.calendar_agent import generate_calendar_draft, create_calendar_draft, parse_datetime
+from ..tools.googlemaps_tool import prefetch_geocodes, get_user_default_location
+from ..config import CALENDAR_DRAFT_CACHE_PATH
+
+logger = logging.getLogger(__name__)
+
+# 日期選項中括號內的 ISO 日期（例如："明天 (2026-01-25)"）
+_DATE_IN_PARENS = re.compile(r"\((\d{4}-\d{2}-\d{2})\)")
+
+# 判斷提示是否已包含完整資訊的規則（日期、時間、參與者郵箱、地點），全部符合時略過多輪反思
+_PROMPT_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}|今天|明天|後天|下週|下周")
+_PROMPT_TIME_RE = re.compile(r"\d{1,2}[:：點]\d{0,2}|上午|下午|中午|晚上")
+_PROMPT_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+_PROMPT_LOCATION_RE = re.compile(r"地點|在.{1,20}?(?:室|廳|樓|司|店)")
+_PROMPT_COMPLETENESS_RES = (_PROMPT_DATE_RE, _PROMPT_TIME_RE, _PROMPT_EMAIL_RE, _PROMPT_LOCATION_RE)
+
+
+def _needs_reflection(prompt: str) -> bool:
+    """提示缺少日期、時間、參與者郵箱或地點任一項時才需要反思"""
+    return not all(pattern.search(prompt) for pattern in _PROMPT_COMPLETENESS_RES)
+
+
+# 反思結果顯示模板：{(是否改進, 是否多輪): 模板}，沒有改進時不區分輪數
+_REFLECTION_NO_CHANGE_TEMPLATE = (
+    "🔍 **AI 反思評估結果**\n\n"
+    "{body}\n\n"
+    "✅ **事件質量良好，無需改進**"
+)
+_REFLECTION_DISPLAY_TEMPLATES = {
+    (True, True): (
+        "🔍 **AI 迭代反思評估結果**（共 {count} 輪）\n\n"
+        "{body}\n\n"
+        "✨ **已自動應用改進建議，經過 {count} 輪優化，當前顯示的是最終優化版本**"
+    ),
+    (True, False): (
+        "🔍 **AI 反思評估結果**\n\n"
+        "{body}\n\n"
+        "✨ **已自動應用改進建議，當前顯示的是優化後的版本**"
+    ),
+    (False, True): _REFLECTION_NO_CHANGE_TEMPLATE,
+    (False, False): _REFLECTION_NO_CHANGE_TEMPLATE,
+}
+
+# 事件草稿快取：{(今天日期, 正規化提示): (時間戳, generate_calendar_draft 的結果)}
+# 快速選擇按鈕和重複點擊會送出相同的提示，快取可跳過多輪 LLM 反思和 Google Maps 驗證
+# 鍵包含今天的日期，"明天"等相對日期在同一天內才會對應到同一個結果
+_DRAFT_CACHE_TTL = 3600  # 秒
+_DRAFT_CACHE_MAXSIZE = 256
+_draft_cache = {}
+_draft_cache_lock = threading.Lock()
+# 生成中的草稿：{快取鍵: threading.Event}，相同提示的重複請求（例如連點按鈕）等待第一個請求完成後直接使用快取
+_draft_inflight = {}
+
+# 事件草稿的磁碟快取（SQLite），伺服器重啟後快速選擇模板和示例提示仍可直接使用已生成的草稿
+# 鍵同樣包含日期，只在同一天內有效；超過 TTL 的資料在寫入時清除
+_DRAFT_DISK_CACHE_PATH = CALENDAR_DRAFT_CACHE_PATH
+_DRAFT_DISK_CACHE_TTL = 24 * 3600  # 秒
+_draft_disk_cache_ready = False
+_draft_disk_cache_lock = threading.Lock()
+
+
+def _open_draft_disk_cache() -> sqlite3.Connection:
+    """開啟磁碟快取連線（第一次使用時建立資料表）"""
+    global _draft_disk_cache_ready
+    conn = sqlite3.connect(_DRAFT_DISK_CACHE_PATH, timeout=5)
+    if not _draft_disk_cache_ready:
+        with _draft_disk_cache_lock:
+            if not _draft_disk_cache_ready:
+                with conn:
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS drafts ("
+                        "day TEXT NOT NULL, prompt TEXT NOT NULL, created_at REAL NOT NULL, result TEXT NOT NULL, "
+                        "PRIMARY KEY (day, prompt))"
+                    )
+                _draft_disk_cache_ready = True
+    return conn
+
+
+def _load_draft_from_disk(cache_key: tuple):
+    """從磁碟快取讀取未過期的草稿結果，沒有或讀取失敗時返回 None"""
+    try:
+        with closing(_open_draft_disk_cache()) as conn:
+            row = conn.execute(
+                "SELECT created_at, result FROM drafts WHERE day = ? AND prompt = ?",
+                cache_key
+            ).fetchone()
+    except Exception as e:
+        print(f"⚠️ [Calendar] 讀取草稿磁碟快取失敗：{e}")
+        return None
+    if row is None or time.time() - row[0] >= _DRAFT_DISK_CACHE_TTL:
+        return None
+    return tuple(json.loads(row[1]))
+
+
+def _save_draft_to_disk(cache_key: tuple, result: tuple) -> None:
+    """將草稿結果寫入磁碟快取，並清除過期的資料；失敗只記錄警告"""
+    now = time.time()
+    try:
+        payload = json.dumps(result, ensure_ascii=False)
+        with closing(_open_draft_disk_cache()) as conn, conn:
+            conn.execute("DELETE FROM drafts WHERE created_at < ?", (now - _DRAFT_DISK_CACHE_TTL,))
+            conn.execute(
+                "INSERT OR REPLACE INTO drafts (day, prompt, created_at, result) VALUES (?, ?, ?, ?)",
+                cache_key + (now, payload)
+            )
+    except Exception as e:
+        print(f"⚠️ [Calendar] 寫入草稿磁碟快取失敗：{e}")
+
+
+def _generate_calendar_draft_cached(prompt: str, on_progress=None, reflection_memory=None):
+    """
+    生成行事曆事件草稿（帶快取，包含反思功能；提示已包含完整資訊時略過反思）
+    
+    只快取成功生成的草稿；返回的事件字典是副本，後續修改（例如補充缺失資訊）不會影響快取
+    命中快取時不會呼叫 on_progress，也不會進行反思（反思記憶不會更新）
+    相同提示已在生成中時，等待該請求完成並使用其結果，不會重複執行反思流程
+    記憶體快取沒有命中時會先查詢磁碟快取（跨伺服器重啟保留）
+    
+    Args:
+        prompt: 事件提示
+        on_progress: 傳給 generate_calendar_draft 的進度回呼（可選）
+        reflection_memory: 傳給 generate_calendar_draft 的反思記憶（可選）
+    
+    Returns:
+        與 generate_calendar_draft 相同的 (事件字典, 狀態, 缺失資訊, 反思結果, 是否改進, 反思輪數) 元組
+    """
+    cache_key = (datetime.now().strftime('%Y-%m-%d'), " ".join(prompt.split()))
+    now = time.time()
+    
+    with _draft_cache_lock:
+        cached = _draft_cache.get(cache_key)
+        inflight = None
+        if not (cached and now - cached[0] < _DRAFT_CACHE_TTL):
+            inflight = _draft_inflight.get(cache_key)
+            if inflight is None:
+                _draft_inflight[cache_key] = threading.Event()
+    if cached and now - cached[0] < _DRAFT_CACHE_TTL:
+        return copy.deepcopy(cached[1])
+    if inflight is not None:
+        # 等待進行中的請求；它失敗（沒有寫入快取）時，重新檢查後由本請求自行生成
+        inflight.wait()
+        return _generate_calendar_draft_cached(prompt, on_progress=on_progress, reflection_memory=reflection_memory)
+    
+    try:
+        result = _load_draft_from_disk(cache_key)
+        if result is None:
+            result = generate_calendar_draft(
+                prompt,
+                enable_reflection=_needs_reflection(prompt),
+                on_progress=on_progress,
+                reflection_memory=reflection_memory
+            )
+            if result[0]:
+                _save_draft_to_disk(cache_key, result)
+        if result[0]:
+            with _draft_cache_lock:
+                if len(_draft_cache) >= _DRAFT_CACHE_MAXSIZE:
+                    for stale_key in [k for k, (ts, _) in _draft_cache.items() if now - ts >= _DRAFT_CACHE_TTL]:
+                        del _draft_cache[stale_key]
+                    if len(_draft_cache) >= _DRAFT_CACHE_MAXSIZE:
+                        del _draft_cache[next(iter(_draft_cache))]
+                _draft_cache[cache_key] = (now, copy.deepcopy(result))
+        return result
+    finally:
+        with _draft_cache_lock:
+            _draft_inflight.pop(cache_key).set()
+
+# 快速選擇事件模板（custom 為自定義，返回空提示讓用戶輸入）
+_QUICK_TEMPLATES = {
+    "meeting": "明天下午2點團隊會議，討論項目進度和下週計劃，地點在會議室，參與者包括團隊成員",
+    "client": "明天上午10點客戶拜訪，討論合作方案和需求，地點在客戶公司或會議室",
+    "lunch": "明天中午12點午餐會議，與合作夥伴討論業務合作，地點在附近的餐廳",
+    "oneonone": "明天下午3點一對一會議，討論工作進展和職業發展，地點在會議室或咖啡廳",
+    "project": "明天上午9點項目討論會議，審查項目進度和解決問題，地點在項目室，參與者包括項目團隊",
+    "training": "明天下午2點培訓課程，學習新技能和最佳實踐，地點在培訓室或線上",
+    "social": "明天晚上6點團隊聚餐，慶祝項目完成，地點在餐廳，參與者包括團隊成員",
+    "custom": ""
+}
+
+# 介面建立時在背景預先地理編碼的地址，點擊模板時地點驗證可直接命中快取：
+# 模板中「地點在…」的原文（少於 3 個字的地點會先交給 LLM 改寫，實際查詢的地址無法預測，不預取），
+# 以及每次計算交通時間都會用到的使用者預設位置
+_TEMPLATE_LOCATION_RE = re.compile(r"地點在([^，。]+)")
+_QUICK_TEMPLATE_LOCATIONS = [
+    match.group(1)
+    for match in map(_TEMPLATE_LOCATION_RE.search, _QUICK_TEMPLATES.values())
+    if match and len(match.group(1)) >= 3
+]
+
+# 介面建立時預熱用的提示（不含地點和參與者，避免額外的地點驗證和郵箱驗證）
+_WARMUP_PROMPT = "明天下午2點會議"
+
+# 時間選項（每30分鐘一個選項），內容固定，匯入時生成一次
+_TIME_OPTIONS = [f"{hour:02d}:{minute:02d}" for hour in range(24) for minute in (0, 30)]
+
+
+def generate_time_options():
+    """生成時間選項列表"""
+    return _TIME_OPTIONS
+
+
+@lru_cache(maxsize=2)
+def _date_options(today_ordinal: int) -> list:
+    """生成以指定日期為今天的日期選項列表（以日期序數為鍵快取，每天只生成一次）"""
+    date_names = ("今天", "明天", "後天")
+    dates = [f"{name} ({date.fromordinal(today_ordinal + i).isoformat()})" for i, name in enumerate(date_names)]
+    dates.extend(date.fromordinal(today_ordinal + i).isoformat() for i in range(3, 7))
+    return dates
+
+
+def generate_date_options():
+    """生成日期選項列表（今天、明天、後天，以及未來7天）"""
+    return _date_options(date.today().toordinal())
+
+
+def _warm_up_calendar_agent():
+    """
+    在背景執行一次不含反思的草稿生成，預先載入 LLM（本地模型權重或 API 連線）和日期解析等路徑
+    
+    使用者第一次點擊時就不必承擔冷啟動成本；失敗只記錄警告，不影響介面
+    """
+    try:
+        generate_calendar_draft(_WARMUP_PROMPT, enable_reflection=False)
+        print("✅ [Calendar] 事件草稿生成已預熱")
+    except Exception as e:
+        print(f"⚠️ [Calendar] 預熱失敗：{e}")
 
-# Agent log path for debugging (if needed)
-log_path = "/Users/matthuang/Desktop/Deep_Agentic_AI_Tool/.cursor/debug.log"
 
 def _create_calendar_interface():
     """創建 Calendar Tool 界面"""
+    prefetch_addresses = _QUICK_TEMPLATE_LOCATIONS + [get_user_default_location() or ""]
+    threading.Thread(target=prefetch_geocodes, args=(prefetch_addresses,), daemon=True).start()
+    threading.Thread(target=_warm_up_calendar_agent, daemon=True).start()
+    
     gr.Markdown(
         """
         ### 📅 智能行事曆管理助手
@@ -106,7 +338,11 @@ def _create_calendar_interface():
                 fill_missing_btn = gr.Button("✅ 確認補充資訊", variant="primary", visible=False)
             
             # 隱藏狀態變數，用於存儲 event_dict
+            # gr.State 的值只保存在伺服器端的會話中，不會序列化傳送到瀏覽器；
+            # 保持與 calendar_agent、反思流程共用的 dict 格式，不需要額外轉換
             event_dict_storage = gr.State(value={})
+            # 隱藏狀態變數，存儲本次會話中已解決的反思問題，避免後續反思重複提出
+            reflection_memory_storage = gr.State(value=[])
         
         with gr.Column(scale=1):
             # 事件詳情顯示和編輯區域
@@ -162,64 +398,18 @@ def _create_calendar_interface():
                 interactive=False
             )
     
-    # 生成時間選項（每30分鐘一個選項）
-    def generate_time_options():
-        """生成時間選項列表"""
-        times = []
-        for hour in range(24):
-            for minute in [0, 30]:
-                time_str = f"{hour:02d}:{minute:02d}"
-                times.append(time_str)
-        return times
-    
-    # 生成日期選項（今天、明天、後天，以及未來7天）
-    def generate_date_options():
-        """生成日期選項列表"""
-        dates = []
-        today = datetime.now()
-        date_names = ["今天", "明天", "後天"]
-        
-        for i in range(3):
-            date_obj = today + timedelta(days=i)
-            date_str = date_obj.strftime('%Y-%m-%d')
-            dates.append(f"{date_names[i]} ({date_str})")
-        
-        for i in range(3, 7):
-            date_obj = today + timedelta(days=i)
-            date_str = date_obj.strftime('%Y-%m-%d')
-            dates.append(date_str)
-        
-        return dates
-    
     # 快速選擇事件模板生成函數
     def generate_quick_prompt(event_type: str) -> str:
         """根據事件類型生成預設提示"""
-        from datetime import datetime, timedelta
-        
-        # 獲取明天的日期
-        tomorrow = datetime.now() + timedelta(days=1)
-        tomorrow_str = tomorrow.strftime("%Y-%m-%d")
-        
-        templates = {
-            "meeting": f"明天下午2點團隊會議，討論項目進度和下週計劃，地點在會議室，參與者包括團隊成員",
-            "client": f"明天上午10點客戶拜訪，討論合作方案和需求，地點在客戶公司或會議室",
-            "lunch": f"明天中午12點午餐會議，與合作夥伴討論業務合作，地點在附近的餐廳",
-            "oneonone": f"明天下午3點一對一會議，討論工作進展和職業發展，地點在會議室或咖啡廳",
-            "project": f"明天上午9點項目討論會議，審查項目進度和解決問題，地點在項目室，參與者包括項目團隊",
-            "training": f"明天下午2點培訓課程，學習新技能和最佳實踐，地點在培訓室或線上",
-            "social": f"明天晚上6點團隊聚餐，慶祝項目完成，地點在餐廳，參與者包括團隊成員",
-            "custom": ""  # 自定義，返回空讓用戶輸入
-        }
-        
-        return templates.get(event_type, "")
+        return _QUICK_TEMPLATES.get(event_type, "")
     
     # 快速選擇按鈕處理函數（自動生成草稿）
-    def quick_select_and_generate(event_type: str):
+    def quick_select_and_generate(event_type: str, reflection_memory=None):
         """快速選擇事件類型並自動生成草稿"""
         prompt = generate_quick_prompt(event_type)
         if not prompt:
             # 如果是自定義，只返回空提示，不自動生成
-            return (
+            yield (
                 prompt,  # calendar_prompt_input
                 "請在下方輸入框中輸入事件提示，然後點擊「生成事件草稿」",  # calendar_status_display
                 "等待輸入...",  # calendar_reflection_display
@@ -227,45 +417,18 @@ def _create_calendar_interface():
                 gr.update(visible=False, choices=[]),  # missing_date_display
                 gr.update(visible=False, choices=[]),  # missing_time_display
                 gr.update(visible=False),  # fill_missing_btn
-                "", "", "", "", "", "",  # event fields
                 {},
-                ""  # calendar_result_display
+                "",  # calendar_result_display
+                "", "", "", "", "", "",  # event fields
+                reflection_memory
             )
+            return
         
-        # 自動生成草稿（調用 generate_draft 並返回所有輸出）
-        draft_result = generate_draft(prompt)
-        # generate_draft 返回的格式是：(status, reflection_display, missing_info_group, ...)
-        # 但我們需要返回 (prompt, status, reflection_display, ...)
-        # draft_result 是一個元組，我們需要將 prompt 添加到開頭
-        return (prompt,) + draft_result
-    
-    def quick_select_meeting():
-        """快速選擇：團隊會議"""
-        return quick_select_and_generate("meeting")
-    
-    def quick_select_client():
-        """快速選擇：客戶拜訪"""
-        return quick_select_and_generate("client")
-    
-    def quick_select_lunch():
-        """快速選擇：午餐會議"""
-        return quick_select_and_generate("lunch")
-    
-    def quick_select_oneonone():
-        """快速選擇：一對一會議"""
-        return quick_select_and_generate("oneonone")
-    
-    def quick_select_project():
-        """快速選擇：項目討論"""
-        return quick_select_and_generate("project")
-    
-    def quick_select_training():
-        """快速選擇：培訓/學習"""
-        return quick_select_and_generate("training")
-    
-    def quick_select_social():
-        """快速選擇：社交活動"""
-        return quick_select_and_generate("social")
+        # 自動生成草稿（逐步轉發 generate_draft 的所有輸出）
+        # generate_draft 輸出的格式是：(status, reflection_display, missing_info_group, ...)
+        # 但我們需要輸出 (prompt, status, reflection_display, ...)，將 prompt 添加到開頭
+        for draft_result in generate_draft(prompt, reflection_memory):
+            yield (prompt,) + draft_result
     
     def quick_select_custom():
         """快速選擇：自定義輸入（只清空，不自動生成）"""
@@ -277,69 +440,102 @@ def _create_calendar_interface():
             gr.update(visible=False, choices=[]),  # missing_date_display
             gr.update(visible=False, choices=[]),  # missing_time_display
             gr.update(visible=False),  # fill_missing_btn
-            "", "", "", "", "", "",  # event fields
             {},
-            ""  # calendar_result_display
+            "",  # calendar_result_display
+            "", "", "", "", "", ""  # event fields
         )
     
     # 事件處理函數
-    def generate_draft(prompt):
-        """生成行事曆事件草稿（包含反思功能）"""
+    def partial_draft_outputs(event_dict, round_number):
+        """反思進行中時顯示的中間結果（缺失資訊區域和 event_dict_storage 在最終結果才更新，事件欄位直接顯示目前的版本）"""
+        if round_number == 0:
+            status = "🔄 事件初稿已生成，AI 反思評估中..."
+        else:
+            status = f"🔄 已完成第 {round_number} 輪 AI 反思優化，繼續評估中..."
+        return (
+            status,
+            "🔄 正在進行 AI 反思評估...",
+            gr.update(visible=False),
+            gr.update(visible=False, choices=[]),
+            gr.update(visible=False, choices=[]),
+            gr.update(visible=False),
+            gr.update(),  # event_dict_storage 不變
+            ""
+        ) + render_event_fields(event_dict)
+    
+    def generate_draft(prompt, reflection_memory=None):
+        """生成行事曆事件草稿，每個輸出最後附上更新後的反思記憶"""
+        if reflection_memory is None:
+            reflection_memory = []
+        for outputs in _generate_draft_outputs(prompt, reflection_memory):
+            yield outputs + (reflection_memory,)
+    
+    def _generate_draft_outputs(prompt, reflection_memory):
+        """
+        生成行事曆事件草稿（包含反思功能，逐步顯示反思過程中的版本）
+        
+        每個輸出都同時包含事件字典和事件欄位：命中快取時返回的字典可能與目前的 event_dict_storage 相等，
+        欄位不能依賴 event_dict_storage 的變更事件更新，否則使用者手動修改過的欄位不會被新草稿覆蓋
+        """
         if not prompt or not prompt.strip():
-            return (
+            yield (
                 "❌ 請輸入事件提示",
                 "❌ 請輸入事件提示",
                 gr.update(visible=False),
                 gr.update(visible=False, choices=[]),
                 gr.update(visible=False, choices=[]),
                 gr.update(visible=False),
-                "", "", "", "", "", "", "",
+                {},
                 "❌ 請輸入事件提示"
-            )
+            ) + render_event_fields({})
+            return
         
         try:
-            status_msg = "🔄 正在生成事件草稿..."
+            # 在背景執行緒生成事件草稿（包含反思功能），初稿和每輪反思改進的版本先顯示出來
+            progress_queue = queue.Queue()
+            outcome = {}
             
-            # 生成事件草稿（包含反思功能）
-            event_dict, status, missing_info, reflection_result, was_improved = generate_calendar_draft(
-                prompt.strip(), enable_reflection=True
-            )
+            def _run_draft():
+                try:
+                    outcome["result"] = _generate_calendar_draft_cached(
+                        prompt.strip(),
+                        on_progress=lambda partial_dict, round_number: progress_queue.put((partial_dict, round_number)),
+                        reflection_memory=reflection_memory
+                    )
+                except Exception as e:
+                    outcome["error"] = e
+                finally:
+                    progress_queue.put(None)
+            
+            worker = threading.Thread(target=_run_draft, daemon=True)
+            worker.start()
+            while (progress := progress_queue.get()) is not None:
+                yield partial_draft_outputs(*progress)
+            worker.join()
+            
+            if "error" in outcome:
+                raise outcome["error"]
+            event_dict, status, missing_info, reflection_result, was_improved, reflection_count = outcome["result"]
             
             if not event_dict:
-                return (
+                yield (
+                    status,
                     status,
                     gr.update(visible=False),
                     gr.update(visible=False, choices=[]),
                     gr.update(visible=False, choices=[]),
                     gr.update(visible=False),
-                    "", "", "", "", "", "", "",
+                    {},
                     status
-                )
+                ) + render_event_fields({})
+                return
             
             # 格式化反思結果顯示
             if reflection_result:
-                # 計算反思輪數
-                reflection_count = reflection_result.count("【第") if "【第" in reflection_result else 0
-                
-                if was_improved:
-                    if reflection_count > 1:
-                        reflection_display = (
-                            f"🔍 **AI 迭代反思評估結果**（共 {reflection_count} 輪）\n\n"
-                            f"{reflection_result}\n\n"
-                            f"✨ **已自動應用改進建議，經過 {reflection_count} 輪優化，當前顯示的是最終優化版本**"
-                        )
-                    else:
-                        reflection_display = (
-                            f"🔍 **AI 反思評估結果**\n\n"
-                            f"{reflection_result}\n\n"
-                            f"✨ **已自動應用改進建議，當前顯示的是優化後的版本**"
-                        )
-                else:
-                    reflection_display = (
-                        f"🔍 **AI 反思評估結果**\n\n"
-                        f"{reflection_result}\n\n"
-                        f"✅ **事件質量良好，無需改進**"
-                    )
+                template = _REFLECTION_DISPLAY_TEMPLATES[(bool(was_improved), reflection_count > 1)]
+                reflection_display = template.format(count=reflection_count, body=reflection_result)
+            elif not _needs_reflection(prompt):
+                reflection_display = "ℹ️ 提示已包含日期、時間、地點和參與者，略過 AI 反思評估"
             else:
                 reflection_display = "⚠️ 反思功能未返回結果"
             
@@ -363,58 +559,44 @@ def _create_calendar_interface():
                 date_choices = generate_date_options() if date_visible else []
                 time_choices = generate_time_options() if time_visible else []
                 
-                return (
+                yield (
                     status,
                     reflection_display,
                     gr.update(visible=True),  # 顯示缺失資訊區域
                     gr.update(visible=date_visible, choices=date_choices, value=date_choices[0] if date_choices else None),
                     gr.update(visible=time_visible, choices=time_choices, value=time_choices[0] if time_choices else None),
                     gr.update(visible=True),  # 顯示確認按鈕
-                    event_dict.get("summary", ""),
-                    event_dict.get("start_datetime", ""),
-                    event_dict.get("end_datetime", ""),
-                    event_dict.get("description", ""),
-                    event_dict.get("location", ""),
-                    event_dict.get("attendees", ""),
                     event_dict,  # 傳遞完整的事件字典以便後續使用
                     ""
-                )
+                ) + render_event_fields(event_dict)
             else:
                 # 沒有缺失資訊，直接顯示結果
-                return (
+                yield (
                     status,
                     reflection_display,
                     gr.update(visible=False),
                     gr.update(visible=False, choices=[]),
                     gr.update(visible=False, choices=[]),
                     gr.update(visible=False),
-                    event_dict.get("summary", ""),
-                    event_dict.get("start_datetime", ""),
-                    event_dict.get("end_datetime", ""),
-                    event_dict.get("description", ""),
-                    event_dict.get("location", ""),
-                    event_dict.get("attendees", ""),
                     event_dict,
                     ""
-                )
+                ) + render_event_fields(event_dict)
         except Exception as e:
             error_msg = f"❌ 發生錯誤：{str(e)}"
-            print(f"Calendar Tool 錯誤：{e}")
-            import traceback
-            traceback.print_exc()
-            return (
+            logger.exception("Calendar Tool 錯誤：%s", e)
+            yield (
                 "❌ 發生錯誤",
                 f"❌ 發生錯誤：{str(e)}",
                 gr.update(visible=False),
                 gr.update(visible=False, choices=[]),
                 gr.update(visible=False, choices=[]),
                 gr.update(visible=False),
-                "", "", "", "", "", "", {},
+                {},
                 error_msg
-            )
+            ) + render_event_fields({})
     
     def fill_missing_info(event_dict_storage, selected_date, selected_time):
-        """填充缺失的資訊"""
+        """填充缺失的資訊（返回新的事件字典，不修改傳入的 event_dict_storage）"""
         if not event_dict_storage:
             return (
                 "❌ 沒有事件資料",
@@ -422,17 +604,14 @@ def _create_calendar_interface():
                 gr.update(visible=False, choices=[]),
                 gr.update(visible=False, choices=[]),
                 gr.update(visible=False),
-                "", "", "", "", "", "",
                 {}
-            )
+            ) + render_event_fields({})
         
         # 更新日期和時間
         if selected_date:
             # 從選項中提取日期字串（例如："明天 (2026-01-25)" -> "2026-01-25"）
-            if "(" in selected_date:
-                date_str = selected_date.split("(")[1].split(")")[0]
-            else:
-                date_str = selected_date
+            date_match = _DATE_IN_PARENS.search(selected_date)
+            date_str = date_match.group(1) if date_match else selected_date
         else:
             date_str = event_dict_storage.get("date", "今天")
         
@@ -442,12 +621,10 @@ def _create_calendar_interface():
             time_str = "09:00"  # 預設時間
         
         # 重新解析日期和時間
-        from ..agents.calendar_agent import parse_datetime # Import here to avoid circular dependency or unnecessary global import
         start_datetime, end_datetime = parse_datetime(date_str, time_str)
         
-        # 更新事件字典
-        event_dict_storage["start_datetime"] = start_datetime
-        event_dict_storage["end_datetime"] = end_datetime
+        # 建立更新後的事件字典
+        event_dict = {**event_dict_storage, "start_datetime": start_datetime, "end_datetime": end_datetime}
         
         return (
             "✅ 資訊已補充，請檢查並創建事件",
@@ -455,37 +632,46 @@ def _create_calendar_interface():
             gr.update(visible=False, choices=[]),
             gr.update(visible=False, choices=[]),
             gr.update(visible=False),
-            event_dict_storage.get("summary", ""),
-            start_datetime,
-            end_datetime,
-            event_dict_storage.get("description", ""),
-            event_dict_storage.get("location", ""),
-            event_dict_storage.get("attendees", ""),
-            event_dict_storage
+            event_dict
+        ) + render_event_fields(event_dict)
+    
+    def render_event_fields(event_dict):
+        """將事件字典轉換為事件詳情欄位的值"""
+        event_dict = event_dict or {}
+        return (
+            event_dict.get("summary", ""),
+            event_dict.get("start_datetime", ""),
+            event_dict.get("end_datetime", ""),
+            event_dict.get("description", ""),
+            event_dict.get("location", ""),
+            event_dict.get("attendees", "")
         )
     
     def create_event(summary, start_datetime, end_datetime, description, location, attendees):
         """創建行事曆事件"""
-        if not summary or not summary.strip():
+        # 每個欄位只去除一次空白，驗證和事件字典共用結果
+        summary = (summary or "").strip()
+        start_datetime = (start_datetime or "").strip()
+        end_datetime = (end_datetime or "").strip()
+        
+        if not summary:
             return "❌ 請輸入事件標題", "❌ 請輸入事件標題"
         
-        if not start_datetime or not start_datetime.strip():
+        if not start_datetime:
             return "❌ 請輸入開始時間", "❌ 請輸入開始時間"
         
-        if not end_datetime or not end_datetime.strip():
+        if not end_datetime:
             return "❌ 請輸入結束時間", "❌ 請輸入結束時間"
         
         try:
-            status_msg = "🔄 正在創建事件..."
-            
             # 構建事件字典
             event_dict = {
-                "summary": summary.strip(),
-                "start_datetime": start_datetime.strip(),
-                "end_datetime": end_datetime.strip(),
-                "description": description.strip() if description else "",
-                "location": location.strip() if location else "",
-                "attendees": attendees.strip() if attendees else "",
+                "summary": summary,
+                "start_datetime": start_datetime,
+                "end_datetime": end_datetime,
+                "description": (description or "").strip(),
+                "location": (location or "").strip(),
+                "attendees": (attendees or "").strip(),
                 "timezone": "Asia/Taipei"
             }
             
@@ -495,9 +681,7 @@ def _create_calendar_interface():
             return "✅ 事件已創建", result
         except Exception as e:
             error_msg = f"❌ 創建事件時發生錯誤：{str(e)}"
-            print(f"Calendar Tool 錯誤：{e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Calendar Tool 錯誤：%s", e)
             return "❌ 發生錯誤", error_msg
     
     def clear_calendar():
@@ -510,15 +694,27 @@ def _create_calendar_interface():
             gr.update(visible=False, choices=[]),  # missing_date
             gr.update(visible=False, choices=[]),  # missing_time
             gr.update(visible=False),  # fill_missing_btn
-            "", "", "", "", "", "",  # event fields
             {},
-            ""  # result
+            "",  # result
+            "", "", "", "", "", ""  # event fields
         )
     
+    # 事件詳情欄位
+    event_field_displays = [
+        event_summary_display,
+        event_start_display,
+        event_end_display,
+        event_description_display,
+        event_location_display,
+        event_attendees_display
+    ]
+    
     # 綁定事件
+    # 請求進行中時忽略同一按鈕的重複點擊（例如連點），避免重複執行多輪反思和重複創建事件
     generate_draft_btn.click(
         fn=generate_draft,
-        inputs=[calendar_prompt_input],
+        trigger_mode="once",
+        inputs=[calendar_prompt_input, reflection_memory_storage],
         outputs=[
             calendar_status_display,
             calendar_reflection_display,
@@ -526,15 +722,9 @@ def _create_calendar_interface():
             missing_date_display,
             missing_time_display,
             fill_missing_btn,
-            event_summary_display,
-            event_start_display,
-            event_end_display,
-            event_description_display,
-            event_location_display,
-            event_attendees_display,
             event_dict_storage,
             calendar_result_display
-        ]
+        ] + event_field_displays + [reflection_memory_storage]
     )
     
     # 綁定快速選擇按鈕（自動填充提示並生成草稿）
@@ -546,24 +736,20 @@ def _create_calendar_interface():
         missing_date_display,
         missing_time_display,
         fill_missing_btn,
-        event_summary_display,
-        event_start_display,
-        event_end_display,
-        event_description_display,
-        event_location_display,
-        event_attendees_display,
         event_dict_storage,
         calendar_result_display
     ]
     
-    quick_meeting_btn.click(fn=quick_select_meeting, outputs=quick_outputs)
-    quick_client_btn.click(fn=quick_select_client, outputs=quick_outputs)
-    quick_lunch_btn.click(fn=quick_select_lunch, outputs=quick_outputs)
-    quick_oneonone_btn.click(fn=quick_select_oneonone, outputs=quick_outputs)
-    quick_project_btn.click(fn=quick_select_project, outputs=quick_outputs)
-    quick_training_btn.click(fn=quick_select_training, outputs=quick_outputs)
-    quick_social_btn.click(fn=quick_select_social, outputs=quick_outputs)
-    quick_custom_btn.click(fn=quick_select_custom, outputs=quick_outputs)
+    quick_generate_outputs = quick_outputs + event_field_displays + [reflection_memory_storage]
+    
+    quick_meeting_btn.click(fn=partial(quick_select_and_generate, "meeting"), inputs=[reflection_memory_storage], outputs=quick_generate_outputs)
+    quick_client_btn.click(fn=partial(quick_select_and_generate, "client"), inputs=[reflection_memory_storage], outputs=quick_generate_outputs)
+    quick_lunch_btn.click(fn=partial(quick_select_and_generate, "lunch"), inputs=[reflection_memory_storage], outputs=quick_generate_outputs)
+    quick_oneonone_btn.click(fn=partial(quick_select_and_generate, "oneonone"), inputs=[reflection_memory_storage], outputs=quick_generate_outputs)
+    quick_project_btn.click(fn=partial(quick_select_and_generate, "project"), inputs=[reflection_memory_storage], outputs=quick_generate_outputs)
+    quick_training_btn.click(fn=partial(quick_select_and_generate, "training"), inputs=[reflection_memory_storage], outputs=quick_generate_outputs)
+    quick_social_btn.click(fn=partial(quick_select_and_generate, "social"), inputs=[reflection_memory_storage], outputs=quick_generate_outputs)
+    quick_custom_btn.click(fn=quick_select_custom, outputs=quick_outputs + event_field_displays)
     
     fill_missing_btn.click(
         fn=fill_missing_info,
@@ -574,18 +760,13 @@ def _create_calendar_interface():
             missing_date_display,
             missing_time_display,
             fill_missing_btn,
-            event_summary_display,
-            event_start_display,
-            event_end_display,
-            event_description_display,
-            event_location_display,
-            event_attendees_display,
             event_dict_storage
-        ]
+        ] + event_field_displays
     )
     
     create_event_btn.click(
         fn=create_event,
+        trigger_mode="once",
         inputs=[
             event_summary_display,
             event_start_display,
@@ -607,15 +788,9 @@ def _create_calendar_interface():
             missing_date_display,
             missing_time_display,
             fill_missing_btn,
-            event_summary_display,
-            event_start_display,
-            event_end_display,
-            event_description_display,
-            event_location_display,
-            event_attendees_display,
             event_dict_storage,
             calendar_result_display
-        ]
+        ] + event_field_displays
     )
     
     # 示例
@@ -636,7 +811,7 @@ def _create_calendar_interface():
         **注意事項：**
         1. 使用 Google Calendar API 管理行事曆事件
         2. 首次使用需要在專案根目錄放置 `credentials.json`（從 Google Cloud Console 下載的 OAuth2 憑證）
-        3. 首次運行時會自動開啟瀏覽器進行授權，授權後會生成 `token.json` 文件
+        3. 首次運行時會自動開啟瀏覽器進行授權，授權後會生成 `token_calendar.json` 文件
         4. 事件內容由 AI 自動生成，請在創建前檢查結果
         5. 在提示中包含所有資訊：事件、日期、時間、地點、參與者
         6. 如果缺少日期或時間，系統會顯示下拉選單讓您選擇
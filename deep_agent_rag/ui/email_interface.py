@@ -1,21 +1,21 @@
 # deep_agent_rag/ui/email_interface.py
 
 import gradio as gr
+import logging
+import queue
 import re
-import json
+import threading
 import time
+from typing import Optional
 
 from ..agents.email_agent import generate_email_draft, send_email_draft
+from ..tools.email_tool import _ADDR_RE, is_gmail_address
 from ..config import EMAIL_SENDER
-from ..utils.llm_utils import is_using_local_llm # Assuming this might be used for warnings/status
 
-# Agent log path for debugging (if needed)
-log_path = "/Users/matthuang/Desktop/Deep_Agentic_AI_Tool/.cursor/debug.log"
+logger = logging.getLogger(__name__)
 
-def _create_email_interface():
-    """創建 Email Tool 界面"""
-    gr.Markdown(
-        f"""
+# 介面說明文字只依賴匯入時就確定的 EMAIL_SENDER，在模組載入時格式化一次
+_HEADER_MD = f"""
         ### 📧 智能郵件助手
         
         使用 AI 根據您的關鍵提示自動生成專業郵件草稿，您可以在發送前檢查和修改。
@@ -44,7 +44,161 @@ def _create_email_interface():
         
         **注意：發件人必須是 Gmail 郵箱（因為使用 Gmail API），但收件人可以是任何郵箱地址。**
         """
-    )
+
+_FOOTER_MD = f"""
+        ---
+        **注意事項：**
+        1. 使用 Gmail API 發送郵件，避免被歸類為垃圾郵件
+        2. **發件人必須是 Gmail 郵箱（因為使用 Gmail API），但收件人可以是任何郵箱地址**
+        3. 首次使用需要在專案根目錄放置 OAuth2 憑證文件（從 Google Cloud Console 下載）
+        4. 如果使用預設發件人，需要 `credentials_matthuang.json` 和 `token.json`
+        5. 如果使用其他發件人，系統會自動尋找 `credentials_{{username}}.json`，如果不存在則使用預設憑證文件
+        6. 首次使用新帳號時會自動開啟瀏覽器進行授權，授權後會生成 `token_{{username}}.json` 文件
+        7. 郵件內容由 AI 自動生成，請在發送前檢查結果
+        8. 預設寄件者：{EMAIL_SENDER}（可在上方輸入框中修改）
+        
+        **設置步驟：**
+        - 前往 [Google Cloud Console](https://console.cloud.google.com/) 創建專案
+        - 啟用 Gmail API
+        - 創建 OAuth2 憑證並下載
+        - 將憑證文件放在專案根目錄（命名為 `credentials.json` 或 `credentials_{{username}}.json`）
+        - 首次使用時會自動觸發授權流程
+        """
+
+# 郵箱驗證規則：匯入時編譯一次，每次點擊只需一次比對（發件人格式和 Gmail 判斷與 email_tool 共用）
+_RECIPIENT_SPLIT_RE = re.compile(r"\s*,\s*")
+# 收件人輸入中的郵箱片段（不跨逗號、空白和 @），一次 findall 找出所有格式正確的地址
+_EMAIL_TOKEN_RE = re.compile(r"[^\s,@]+@[^\s,@]+\.[^\s,@]+")
+
+# 固定的輸入驗證錯誤輸出
+# generate_draft：(狀態, 主題, 正文, 結果)，反思欄位由 _hidden_reflection() 另外補上；send_draft：(狀態, 結果)
+_DRAFT_ERR_NO_PROMPT = ("❌ 請輸入郵件提示", "", "", "❌ 請輸入郵件提示")
+_DRAFT_ERR_NO_RECIPIENT = ("❌ 請輸入收件人郵箱", "", "", "❌ 請輸入收件人郵箱")
+_SEND_ERR_NO_RECIPIENT = ("❌ 請輸入收件人郵箱", "❌ 請輸入收件人郵箱")
+_SEND_ERR_NO_SUBJECT = ("❌ 請輸入郵件主題", "❌ 請輸入郵件主題")
+_SEND_ERR_NO_BODY = ("❌ 請輸入郵件內容", "❌ 請輸入郵件內容")
+# _check_sender / _check_recipients：(狀態, 詳細錯誤訊息)，兩個處理函數共用
+_RECIPIENT_ERR_NONE_VALID = ("❌ 請輸入至少一個收件人郵箱", "❌ 請輸入至少一個收件人郵箱")
+_SENDER_ERR_FORMAT = ("❌ 發件人郵箱格式不正確", "❌ 發件人郵箱格式不正確，請輸入有效的郵箱地址")
+_SENDER_ERR_NOT_GMAIL = ("❌ 發件人必須是 Gmail 郵箱", "❌ 發件人必須是 Gmail 郵箱（@gmail.com 或 @googlemail.com）")
+
+# 郵件草稿快取：{(正規化提示, 主要收件人): (時間戳, generate_email_draft 的結果)}
+# 重複點擊和示例提示會送出相同的請求，快取可跳過多輪 LLM 反思
+_DRAFT_CACHE_TTL = 3600  # 秒
+_DRAFT_CACHE_MAXSIZE = 128
+_draft_cache = {}
+_draft_cache_lock = threading.Lock()
+
+
+def _generate_email_draft_cached(prompt: str, recipient: str, on_progress=None):
+    """
+    生成郵件草稿（帶快取，包含反思功能）
+    
+    只快取成功生成的草稿；命中快取時不會呼叫 on_progress
+    鍵使用完整的收件人地址（不只網域），因為草稿內容會針對收件人撰寫
+    
+    Args:
+        prompt: 郵件提示
+        recipient: 主要收件人郵箱
+        on_progress: 傳給 generate_email_draft 的進度回呼（可選）
+    
+    Returns:
+        與 generate_email_draft 相同的 (主題, 正文, 狀態, 反思結果, 是否改進, 反思輪數) 元組
+    """
+    cache_key = (" ".join(prompt.split()), recipient.lower())
+    now = time.time()
+    
+    with _draft_cache_lock:
+        cached = _draft_cache.get(cache_key)
+    if cached and now - cached[0] < _DRAFT_CACHE_TTL:
+        return cached[1]
+    
+    result = generate_email_draft(prompt, recipient, enable_reflection=True, on_progress=on_progress)
+    if result[0] and result[1]:
+        with _draft_cache_lock:
+            if len(_draft_cache) >= _DRAFT_CACHE_MAXSIZE:
+                for stale_key in [k for k, (ts, _) in _draft_cache.items() if now - ts >= _DRAFT_CACHE_TTL]:
+                    del _draft_cache[stale_key]
+                if len(_draft_cache) >= _DRAFT_CACHE_MAXSIZE:
+                    del _draft_cache[next(iter(_draft_cache))]
+            _draft_cache[cache_key] = (now, result)
+    return result
+
+
+def _hidden_reflection():
+    """
+    錯誤路徑使用的反思欄位更新：錯誤訊息已顯示在狀態和結果欄位，隱藏 8 行的反思文字框，不必重新渲染其內容
+    
+    每次都建立新的更新字典（Gradio 處理更新時可能會修改字典，不能共用同一個）
+    """
+    return gr.update(visible=False)
+
+
+def _shown_reflection(text: str):
+    """
+    顯示反思文字框並更新內容（錯誤路徑隱藏後需要重新顯示）
+    
+    Args:
+        text: 反思欄位要顯示的內容
+    """
+    return gr.update(value=text, visible=True)
+
+
+def _check_sender(sender: Optional[str]) -> tuple[Optional[str], Optional[tuple[str, str]]]:
+    """
+    處理發件人輸入，提供時驗證郵箱格式和 Gmail 限制
+    
+    Args:
+        sender: 發件人輸入（可為空，表示使用預設發件人）
+    
+    Returns:
+        (去除空白的發件人或 None, 錯誤)；驗證通過時錯誤為 None，否則為 (狀態訊息, 詳細錯誤訊息)
+    """
+    actual_sender = sender.strip() if sender else ""
+    if not actual_sender:
+        return None, None
+    if not _ADDR_RE.fullmatch(actual_sender):
+        return actual_sender, _SENDER_ERR_FORMAT
+    if not is_gmail_address(actual_sender):
+        return actual_sender, _SENDER_ERR_NOT_GMAIL
+    return actual_sender, None
+
+
+def _check_recipients(recipient: str) -> tuple[list[str], Optional[tuple[str, str]]]:
+    """
+    解析收件人（支援多個，用逗號分隔）並驗證格式
+    
+    Args:
+        recipient: 收件人輸入
+    
+    Returns:
+        (收件人列表, 錯誤)；驗證通過時錯誤為 None，否則收件人列表為空，錯誤為 (狀態訊息, 詳細錯誤訊息)
+    """
+    recipients = [email for email in _RECIPIENT_SPLIT_RE.split(recipient.strip()) if email]
+    if not recipients:
+        return [], _RECIPIENT_ERR_NONE_VALID
+    
+    # 整段輸入只掃描一次；不在有效集合中的項目（例如含空白或多個 @）即為格式不正確
+    valid_emails = set(_EMAIL_TOKEN_RE.findall(recipient))
+    invalid_emails = [email for email in recipients if email not in valid_emails]
+    if invalid_emails:
+        return [], (
+            "❌ 收件人郵箱格式不正確",
+            f"❌ 以下收件人郵箱格式不正確：{', '.join(invalid_emails)}"
+        )
+    return recipients, None
+
+
+def _create_email_interface(concurrency_limit: int = 8):
+    """
+    創建 Email Tool 界面
+    
+    Args:
+        concurrency_limit: 生成和發送郵件的事件各自允許同時執行的請求數（LLM 和 Gmail API 呼叫都是 I/O 等待，
+            多個使用者的請求可以重疊執行；草稿快取有鎖保護、Gmail 服務每個執行緒各自建立、LLM 實例的建立和切換有鎖保護）。
+            其他分頁的事件維持 Gradio 預設的一次一個請求
+    """
+    gr.Markdown(_HEADER_MD)
     
     with gr.Row():
         with gr.Column(scale=1):
@@ -123,66 +277,76 @@ def _create_email_interface():
             )
     
     # 事件處理函數
+    def partial_draft_outputs(subject, body, round_number):
+        """反思進行中時顯示的中間結果"""
+        if round_number == 0:
+            status = "🔄 郵件初稿已生成，AI 反思評估中..."
+        else:
+            status = f"🔄 已完成第 {round_number} 輪 AI 反思優化，繼續評估中..."
+        return status, subject, body, "", _shown_reflection("🔄 正在進行 AI 反思評估...")
+    
     def generate_draft(sender, prompt, recipient):
-        """生成郵件草稿（包含反思功能）"""
+        """生成郵件草稿（包含反思功能，逐步顯示反思過程中的版本）"""
         if not prompt or not prompt.strip():
-            return "❌ 請輸入郵件提示", "", "", "❌ 請輸入郵件提示", "❌ 請輸入郵件提示"
+            yield (*_DRAFT_ERR_NO_PROMPT, _hidden_reflection())
+            return
         
         if not recipient or not recipient.strip():
-            return "❌ 請輸入收件人郵箱", "", "", "❌ 請輸入收件人郵箱", "❌ 請輸入收件人郵箱"
-        
-        # 處理發件人（如果提供）
-        actual_sender = sender.strip() if sender and sender.strip() else None
+            yield (*_DRAFT_ERR_NO_RECIPIENT, _hidden_reflection())
+            return
         
-        # 如果提供了發件人，驗證發件人郵箱格式和 Gmail 限制
-        if actual_sender:
-            if "@" not in actual_sender or "." not in actual_sender.split("@")[1]:
-                return "❌ 發件人郵箱格式不正確", "", "", "❌ 發件人郵箱格式不正確，請輸入有效的郵箱地址", "❌ 發件人郵箱格式不正確，請輸入有效的郵箱地址"
-            
-            sender_lower = actual_sender.strip().lower()
-            if not (sender_lower.endswith("@gmail.com") or sender_lower.endswith("@googlemail.com")):
-                return "❌ 發件人必須是 Gmail 郵箱", "", "", "❌ 發件人必須是 Gmail 郵箱（@gmail.com 或 @googlemail.com）", "❌ 發件人必須是 Gmail 郵箱（@gmail.com 或 @googlemail.com）"
-        
-        # 解析收件人（支援多個，用逗號分隔）
-        recipients = [email.strip() for email in recipient.split(',') if email.strip()]
-        
-        if not recipients:
-            return "❌ 請輸入至少一個收件人郵箱", "", "", "❌ 請輸入至少一個收件人郵箱", "❌ 請輸入至少一個收件人郵箱"
-        
-        # 驗證每個收件人郵箱格式
-        invalid_emails = []
-        for email in recipients:
-            if "@" not in email or "." not in email.split("@")[1]:
-                invalid_emails.append(email)
-        
-        if invalid_emails:
-            return (
-                "❌ 收件人郵箱格式不正確",
-                "",
-                "",
-                f"❌ 以下收件人郵箱格式不正確：{', '.join(invalid_emails)}",
-                f"❌ 以下收件人郵箱格式不正確：{', '.join(invalid_emails)}"
-            )
+        # 驗證發件人（如果提供）和收件人（支援多個，用逗號分隔）
+        _, error = _check_sender(sender)
+        if not error:
+            recipients, error = _check_recipients(recipient)
+        if error:
+            status, detail = error
+            yield status, "", "", detail, _hidden_reflection()
+            return
         
         # 使用第一個收件人來生成郵件（郵件生成通常針對單一收件人）
         primary_recipient = recipients[0]
         
         try:
-            status_msg = "🔄 正在生成郵件草稿..."
-            reflection_msg = "🔄 正在生成郵件草稿..."
-            
-            # 生成郵件草稿（包含反思功能，會自動改進）
+            # 在背景執行緒生成郵件草稿（包含反思功能，會自動改進），初稿和每輪反思改進的版本先顯示出來
             # 使用第一個收件人來生成郵件內容
-            subject, body, status, reflection_result, was_improved = generate_email_draft(
-                prompt, primary_recipient, enable_reflection=True
-            )
+            progress_queue = queue.Queue()
+            outcome = {}
+            
+            def _run_draft():
+                try:
+                    outcome["result"] = _generate_email_draft_cached(
+                        prompt,
+                        primary_recipient,
+                        on_progress=lambda partial_subject, partial_body, round_number: progress_queue.put(
+                            (partial_subject, partial_body, round_number)
+                        )
+                    )
+                except Exception as e:
+                    outcome["error"] = e
+                finally:
+                    progress_queue.put(None)
+            
+            worker = threading.Thread(target=_run_draft, daemon=True)
+            worker.start()
+            finished = False
+            while not finished:
+                # 佇列中累積多個中間版本時只顯示最新的一個；生成已結束時直接顯示最終結果
+                items = [progress_queue.get()]
+                while not progress_queue.empty():
+                    items.append(progress_queue.get_nowait())
+                finished = items[-1] is None
+                if not finished:
+                    yield partial_draft_outputs(*items[-1])
+            worker.join()
+            
+            if "error" in outcome:
+                raise outcome["error"]
+            subject, body, status, reflection_result, was_improved, reflection_count = outcome["result"]
             
             if subject and body:
                 # 格式化反思結果顯示
                 if reflection_result:
-                    # 計算反思輪數
-                    reflection_count = reflection_result.count("【第") if "【第" in reflection_result else 0
-                    
                     if was_improved:
                         if reflection_count > 1:
                             reflection_display = (
@@ -205,86 +369,62 @@ def _create_email_interface():
                 else:
                     reflection_display = "⚠️ 反思功能未返回結果"
                 
-                return status, subject, body, "", reflection_display
+                yield status, subject, body, "", _shown_reflection(reflection_display)
             else:
-                return status, "", "", status, "❌ 生成失敗，無法進行反思評估"
+                yield status, "", "", status, _hidden_reflection()
         except Exception as e:
             error_msg = f"❌ 發生錯誤：{str(e)}"
-            print(f"Email Tool 錯誤：{e}")
-            import traceback
-            traceback.print_exc()
-            return "❌ 發生錯誤", "", "", error_msg, f"❌ 發生錯誤：{str(e)}"
+            logger.exception("Email Tool 錯誤：%s", e)
+            yield "❌ 發生錯誤", "", "", error_msg, _hidden_reflection()
     
     def send_draft(sender, recipient, subject, body):
         """發送已編輯的郵件草稿"""
         if not recipient or not recipient.strip():
-            return "❌ 請輸入收件人郵箱", "❌ 請輸入收件人郵箱"
+            return _SEND_ERR_NO_RECIPIENT
         
         if not subject or not subject.strip():
-            return "❌ 請輸入郵件主題", "❌ 請輸入郵件主題"
+            return _SEND_ERR_NO_SUBJECT
         
         if not body or not body.strip():
-            return "❌ 請輸入郵件內容", "❌ 請輸入郵件內容"
-        
-        # 處理發件人（如果提供）
-        actual_sender = sender.strip() if sender and sender.strip() else None
-        
-        # 如果提供了發件人，驗證發件人郵箱格式和 Gmail 限制
-        if actual_sender:
-            if "@" not in actual_sender or "." not in actual_sender.split("@")[1]:
-                return "❌ 發件人郵箱格式不正確", "❌ 發件人郵箱格式不正確，請輸入有效的郵箱地址"
-            
-            sender_lower = actual_sender.strip().lower()
-            if not (sender_lower.endswith("@gmail.com") or sender_lower.endswith("@googlemail.com")):
-                return "❌ 發件人必須是 Gmail 郵箱", "❌ 發件人必須是 Gmail 郵箱（@gmail.com 或 @googlemail.com）"
-        
-        # 解析收件人（支援多個，用逗號分隔）
-        recipients = [email.strip() for email in recipient.split(',') if email.strip()]
-        
-        if not recipients:
-            return "❌ 請輸入至少一個收件人郵箱", "❌ 請輸入至少一個收件人郵箱"
+            return _SEND_ERR_NO_BODY
         
-        # 驗證每個收件人郵箱格式
-        invalid_emails = []
-        for email in recipients:
-            if "@" not in email or "." not in email.split("@")[1]:
-                invalid_emails.append(email)
-        
-        if invalid_emails:
-            return (
-                "❌ 收件人郵箱格式不正確",
-                f"❌ 以下收件人郵箱格式不正確：{', '.join(invalid_emails)}"
-            )
+        # 驗證發件人（如果提供）和收件人（支援多個，用逗號分隔）
+        actual_sender, error = _check_sender(sender)
+        if error:
+            return error
+        recipients, error = _check_recipients(recipient)
+        if error:
+            return error
         
         try:
-            status_msg = "🔄 正在發送郵件..."
-            
-            # 發送郵件（傳遞發件人參數，底層工具會處理多個收件人）
-            result = send_email_draft(recipient.strip(), subject.strip(), body.strip(), actual_sender)
+            # 發送郵件（傳遞已解析的收件人列表和發件人參數，所有收件人在同一次 Gmail API 呼叫中發送）
+            result = send_email_draft(recipients, subject.strip(), body.strip(), actual_sender)
             
             return "✅ 郵件已發送", result
         except Exception as e:
             error_msg = f"❌ 發送郵件時發生錯誤：{str(e)}"
-            print(f"Email Tool 錯誤：{e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Email Tool 錯誤：%s", e)
             return "❌ 發生錯誤", error_msg
     
     def clear_email():
         """清除郵件相關輸入和輸出"""
-        return "", "", "", "等待操作...", "", "", "等待生成郵件..."
+        return "", "", "", "等待操作...", "", "", _shown_reflection("等待生成郵件...")
     
     # 綁定事件
+    # 只顯示精簡的進度指示，中間版本由 generate_draft 逐步輸出；允許多個使用者同時生成草稿
     generate_draft_btn.click(
         fn=generate_draft,
         inputs=[sender_input, email_prompt_input, recipient_input],
-        outputs=[email_status_display, email_subject_input, email_body_input, email_result_display, email_reflection_display]
+        outputs=[email_status_display, email_subject_input, email_body_input, email_result_display, email_reflection_display],
+        show_progress="minimal",
+        concurrency_limit=concurrency_limit
     )
     
     send_draft_btn.click(
         fn=send_draft,
         inputs=[sender_input, recipient_input, email_subject_input, email_body_input],
-        outputs=[email_status_display, email_result_display]
+        outputs=[email_status_display, email_result_display],
+        concurrency_limit=concurrency_limit
     )
     
     clear_email_btn.click(
@@ -304,24 +444,4 @@ def _create_email_interface():
     )
     
     # 頁腳說明
-    gr.Markdown(
-        f"""
-        ---
-        **注意事項：**
-        1. 使用 Gmail API 發送郵件，避免被歸類為垃圾郵件
-        2. **發件人必須是 Gmail 郵箱（因為使用 Gmail API），但收件人可以是任何郵箱地址**
-        3. 首次使用需要在專案根目錄放置 OAuth2 憑證文件（從 Google Cloud Console 下載）
-        4. 如果使用預設發件人，需要 `credentials_matthuang.json` 和 `token.json`
-        5. 如果使用其他發件人，系統會自動尋找 `credentials_{{username}}.json`，如果不存在則使用預設憑證文件
-        6. 首次使用新帳號時會自動開啟瀏覽器進行授權，授權後會生成 `token_{{username}}.json` 文件
-        7. 郵件內容由 AI 自動生成，請在發送前檢查結果
-        8. 預設寄件者：{EMAIL_SENDER}（可在上方輸入框中修改）
-        
-        **設置步驟：**
-        - 前往 [Google Cloud Console](https://console.cloud.google.com/) 創建專案
-        - 啟用 Gmail API
-        - 創建 OAuth2 憑證並下載
-        - 將憑證文件放在專案根目錄（命名為 `credentials.json` 或 `credentials_{{username}}.json`）
-        - 首次使用時會自動觸發授權流程
-        """
-    )
+    gr.Markdown(_FOOTER_MD)
@@ -19,6 +19,14 @@ from .private_file_rag_interface import _create_private_file_rag_interface
 from .simple_chatbot_interface import create_simple_chatbot_interface
 from .image_analysis_interface import _create_image_analysis_interface
 
+# 報告逐句顯示用的斷句正則（支持中文標點：。！？、換行和英文標點：. ! ?）
+# 每個匹配是「句子內容 + 結尾標點」（英文標點後需接空白，例如 3.14 不會被斷開），最後沒有標點的部分單獨成句；
+# 所有匹配依序相接即為完整報告，一次 findall 就得到帶標點的句子列表
+_SENTENCE_RE = re.compile(
+    r'(?:[^。！？\n.!?]|[.!?](?!\s))*(?:[。！？\n]+|[.!?]\s+)'
+    r'|(?:[^。！？\n.!?]|[.!?](?!\s))+$'
+)
+
 
 def run_research_agent(query: str, graph, thread_id: str = None) -> Iterator[Tuple[str, str, str, str, str]]:
     """
@@ -142,41 +150,23 @@ def run_research_agent(query: str, graph, thread_id: str = None) -> Iterator[Tup
                     full_report = data["messages"][-1].content
                     current_node = "📊 正在生成報告..."
                     
-                    # 按句子分割並逐步顯示（支持中英文標點）
-                    # 使用正則表達式分割句子（支持中文標點：。！？和英文標點：. ! ?）
-                    sentence_pattern = r'([。！？\n\n]+|\.\s+|!\s+|\?\s+)'
-                    parts = re.split(sentence_pattern, full_report)
-                    
-                    # 重新組合句子（保留標點）
-                    sentence_parts = []
-                    i = 0
-                    while i < len(parts):
-                        if i + 1 < len(parts) and re.match(sentence_pattern, parts[i + 1]):
-                            # 句子 + 標點
-                            sentence_parts.append(parts[i] + parts[i + 1])
-                            i += 2
-                        else:
-                            # 單獨的句子或標點
-                            if parts[i].strip():
-                                sentence_parts.append(parts[i])
-                            i += 1
+                    # 按句子分割並逐步顯示（支持中英文標點，保留標點）
+                    sentence_parts = _SENTENCE_RE.findall(full_report)
                     
                     # 如果分割失敗，使用簡單的字符塊方式
                     if not sentence_parts or len(sentence_parts) == 1:
                         # 按字符塊逐步顯示（每20個字符）
                         chunk_size = 20
-                        accumulated_text = ""
-                        for i in range(0, len(full_report), chunk_size):
-                            accumulated_text = full_report[:i + chunk_size]
-                            report_display = accumulated_text
+                        for end in range(chunk_size, len(full_report) + chunk_size, chunk_size):
+                            report_display = full_report[:end]
                             yield current_node, tasks_display, notes_display, report_display, warning_msg
                             time.sleep(0.03)  # 每塊之間的延遲（30毫秒）
                     else:
-                        # 逐步顯示每個句子
-                        accumulated_text = ""
+                        # 逐步顯示每個句子：句子依序相接即為完整報告，直接按累計長度切出已顯示的前綴
+                        end = 0
                         for sentence in sentence_parts:
-                            accumulated_text += sentence
-                            report_display = accumulated_text
+                            end += len(sentence)
+                            report_display = full_report[:end]
                             yield current_node, tasks_display, notes_display, report_display, warning_msg
                             time.sleep(0.1)  # 每句之間的延遲（100毫秒）
                     
@@ -7,8 +7,6 @@ import os
 import time
 
 from ..rag.private_file_rag import get_private_rag_instance, reset_private_rag_instance
-# Assuming is_using_local_llm might be used for warnings/status, similar to email_interface
-# from ..utils.llm_utils import is_using_local_llm 
 
 # Agent log path for debugging (if needed)
 log_path = "/Users/matthuang/Desktop/Deep_Agentic_AI_Tool/.cursor/debug.log"
@@ -3,6 +3,8 @@ LLM 工具函數
 提供 LLM 實例的創建和管理
 優先順序：Groq API > Ollama > MLX 模型
 """
+import threading
+import time
 import warnings
 from typing import Optional
 from langchain_groq import ChatGroq
@@ -26,6 +28,15 @@ from ..config import (
 # 全局變量：跟踪當前使用的 LLM 類型
 _current_llm_type = None
 _groq_quota_exceeded = False
+# 全局變量：快取已創建的 LLM 實例，避免每次呼叫都重新建立客戶端
+_llm_instance = None
+# 全局變量：快取本地模型實例（Ollama / MLX），冷卻後切回 Groq 時保留，再次額度用完不必重新載入
+_local_llm_instance = None
+# Groq 額度用完的時間；經過冷卻時間後 get_llm 會重新嘗試 Groq，不會永遠停留在備援模型
+_groq_quota_exceeded_at = None
+_GROQ_RETRY_COOLDOWN = 600  # 秒
+# 保護 LLM 實例的建立和切換（UI 事件會在多個執行緒中同時呼叫 get_llm / handle_groq_error）
+_llm_lock = threading.Lock()
 
 
 def get_llm_type() -> str:
@@ -38,71 +49,108 @@ def is_using_local_llm() -> bool:
     return _current_llm_type in ["mlx", "ollama"] or _groq_quota_exceeded
 
 
+def _groq_retry_due() -> bool:
+    """檢查 Groq 額度用完後是否已超過冷卻時間，可以重新嘗試 Groq"""
+    return (
+        _groq_quota_exceeded_at is not None
+        and time.monotonic() - _groq_quota_exceeded_at >= _GROQ_RETRY_COOLDOWN
+    )
+
+
 def get_llm():
     """
     獲取 LLM 實例
     優先順序：Groq API > Ollama > MLX 模型
-    """
-    global _current_llm_type, _groq_quota_exceeded
     
-    # 優先順序 1: Groq API
-    if USE_GROQ_FIRST and GROQ_API_KEY:
-        try:
-            groq_llm = ChatGroq(
-                groq_api_key=GROQ_API_KEY,
-                model_name=GROQ_MODEL,
-                max_tokens=GROQ_MAX_TOKENS,
-                temperature=GROQ_TEMPERATURE
-            )
-            _current_llm_type = "groq"
-            print("✅ 使用 Groq API (優先)")
-            return groq_llm
-        except Exception as e:
-            # 如果創建失敗，繼續嘗試其他選項
-            print(f"⚠️ Groq API 初始化失敗: {e}")
-            # 不立即設置 _groq_quota_exceeded，先嘗試 Ollama
-    
-    # 優先順序 2: Ollama (Llama 3.2 或其他模型)
-    if USE_OLLAMA:
-        try:
-            ollama_llm = ChatOllama(
-                base_url=OLLAMA_BASE_URL,
-                model=OLLAMA_MODEL,
-                num_predict=OLLAMA_MAX_TOKENS,
-                temperature=OLLAMA_TEMPERATURE,
-            )
-            _current_llm_type = "ollama"
-            print(f"✅ 使用 Ollama 模型 ({OLLAMA_MODEL})")
-            return ollama_llm
-        except Exception as e:
-            print(f"⚠️ Ollama 初始化失敗: {e}")
-            print("   請確保 Ollama 服務正在運行: ollama serve")
-            print("   或檢查模型是否已下載: ollama pull " + OLLAMA_MODEL)
+    實例只會建立一次，之後的呼叫直接返回快取的實例；
+    若 handle_groq_error 切換到備援模型，快取會一併更新，
+    並在 _GROQ_RETRY_COOLDOWN 秒後重新嘗試 Groq。
+    """
+    global _current_llm_type, _groq_quota_exceeded, _groq_quota_exceeded_at, _llm_instance, _local_llm_instance
     
-    # 優先順序 3: MLX 模型（備援）
-    # 如果 Groq 額度用完，記錄狀態
-    if _groq_quota_exceeded and _current_llm_type != "mlx":
-        print("⚠️ 警告：Groq API 額度已用完，已切換到本地 MLX 模型 (Qwen2.5)")
-    elif _current_llm_type != "mlx":
-        if not GROQ_API_KEY and not USE_OLLAMA:
-            print("ℹ️ 未配置 Groq API 或 Ollama，使用本地 MLX 模型")
-        elif not USE_OLLAMA:
-            print("ℹ️ Ollama 未啟用，使用本地 MLX 模型作為備援")
+    if _llm_instance is not None and not _groq_retry_due():
+        return _llm_instance
     
-    _current_llm_type = "mlx"
-    model, tokenizer = load_mlx_model()
-    return MLXChatModel(
-        model=model,
-        tokenizer=tokenizer,
-        max_tokens=MLX_MAX_TOKENS,
-        temperature=MLX_TEMPERATURE
-    )
+    # 多個請求同時執行時只建立一個實例（MLX 模型也只載入一次）
+    with _llm_lock:
+        if _llm_instance is not None and not _groq_retry_due():
+            return _llm_instance
+        
+        # 冷卻時間已過：清除備援狀態，重新從 Groq 開始嘗試（本地模型實例保留供下次切換使用）
+        if _groq_retry_due():
+            print("ℹ️ Groq API 冷卻時間已過，重新嘗試使用 Groq API")
+            _groq_quota_exceeded = False
+            _groq_quota_exceeded_at = None
+            _llm_instance = None
+        
+        # 優先順序 1: Groq API
+        if USE_GROQ_FIRST and GROQ_API_KEY:
+            try:
+                groq_llm = ChatGroq(
+                    groq_api_key=GROQ_API_KEY,
+                    model_name=GROQ_MODEL,
+                    max_tokens=GROQ_MAX_TOKENS,
+                    temperature=GROQ_TEMPERATURE
+                )
+                _current_llm_type = "groq"
+                print("✅ 使用 Groq API (優先)")
+                _llm_instance = groq_llm
+                return groq_llm
+            except Exception as e:
+                # 如果創建失敗，繼續嘗試其他選項
+                print(f"⚠️ Groq API 初始化失敗: {e}")
+                # 不立即設置 _groq_quota_exceeded，先嘗試 Ollama
+        
+        # 之前已建立過本地模型時直接沿用
+        if _local_llm_instance is not None:
+            _current_llm_type = "ollama" if isinstance(_local_llm_instance, ChatOllama) else "mlx"
+            _llm_instance = _local_llm_instance
+            return _llm_instance
+        
+        # 優先順序 2: Ollama (Llama 3.2 或其他模型)
+        if USE_OLLAMA:
+            try:
+                ollama_llm = ChatOllama(
+                    base_url=OLLAMA_BASE_URL,
+                    model=OLLAMA_MODEL,
+                    num_predict=OLLAMA_MAX_TOKENS,
+                    temperature=OLLAMA_TEMPERATURE,
+                )
+                _current_llm_type = "ollama"
+                print(f"✅ 使用 Ollama 模型 ({OLLAMA_MODEL})")
+                _llm_instance = _local_llm_instance = ollama_llm
+                return ollama_llm
+            except Exception as e:
+                print(f"⚠️ Ollama 初始化失敗: {e}")
+                print("   請確保 Ollama 服務正在運行: ollama serve")
+                print("   或檢查模型是否已下載: ollama pull " + OLLAMA_MODEL)
+        
+        # 優先順序 3: MLX 模型（備援）
+        # 如果 Groq 額度用完，記錄狀態
+        if _groq_quota_exceeded and _current_llm_type != "mlx":
+            print("⚠️ 警告：Groq API 額度已用完，已切換到本地 MLX 模型 (Qwen2.5)")
+        elif _current_llm_type != "mlx":
+            if not GROQ_API_KEY and not USE_OLLAMA:
+                print("ℹ️ 未配置 Groq API 或 Ollama，使用本地 MLX 模型")
+            elif not USE_OLLAMA:
+                print("ℹ️ Ollama 未啟用，使用本地 MLX 模型作為備援")
+        
+        _current_llm_type = "mlx"
+        model, tokenizer = load_mlx_model()
+        _llm_instance = _local_llm_instance = MLXChatModel(
+            model=model,
+            tokenizer=tokenizer,
+            max_tokens=MLX_MAX_TOKENS,
+            temperature=MLX_TEMPERATURE
+        )
+        return _llm_instance
 
 
 def handle_groq_error(error: Exception) -> Optional[MLXChatModel]:
     """
     處理 Groq API 錯誤
-    如果是額度用完錯誤，先嘗試切換到 Ollama，否則切換到 MLX 模型
+    如果是額度用完錯誤，先嘗試切換到 Ollama，否則切換到 MLX 模型；
+    切換只維持 _GROQ_RETRY_COOLDOWN 秒，之後 get_llm 會重新嘗試 Groq
     
     Args:
         error: 捕獲的異常
@@ -110,7 +158,7 @@ def handle_groq_error(error: Exception) -> Optional[MLXChatModel]:
     Returns:
         如果切換到本地模型，返回 ChatOllama 或 MLXChatModel；否則返回 None
     """
-    global _current_llm_type, _groq_quota_exceeded
+    global _current_llm_type, _groq_quota_exceeded, _groq_quota_exceeded_at, _llm_instance, _local_llm_instance
     
     error_str = str(error).lower()
     
@@ -125,37 +173,51 @@ def handle_groq_error(error: Exception) -> Optional[MLXChatModel]:
     ]
     
     if any(indicator in error_str for indicator in quota_indicators):
-        if not _groq_quota_exceeded:
-            _groq_quota_exceeded = True
-            warning_msg = "⚠️ 警告：Groq API 額度已用完"
-            print(warning_msg)
-            warnings.warn(warning_msg, UserWarning)
-        
-        # 先嘗試使用 Ollama
-        if USE_OLLAMA:
-            try:
-                ollama_llm = ChatOllama(
-                    base_url=OLLAMA_BASE_URL,
-                    model=OLLAMA_MODEL,
-                    num_predict=OLLAMA_MAX_TOKENS,
-                    temperature=OLLAMA_TEMPERATURE,
-                )
-                _current_llm_type = "ollama"
-                print(f"✅ 已切換到 Ollama 模型 ({OLLAMA_MODEL})")
-                return ollama_llm
-            except Exception as e:
-                print(f"⚠️ Ollama 切換失敗: {e}")
-                print("   回退到 MLX 模型")
-        
-        # 回退到 MLX 模型
-        _current_llm_type = "mlx"
-        model, tokenizer = load_mlx_model()
-        return MLXChatModel(
-            model=model,
-            tokenizer=tokenizer,
-            max_tokens=MLX_MAX_TOKENS,
-            temperature=MLX_TEMPERATURE
-        )
+        with _llm_lock:
+            # 其他請求已經完成切換時直接沿用，不重複建立本地模型
+            if _groq_quota_exceeded and _current_llm_type in ("ollama", "mlx"):
+                return _llm_instance
+            
+            if not _groq_quota_exceeded:
+                _groq_quota_exceeded = True
+                warning_msg = "⚠️ 警告：Groq API 額度已用完"
+                print(warning_msg)
+                warnings.warn(warning_msg, UserWarning)
+            _groq_quota_exceeded_at = time.monotonic()
+            
+            # 之前已建立過本地模型時直接沿用
+            if _local_llm_instance is not None:
+                _current_llm_type = "ollama" if isinstance(_local_llm_instance, ChatOllama) else "mlx"
+                _llm_instance = _local_llm_instance
+                return _llm_instance
+            
+            # 先嘗試使用 Ollama
+            if USE_OLLAMA:
+                try:
+                    ollama_llm = ChatOllama(
+                        base_url=OLLAMA_BASE_URL,
+                        model=OLLAMA_MODEL,
+                        num_predict=OLLAMA_MAX_TOKENS,
+                        temperature=OLLAMA_TEMPERATURE,
+                    )
+                    _current_llm_type = "ollama"
+                    print(f"✅ 已切換到 Ollama 模型 ({OLLAMA_MODEL})")
+                    _llm_instance = _local_llm_instance = ollama_llm
+                    return ollama_llm
+                except Exception as e:
+                    print(f"⚠️ Ollama 切換失敗: {e}")
+                    print("   回退到 MLX 模型")
+            
+            # 回退到 MLX 模型
+            _current_llm_type = "mlx"
+            model, tokenizer = load_mlx_model()
+            _llm_instance = _local_llm_instance = MLXChatModel(
+                model=model,
+                tokenizer=tokenizer,
+                max_tokens=MLX_MAX_TOKENS,
+                temperature=MLX_TEMPERATURE
+            )
+            return _llm_instance
     
     return None
 
@@ -4,10 +4,14 @@
 支援兩種初始化方式：
 1. 自動初始化 embeddings（預設）：根據參數創建新的 embedding 模型
 2. 使用外部 embeddings：接收已初始化的 embedding 模型（可與 DocumentProcessor 共用）
+
+向量資料庫優先使用 FAISS（進程內檢索、可持久化到本地），未安裝 faiss 時回退到 Chroma
 """
 from typing import List, Dict, Optional, Any
 from langchain_community.vectorstores import Chroma
 from langchain_core.documents import Document
+import hashlib
+import json
 import os
 from .base import BaseRetriever
 
@@ -20,6 +24,14 @@ except ImportError:
     except ImportError:
         raise ImportError("需要安裝 langchain-community 或 langchain-huggingface 才能使用 Hugging Face embeddings")
 
+# 嘗試導入 FAISS（優先使用，未安裝時回退到 Chroma）
+try:
+    import faiss  # noqa: F401
+    from langchain_community.vectorstores import FAISS
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
 # 導入 torch 來檢測可用的設備
 try:
     import torch
@@ -47,6 +59,36 @@ def get_device() -> str:
         return 'cpu'
 
 
+def quantize_embeddings_for_cpu(embeddings: Any) -> bool:
+    """
+    對 CPU 上的 HuggingFace embedding 模型進行 int8 動態量化
+    
+    將模型中的 Linear 層就地轉換為 int8，在 CPU 上通常可提升 2-4 倍推論速度並減少記憶體，
+    檢索效果的損失可忽略。僅應在 CPU 設備上使用（MPS/CUDA 不支援動態量化）。
+    
+    Args:
+        embeddings: HuggingFaceEmbeddings 實例
+        
+    Returns:
+        是否成功量化
+    """
+    if not TORCH_AVAILABLE:
+        return False
+    
+    # langchain_community 使用 client，langchain_huggingface 使用 _client
+    model = getattr(embeddings, "client", None) or getattr(embeddings, "_client", None)
+    if model is None:
+        return False
+    
+    try:
+        torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        print("✓ 已對 embedding 模型進行 int8 動態量化（CPU）")
+        return True
+    except Exception as e:
+        print(f"⚠️ embedding 模型量化失敗，使用原始精度: {e}")
+        return False
+
+
 class VectorRetriever(BaseRetriever):
     """使用向量檢索進行語義搜尋"""
     
@@ -57,7 +99,8 @@ class VectorRetriever(BaseRetriever):
         persist_directory: Optional[str] = "./chroma_db",
         hf_cache_dir: Optional[str] = None,
         device: Optional[str] = None,
-        embeddings: Optional[Any] = None  # 可選：外部傳入的 embedding 模型（優先使用）
+        embeddings: Optional[Any] = None,  # 可選：外部傳入的 embedding 模型（優先使用）
+        batch_size: int = 128
     ):
         """
         初始化向量檢索器（使用 Hugging Face embeddings）
@@ -66,7 +109,9 @@ class VectorRetriever(BaseRetriever):
             documents: 文檔列表，每個文檔包含 "content" 和 "metadata"
             embedding_model: Hugging Face embedding 模型名稱（預設: "sentence-transformers/all-MiniLM-L6-v2"）
                             僅在 embeddings=None 時使用
-            persist_directory: Chroma 資料庫持久化目錄
+            persist_directory: 向量資料庫持久化目錄
+                              使用 FAISS 時索引保存在其下的 faiss_index 子目錄，文檔未變更時直接載入
+                              未安裝 FAISS 時作為 Chroma 資料庫目錄
             hf_cache_dir: Hugging Face 模型緩存目錄（例如外接硬碟路徑）
                          如果為 None，則使用環境變數 HF_HOME 或預設位置 ~/.cache/huggingface/
                          僅在 embeddings=None 時使用
@@ -79,7 +124,12 @@ class VectorRetriever(BaseRetriever):
                        - 節省內存（只加載一次模型）
                        - 節省時間（避免重複初始化）
                        - 確保一致性（分塊和檢索使用相同的模型）
+            batch_size: 每批寫入向量資料庫的文檔數量（預設: 128）
+                       文檔以內容和 metadata 的雜湊作為 ID 寫入，重複執行時會覆蓋既有資料而不會產生重複
         """
+        # 記錄 embedding 模型是否經過量化（量化後的向量與原始精度不同，FAISS 索引指紋需要區分）
+        self._embeddings_quantized = False
+        
         # 優先使用傳入的共用模型
         if embeddings is not None:
             self.embeddings = embeddings
@@ -123,6 +173,10 @@ class VectorRetriever(BaseRetriever):
                 model_kwargs=model_kwargs,
                 encode_kwargs={'normalize_embeddings': True}  # 正規化 embeddings 以提升效果
             )
+            
+            # CPU 上 embedding 計算是最大瓶頸，使用 int8 動態量化加速
+            if device == 'cpu':
+                self._embeddings_quantized = quantize_embeddings_for_cpu(self.embeddings)
         
         # 將文檔轉換為 LangChain Document 格式
         # 需要將 metadata 中的列表轉換為字串，因為 ChromaDB 不接受列表類型
@@ -149,16 +203,105 @@ class VectorRetriever(BaseRetriever):
             for doc in documents
         ]
         
-        # 創建向量資料庫
-        self.vectorstore = Chroma.from_documents(
-            documents=langchain_docs,
-            embedding=self.embeddings,
-            persist_directory=persist_directory
-        )
+        # 使用內容和 metadata（來源路徑、分塊位置等）的雜湊作為 ID：重複處理同一文件時不會產生重複資料，
+        # 不同來源中內容相同的分塊仍各自保留，檢索結果的來源資訊不會被另一個文件取代
+        doc_ids = []
+        unique_docs = []
+        seen_ids = set()
+        for doc in langchain_docs:
+            hasher = hashlib.blake2b(doc.page_content.encode("utf-8"), digest_size=8)
+            hasher.update(b"\0")
+            hasher.update(json.dumps(doc.metadata, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"))
+            doc_id = hasher.hexdigest()
+            if doc_id in seen_ids:
+                continue
+            seen_ids.add(doc_id)
+            doc_ids.append(doc_id)
+            unique_docs.append(doc)
+        
+        # 創建向量資料庫，並以固定大小的批次寫入文檔
+        # FAISS 索引必須從至少一個文檔建立；沒有文檔（或去重後為空）時使用空的 Chroma 資料庫
+        if FAISS_AVAILABLE and unique_docs:
+            self.vectorstore = self._build_faiss_index(unique_docs, doc_ids, persist_directory, batch_size)
+        else:
+            self.vectorstore = Chroma(
+                embedding_function=self.embeddings,
+                persist_directory=persist_directory
+            )
+            for start in range(0, len(unique_docs), batch_size):
+                self.vectorstore.add_documents(
+                    documents=unique_docs[start:start + batch_size],
+                    ids=doc_ids[start:start + batch_size]
+                )
         
         # 創建 retriever
         self.retriever = self.vectorstore.as_retriever()
     
+    def _build_faiss_index(
+        self,
+        documents: List[Document],
+        doc_ids: List[str],
+        persist_directory: Optional[str],
+        batch_size: int
+    ):
+        """
+        建立（或從本地載入）FAISS 索引
+        
+        以文檔 ID、embedding 模型名稱和是否量化計算指紋，若持久化目錄中的索引指紋相同，
+        代表文檔和 embeddings 都未變更，直接載入索引而不重新計算 embeddings。
+        
+        Args:
+            documents: LangChain Document 列表
+            doc_ids: 與 documents 對應的文檔 ID 列表
+            persist_directory: 持久化目錄（None 表示不持久化）
+            batch_size: 每批寫入的文檔數量
+            
+        Returns:
+            FAISS 向量資料庫實例
+        """
+        model_name = getattr(self.embeddings, "model_name", type(self.embeddings).__name__)
+        # 量化模型產生的向量與原始精度不同，同一份文檔在量化與未量化之間切換時必須重建索引
+        precision = "int8" if self._embeddings_quantized else "fp32"
+        fingerprint = hashlib.blake2b(
+            "\n".join([model_name, precision] + doc_ids).encode("utf-8"), digest_size=16
+        ).hexdigest()
+        
+        index_dir = os.path.join(persist_directory, "faiss_index") if persist_directory else None
+        fingerprint_file = os.path.join(index_dir, "fingerprint.txt") if index_dir else None
+        
+        if fingerprint_file and os.path.exists(fingerprint_file):
+            with open(fingerprint_file, "r", encoding="utf-8") as f:
+                saved_fingerprint = f.read().strip()
+            if saved_fingerprint == fingerprint:
+                try:
+                    # 索引由本程式自行寫入，載入時允許反序列化 docstore
+                    vectorstore = FAISS.load_local(
+                        index_dir, self.embeddings, allow_dangerous_deserialization=True
+                    )
+                    print(f"✓ 文檔未變更，已從 {index_dir} 載入 FAISS 索引")
+                    return vectorstore
+                except Exception as e:
+                    print(f"⚠️ 載入 FAISS 索引失敗: {e}，將重新建立")
+        
+        vectorstore = None
+        for start in range(0, len(documents), batch_size):
+            batch_docs = documents[start:start + batch_size]
+            batch_ids = doc_ids[start:start + batch_size]
+            if vectorstore is None:
+                vectorstore = FAISS.from_documents(batch_docs, self.embeddings, ids=batch_ids)
+            else:
+                vectorstore.add_documents(batch_docs, ids=batch_ids)
+        
+        if index_dir and vectorstore is not None:
+            try:
+                vectorstore.save_local(index_dir)
+                with open(fingerprint_file, "w", encoding="utf-8") as f:
+                    f.write(fingerprint)
+            except Exception as e:
+                print(f"⚠️ 保存 FAISS 索引失敗: {e}")
+        
+        return vectorstore
+    
     def retrieve(
         self, 
         query: str, 
@@ -184,7 +327,7 @@ class VectorRetriever(BaseRetriever):
         """
         # 構建過濾條件
         # 如果提供了 metadata_filter，先獲取更多結果，然後在 Python 中進行過濾
-        # 這是因為 LangChain ChromaDB 的 similarity_search_with_score 方法
+        # 這是因為 LangChain 向量資料庫（FAISS / Chroma）的 similarity_search_with_score 方法
         # 對 filter 參數的支援可能因版本而異
         if metadata_filter:
             # 獲取更多結果以確保有足夠的候選進行過濾